@@ -0,0 +1,51 @@
+from collections import OrderedDict, namedtuple
+import hashlib
+
+
+# serialized response body and its (strong) entity tag
+CachedResponse = namedtuple("CachedResponse", ["body", "etag"])
+
+
+class ResponseCache(object):
+    """
+    Bounded LRU cache of serialized response bodies.
+
+    Responses only depend on the imported dataset, so entries are keyed on
+    the route and its ids. Data files are only imported at start-up, so
+    entries are never invalidated: a server serves the data it started with.
+
+    Args:
+        max_entries: number of responses kept before the least recently used is evicted
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Return the `CachedResponse` for `key`, or None """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, body):
+        """ Cache a serialized response body, returning its `CachedResponse` """
+        entry = CachedResponse(body, '"{}"'.format(hashlib.sha1(body).hexdigest()))
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,263 @@
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+import json
+import mmap
+import os
+import struct
+
+from api.graph import DEFAULT_MAX_VISITED, FriendGraph
+from api.manifest import VERSION_ENTRY, read_manifest
+from api.search import PeopleIndex
+from api.snapshot import CompanyStatsRecord, Postings, Snapshot
+
+
+# first bytes of a compiled dataset file, and version of its layout
+MAGIC = b"PARANUAR"
+FORMAT_VERSION = 5
+
+# read back as 0x0102 by machines of the byte order the file was written with
+BYTE_ORDER_MARK = 0x0102
+
+# magic, format version, byte order mark, number of sections
+HEADER = struct.Struct("=8sHHI")
+
+# name, array typecode, offset and length in bytes of each section
+SECTION = struct.Struct("=32s4sQQ")
+
+# sections start at multiples of this many bytes, so that arrays are aligned
+SECTION_ALIGNMENT = 8
+
+# `Snapshot` arrays stored as sections, with their typecodes
+ARRAY_SECTIONS = (
+    ("pids", 'q'),
+    ("ages", 'i'),
+    ("age_known", 'B'),
+    ("alive", 'B'),
+    ("eye_color_codes", 'H'),
+    ("company_ids", 'q'),
+    ("friend_offsets", 'q'),
+    ("friend_positions", 'i'),
+    ("fruit_offsets", 'q'),
+    ("fruit_codes", 'H'),
+    ("vegetable_offsets", 'q'),
+    ("vegetable_codes", 'H'),
+)
+
+# `Snapshot` lists of strings stored as string tables
+STRING_SECTIONS = ("names", "addresses", "emails", "phones", "eye_colors", "food_ids")
+
+# `PeopleIndex` postings stored as sections, as "search.{name}.keys" etc.
+SEARCH_SECTIONS = ("age", "eye_color", "alive", "company_id", "food")
+
+# the snapshot with the indexes built from it, as mapped by `load_compiled_dataset`
+CompiledDataset = namedtuple("CompiledDataset", ["snapshot", "graph", "people_index"])
+
+
+class CompiledDatasetError(Exception):
+    pass
+
+
+class StringTable(Sequence):
+    """
+    Read-only sequence of the UTF-8 strings `data[offsets[i]:offsets[i + 1]]`,
+    or None where `nulls[i]` is 1
+    """
+    def __init__(self, offsets, data, nulls=None):
+        self.offsets = offsets
+        self.data = data
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self.offsets) - 1:
+            raise IndexError("string table index out of range")
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    @staticmethod
+    def encode(strings):
+        """ Return the (offsets, data, nulls) arrays of a string table holding `strings` (None allowed) """
+        offsets = array('q', [0])
+        data = bytearray()
+        nulls = bytearray()
+        for s in strings:
+            # a null is stored as an empty string, told apart by its mask byte
+            if s is not None:
+                data += s.encode("utf-8")
+            offsets.append(len(data))
+            nulls.append(1 if s is None else 0)
+        return offsets, data, nulls
+
+
+def data_digests(db):
+    """ Map of data file name to content hash, of the data imported into `db` """
+    return { name: f.digest for name, f in read_manifest(db).items() if name != VERSION_ENTRY }
+
+
+def postings_sections(name, postings):
+    """ (name, typecode, values) of the sections holding a `Postings` (or a map of key to values) """
+    if isinstance(postings, Postings):
+        keys, offsets, values = postings.keys_, postings.offsets, postings.values_
+    else:
+        keys, offsets, values = Postings.encode(postings)
+    return [ (name + ".keys", 'q', keys), (name + ".offsets", 'q', offsets), (name + ".positions", 'i', values) ]
+
+
+def mapped_postings(sections, name):
+    """ The `Postings` stored as sections by `postings_sections` """
+    return Postings(sections[name + ".keys"], sections[name + ".offsets"], sections[name + ".positions"])
+
+
+def write_compiled_snapshot(snapshot, path, digests=None):
+    """
+    Write a `Snapshot`, and the `FriendGraph` and `PeopleIndex` built from
+    it, to a compiled dataset file that `load_compiled_dataset` maps.
+
+    The file is a header, a table of sections and the sections themselves:
+    each per-person attribute and CSR array of the snapshot as a
+    fixed-width array, each list of strings as a string table (offsets
+    into UTF-8 data, and a mask of the null strings), the employees of each company, their degree ranking
+    and each search index as postings, and the (few) company statistics
+    as JSON. Arrays are written in this machine's byte order.
+
+    The file is replaced atomically, so processes still mapping a previous
+    version keep reading it.
+
+    Args:
+        snapshot: `Snapshot` to write
+        path: compiled dataset file
+        digests: data file hashes the snapshot was built from (see `data_digests`),
+            to tell whether the file is current
+    """
+    sections = [ (name, typecode, getattr(snapshot, name)) for name, typecode in ARRAY_SECTIONS ]
+    for name in STRING_SECTIONS:
+        offsets, data, nulls = StringTable.encode(getattr(snapshot, name))
+        sections += [ (name + ".offsets", 'q', offsets), (name + ".data", 'B', data), (name + ".nulls", 'B', nulls) ]
+    sections += postings_sections("employees", snapshot.employee_positions_by_company_id)
+    sections += postings_sections("top_connected", FriendGraph.from_snapshot(snapshot).ranked_positions_by_company_id)
+    people_index = PeopleIndex.from_snapshot(snapshot)
+    for name in SEARCH_SECTIONS:
+        sections += postings_sections("search." + name, people_index.postings[name])
+    company_stats = [ stats._asdict() for _, stats in sorted(snapshot.company_stats.items()) ]
+    sections.append(("company_stats", 'B', json.dumps(company_stats).encode("utf-8")))
+    metadata = {"dataset_version": snapshot.dataset_version, "digests": digests or {}}
+    sections.append(("metadata", 'B', json.dumps(metadata, sort_keys=True).encode("utf-8")))
+
+    # section contents, converted to bytes in each section's array type
+    contents = [ (name, typecode, array(typecode, values).tobytes()) for name, typecode, values in sections ]
+
+    offset = HEADER.size + SECTION.size * len(contents)
+    table = []
+    for name, typecode, content in contents:
+        offset += -offset % SECTION_ALIGNMENT
+        table.append(SECTION.pack(name.encode("ascii"), typecode.encode("ascii"), offset, len(content)))
+        offset += len(content)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER_MARK, len(contents)))
+        f.write(b"".join(table))
+        for _, _, content in contents:
+            f.write(b"\0" * (-f.tell() % SECTION_ALIGNMENT))
+            f.write(content)
+    os.replace(temp_path, path)
+
+
+def read_sections(path):
+    """
+    Map a compiled dataset file into memory.
+
+    Returns:
+        map of section name to a read-only `memoryview` of its array, backed by the mapping
+    """
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapping)
+
+    if len(view) < HEADER.size:
+        raise CompiledDatasetError("'{}' is not a compiled dataset".format(path))
+    magic, format_version, byte_order_mark, num_sections = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise CompiledDatasetError("'{}' is not a compiled dataset".format(path))
+    if format_version != FORMAT_VERSION:
+        raise CompiledDatasetError("'{}' has format version {}, expected {}".format(path, format_version, FORMAT_VERSION))
+    if byte_order_mark != BYTE_ORDER_MARK:
+        raise CompiledDatasetError("'{}' was compiled on a machine of different byte order".format(path))
+
+    sections = {}
+    for s in range(num_sections):
+        name, typecode, offset, length = SECTION.unpack_from(view, HEADER.size + s * SECTION.size)
+        if offset + length > len(view):
+            raise CompiledDatasetError("'{}' is truncated".format(path))
+        sections[name.rstrip(b"\0").decode("ascii")] = view[offset:offset + length].cast(typecode.rstrip(b"\0").decode("ascii"))
+    return sections
+
+
+def read_compiled_metadata(path):
+    """ Return the metadata of a compiled dataset file: its "dataset_version" and data file "digests" """
+    return json.loads(bytes(read_sections(path)["metadata"]).decode("utf-8"))
+
+
+def snapshot_from_sections(sections):
+    """ The `Snapshot` of the sections of a compiled dataset file, as views of them """
+    strings = { name: StringTable(sections[name + ".offsets"], sections[name + ".data"], sections[name + ".nulls"])
+                for name in STRING_SECTIONS }
+    metadata = json.loads(bytes(sections["metadata"]).decode("utf-8"))
+    company_stats = [ CompanyStatsRecord(**stats) for stats in json.loads(bytes(sections["company_stats"]).decode("utf-8")) ]
+
+    return Snapshot(sections["pids"], strings["names"], sections["ages"], strings["addresses"], strings["emails"],
+                    strings["phones"], sections["alive"], strings["eye_colors"], sections["eye_color_codes"],
+                    sections["company_ids"], sections["friend_offsets"], sections["friend_positions"],
+                    sections["fruit_offsets"], sections["fruit_codes"], sections["vegetable_offsets"],
+                    sections["vegetable_codes"], strings["food_ids"],
+                    mapped_postings(sections, "employees"),
+                    metadata["dataset_version"], { stats.company_id: stats for stats in company_stats },
+                    sections["age_known"])
+
+
+def load_compiled_dataset(path, max_visited=DEFAULT_MAX_VISITED):
+    """
+    Return the `CompiledDataset` (`Snapshot`, `FriendGraph` and
+    `PeopleIndex`) backed by a memory-mapped compiled dataset file.
+
+    Nothing is copied or parsed: arrays and postings are views of the
+    mapping, and strings are decoded when read. Loading takes the same
+    time whatever the size of the dataset, and processes mapping the same
+    file share one copy of it in the page cache.
+    """
+    sections = read_sections(path)
+    snapshot = snapshot_from_sections(sections)
+    graph = FriendGraph(snapshot.pids, snapshot.friend_offsets, snapshot.friend_positions,
+                        mapped_postings(sections, "top_connected"), max_visited)
+    people_index = PeopleIndex(snapshot.pids, snapshot.ages, snapshot.age_known, snapshot.alive, snapshot.eye_colors,
+                               snapshot.eye_color_codes, snapshot.company_ids, snapshot.food_ids,
+                               { name: mapped_postings(sections, "search." + name) for name in SEARCH_SECTIONS })
+    return CompiledDataset(snapshot, graph, people_index)
+
+
+def load_compiled_snapshot(path):
+    """ Return a `Snapshot` backed by a memory-mapped compiled dataset file (see `load_compiled_dataset`) """
+    return snapshot_from_sections(read_sections(path))
+
+
+def compile_dataset(db, path):
+    """
+    Compile the data imported into `db` to `path`, unless the file was
+    already compiled from the same data files (as recorded by `sync_local_data`)
+
+    Returns:
+        True if the file was (re)written
+    """
+    digests = data_digests(db)
+    if digests and os.path.exists(path):
+        try:
+            if read_compiled_metadata(path)["digests"] == digests:
+                return False
+        except (CompiledDatasetError, KeyError, ValueError):
+            pass
+    write_compiled_snapshot(Snapshot.from_database(db), path, digests)
+    return True
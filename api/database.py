@@ -1,35 +1,179 @@
+from collections import namedtuple
 from contextlib import contextmanager
 import os
+import sqlite3
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker, joinedload
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import NullPool, QueuePool
+
+from api.instrumentation import CountingConnection, instrument_engine
 
 
 Base = declarative_base()
 
 
+# SQLite settings applied to each new connection (None keeps SQLite's default)
+EngineProfile = namedtuple("EngineProfile", ["journal_mode", "synchronous", "mmap_size", "cache_size"])
+
+ENGINE_PROFILES = {
+    # SQLite's defaults: rollback journal, fsync on every commit, ~2MB page cache
+    "default": EngineProfile(None, None, None, None),
+    # write-ahead log, so readers don't block on (or block) the writer, and
+    # fsync at checkpoints only
+    "wal": EngineProfile("WAL", "NORMAL", None, None),
+    # as "wal", with the file memory-mapped (256MB) and a 64MB page cache per connection
+    "tuned": EngineProfile("WAL", "NORMAL", 256 << 20, -64 << 10)
+}
+
+# files SQLite keeps next to the database in WAL mode
+WAL_FILE_SUFFIXES = ("-wal", "-shm")
+
+# how the bulk importer writes rows: batched `executemany` INSERTs, or
+# PostgreSQL's `COPY ... FROM STDIN` (requires psycopg2)
+IMPORT_STRATEGIES = ("executemany", "copy")
+
+
 class Database(object):
     """
-    Simple handle to a SQLite back-end.
+    Simple handle to a SQLite (or other SQLAlchemy supported) back-end.
     Initalises DB schema for SQLAlchemy.
 
+    Backends are chosen by URL:
+
+    - `sqlite:///{file}`: SQLite database file (the default, from `file_name`)
+    - `sqlite://`: SQLite in-memory database with a shared cache, so that all
+      connections of this `Database` see the same data
+    - e.g. `postgresql://user@host/db`: a database server
+
     Args:
-        file_name: local filename of SQLite DB
+        file_name: local filename of SQLite DB, if no `url` is given
+        reset: remove an existing database (file) rather than reusing it
+        profile: name of the `ENGINE_PROFILES` entry applied to each SQLite connection
+        pool_size: number of connections kept open for reuse (e.g. one per serving
+            thread), None to open a new connection per session (SQLite) or use the
+            driver's default pool (servers)
+        url: SQLAlchemy database URL, overrides `file_name`
+        import_strategy: one of `IMPORT_STRATEGIES` used by the bulk importer,
+            None for "copy" on PostgreSQL and "executemany" otherwise
+        instrument: count the statements and rows of threads collecting
+            `QueryStats` (see `api.instrumentation`), for query debugging or
+            request metrics. Off by default, as it adds to every query
     """
-    def __init__(self, file_name):
-        if os.path.exists(file_name):
-            print("database file '{}' already exists. Removing...".format(file_name))
-            os.remove(file_name)
+    def __init__(self, file_name=None, reset=True, profile="default", pool_size=None, url=None, import_strategy=None,
+                 instrument=False):
+        self.url = make_url(url or 'sqlite:///{}'.format(file_name))
+        self.is_sqlite = self.url.get_backend_name() == "sqlite"
+        self.file_name = self.url.database if self.is_sqlite and self.url.database not in (None, "", ":memory:") else None
+
+        if import_strategy is None:
+            import_strategy = "copy" if self.url.get_backend_name() == "postgresql" else "executemany"
+        if import_strategy not in IMPORT_STRATEGIES:
+            raise ValueError("unknown import strategy '{}'".format(import_strategy))
+        if import_strategy == "copy" and self.url.get_backend_name() != "postgresql":
+            raise ValueError("the copy import strategy requires PostgreSQL")
+        self.import_strategy = import_strategy
+
+        if reset and self.file_name and os.path.exists(self.file_name):
+            print("database file '{}' already exists. Removing...".format(self.file_name))
+            os.remove(self.file_name)
+            # a stale write-ahead log would be replayed into the new database
+            for suffix in WAL_FILE_SUFFIXES:
+                if os.path.exists(self.file_name + suffix):
+                    os.remove(self.file_name + suffix)
+
+        # a shared-cache in-memory database lives as long as one connection to it is open
+        self.memory_uri = None
+        self.memory_keepalive = None
+        if self.is_sqlite and not self.file_name:
+            self.memory_uri = "file:paranuara-{}?mode=memory&cache=shared".format(id(self))
+            self.memory_keepalive = sqlite3.connect(self.memory_uri, uri=True)
 
-        self.engine = create_engine('sqlite:///{}'.format(file_name), convert_unicode=True)
+        self.profile = ENGINE_PROFILES[profile]
+        self.pool_size = pool_size
+        self.instrument = instrument
+        self.read_only = False
+        self.engine = self._create_engine()
         self.session_factory = scoped_session(sessionmaker(autocommit=False,
                                                            autoflush=False,
                                                            bind=self.engine))
 
+        if reset and not self.is_sqlite:
+            Base.metadata.drop_all(bind=self.engine)
         Base.metadata.create_all(bind=self.engine)
         Base.query = self.session_factory.query_property()
 
+    @property
+    def description(self):
+        """ Database URL without its password, for display """
+        return repr(self.url)
+
+    def _create_engine(self):
+        if not self.is_sqlite:
+            pool_args = {"pool_size": self.pool_size} if self.pool_size else {}
+            engine = create_engine(self.url, **pool_args)
+            event.listen(engine, "connect", self._configure_connection)
+            return instrument_engine(engine) if self.instrument else engine
+
+        # instrumented connections count fetched rows, see `api.instrumentation`
+        connect_args = {"factory": CountingConnection} if self.instrument else {}
+        if self.pool_size:
+            # pooled connections are handed to whichever thread runs the next session
+            connect_args["check_same_thread"] = False
+            pool_args = {"poolclass": QueuePool, "pool_size": self.pool_size}
+        else:
+            pool_args = {"poolclass": NullPool}
+
+        if self.memory_uri:
+            # SQLAlchemy can't pass URI parameters to pysqlite, so we open the connections ourselves
+            engine = create_engine('sqlite://', convert_unicode=True,
+                                   creator=lambda: sqlite3.connect(self.memory_uri, uri=True, **connect_args), **pool_args)
+        else:
+            engine = create_engine(self.url, convert_unicode=True, connect_args=connect_args, **pool_args)
+        event.listen(engine, "connect", self._configure_connection)
+        return instrument_engine(engine) if self.instrument else engine
+
+    def _configure_connection(self, dbapi_connection, connection_record):
+        """ Apply the engine profile (SQLite) and read-only mode to a new connection """
+        if not self.is_sqlite:
+            if self.read_only:
+                cursor = dbapi_connection.cursor()
+                cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+                cursor.close()
+                # or the setting would be rolled back with the implicit transaction
+                dbapi_connection.commit()
+            return
+
+        pragmas = [ (name, value) for name, value in self.profile._asdict().items() if value is not None ]
+        if self.read_only:
+            pragmas.append(("query_only", "ON"))
+
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute("PRAGMA {}={}".format(name, value))
+        cursor.close()
+
+    def reopen(self, read_only=False):
+        """
+        Replace the engine (and its connections) with a new one.
+
+        Call this in each worker process after forking so that processes don't
+        share connections, optionally making the connections read-only
+        (`PRAGMA query_only`) for the serving phase.
+        """
+        self.engine.dispose()
+        self.read_only = read_only
+        self.engine = self._create_engine()
+        self.session_factory.remove()
+        self.session_factory.configure(bind=self.engine)
+
+    def reset(self):
+        """ Drop and re-create all tables """
+        Base.metadata.drop_all(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+
 
 @contextmanager
 def write_scope(db):
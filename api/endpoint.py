@@ -1,10 +1,54 @@
-import tornado.escape
+import tornado.httpserver
 import tornado.ioloop
+import tornado.iostream
+import tornado.locks
+import tornado.netutil
+import tornado.process
+import tornado.util
 import tornado.web
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import hmac
 import signal
+import time
+import urllib.parse
 
-from api.service import UnknownInstanceError
+from api.cache import ResponseCache
+from api.graph import MAX_MUTUAL_HOPS, MAX_PATH_HOPS
+from api.instrumentation import QueryStats, run_with_query_stats
+from api.metrics import PROMETHEUS_CONTENT_TYPE, route_label
+from api.profiling import PROFILE_MODES, Profiler, ProfilerBusyError, RequestProfiling
+from api.search import PeopleQuery
+from api.serializers import (dumps, serialize_company_stats, serialize_comparison, serialize_employee, serialize_person,
+                             serialize_search_result)
+from api.service import UnknownInstanceError, DEFAULT_PAGE_SIZE
+
+
+# default number of threads running service calls
+DEFAULT_MAX_WORKERS = 4
+
+# default number of serialized responses kept by the response cache
+DEFAULT_CACHE_SIZE = 10000
+
+# largest page of employees or search results a client may ask for
+MAX_PAGE_SIZE = 1000
+
+# employees fetched per query when streaming
+STREAM_BATCH_SIZE = 500
+
+# most people or pairs of people a client may ask for in one batch request
+MAX_BATCH_SIZE = 100
+
+# most people listed by a graph query, and the default number
+MAX_GRAPH_RESULTS = 1000
+DEFAULT_GRAPH_RESULTS = 10
+
+# limits of a profile capture, and its duration when not limited to a number of requests
+MAX_PROFILE_REQUESTS = 100000
+MAX_PROFILE_SECONDS = 300
+DEFAULT_PROFILE_SECONDS = 10
 
 
 class BaseHandler(tornado.web.RequestHandler):
@@ -12,7 +56,8 @@ class BaseHandler(tornado.web.RequestHandler):
     Base request handler provides default response headers
     and fallback responses
     """
-    def initialize(self, service):
+    def initialize(self, service, executor, cache=None, debug_queries=False, graph=None, people_index=None, metrics=None,
+                   route=None, profiling=None, admin_token=None):
         """
         This is how we pass models and business logic into
         all handlers.
@@ -22,6 +67,125 @@ class BaseHandler(tornado.web.RequestHandler):
         inner layers.
         """
         self.service = service
+        self.executor = executor
+        self.cache = cache
+        self.graph = graph
+        self.people_index = people_index
+        self.debug_queries = debug_queries
+        self.query_stats = QueryStats() if debug_queries or metrics is not None else None
+
+        # a handler is created per request, once it has been routed
+        self.metrics = metrics
+        self.route = route
+        self.start_time = time.perf_counter()
+        self.response_bytes = 0
+
+        # service calls are profiled while a capture of this route is in progress
+        self.profiling = profiling
+        self.profiler = profiling.profiler_for(route) if profiling is not None else None
+        self.admin_token = admin_token
+
+    def flush(self, include_footers=False):
+        """ Count the bytes of the response body written so far (`finish` flushes too) """
+        if self.metrics is not None:
+            self.response_bytes += sum(len(chunk) for chunk in self._write_buffer)
+        return super().flush(include_footers)
+
+    def on_finish(self):
+        """ Record the finished request's metrics, and count it in the profile capture """
+        if self.metrics is not None:
+            self.metrics.observe(self.route, self.get_status(), time.perf_counter() - self.start_time,
+                                 self.response_bytes, self.query_stats)
+        if self.profiler is not None:
+            self.profiler.request_finished()
+
+    async def run_service(self, method, *args):
+        """
+        Run a (blocking) service method on the executor so that the
+        IOLoop can keep serving other connections in the meantime.
+        Returns the method's result.
+
+        When debugging queries or recording metrics, the SQL run by all of a
+        request's service calls is summed up (and reported in the
+        `X-Query-Stats` response header when debugging).
+        """
+        loop = tornado.ioloop.IOLoop.current()
+        if self.profiler is not None:
+            method, args = self.profiler.run, (method,) + args
+        if self.query_stats is None:
+            return await loop.run_in_executor(self.executor, method, *args)
+
+        result, stats = await loop.run_in_executor(self.executor, run_with_query_stats, method, *args)
+        self.query_stats.add(stats)
+        if self.debug_queries:
+            self.set_header("X-Query-Stats", self.query_stats.header_value())
+        return result
+
+    def get_cached_response(self, key):
+        """
+        Return the cached response for `key` (see `ResponseCache`), or None
+        if it isn't cached or caching is disabled.
+        """
+        if self.cache is None:
+            return None
+        entry = self.cache.get(key)
+        self.set_header("X-Cache", "HIT" if entry else "MISS")
+        return entry
+
+    def write_cached_response(self, entry):
+        """
+        Respond with a cached JSON body and its ETag, or with
+        304 Not Modified if the client's `If-None-Match` matches
+        """
+        self.set_header("Etag", entry.etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(entry.body)
+
+    def write_response(self, response, cache_key=None):
+        """ Write a JSON response, caching the serialized body under `cache_key` """
+        body = dumps(response)
+        if self.cache is None or cache_key is None:
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+            self.write(body)
+            return
+        self.write_cached_response(self.cache.put(cache_key, body))
+
+    def get_int_argument(self, name):
+        """ Return an integer query argument, None if absent. Responds 400 if it isn't an integer """
+        value = self.get_argument(name, None)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+
+    def get_bounded_int_argument(self, name, default, maximum):
+        """ Return an integer query argument in [1, maximum], or `default` if absent. Responds 400 otherwise """
+        value = self.get_int_argument(name)
+        if value is None:
+            return default
+        if not 0 < value <= maximum:
+            raise tornado.web.HTTPError(400)
+        return value
+
+    def get_batch_argument(self, name, parse_item):
+        """
+        Return the items of a comma separated query argument, parsed with
+        `parse_item`. Responds 400 if the argument is missing, an item doesn't
+        parse or there are more than `MAX_BATCH_SIZE` items.
+        """
+        value = self.get_argument(name, "")
+        items = [ item for item in value.split(",") if item ]
+        if not items or len(items) > MAX_BATCH_SIZE:
+            raise tornado.web.HTTPError(400)
+        try:
+            return [ parse_item(item) for item in items ]
+        except ValueError:
+            raise tornado.web.HTTPError(400)
 
     def set_default_headers(self, *args, **kwargs):
         """ Default CORS headers """
@@ -33,110 +197,478 @@ class BaseHandler(tornado.web.RequestHandler):
         """ Override fall-back responder """
         if status_code == 400:
             self.finish({'message': 'bad parameter'})
+        elif status_code == 403:
+            self.finish({'message': 'forbidden'})
         elif status_code == 404:
             self.finish({'message': 'resource not found'})
+        elif status_code == 409:
+            self.finish({'message': 'conflict'})
         elif status_code == 500:
             self.finish({'message': 'an unexpected error has occurred'})
 
 
+def parse_id_pair(value):
+    """ Parse "{person_id}:{other_id}", raising ValueError if malformed """
+    this_id, other_id = value.split(":")
+    return int(this_id), int(other_id)
+
+
 class CompanyEmployeeHandler(BaseHandler):
     """
-    Handle GET /company/{id}/employee
+    Handle GET /company/{id}/employee[?after_pid={pid}&limit={n}][&format=ndjson]
+
+    Without `after_pid` or `limit` all employees are returned in one response.
+    Otherwise employees are paginated by id, and the response links to the
+    next page. With `format=ndjson`, employees are streamed one JSON object
+    per line, in batches, for as long as the company has employees (or up
+    to `limit` of them).
     """
-    def get(self, id):
+    async def get(self, id):
+        after_pid = self.get_int_argument("after_pid")
+        limit = self.get_int_argument("limit")
+        stream = self.get_argument("format", None) == "ndjson"
+
+        if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+            raise tornado.web.HTTPError(400)
+
+        if stream:
+            return await self.stream_employees(int(id), after_pid, limit)
+        if after_pid is not None or limit is not None:
+            return await self.get_employees_page(int(id), after_pid, limit or DEFAULT_PAGE_SIZE)
+
+        cache_key = ("company_employees", int(id))
+        cached = self.get_cached_response(cache_key)
+        if cached:
+            return self.write_cached_response(cached)
+
         try:
-            employees = self.service.get_employees_by_company_id(int(id))
+            employees = await self.run_service(self.service.get_employees_by_company_id, int(id))
         except UnknownInstanceError:
             # exchange exception and catch in `BaseHandler`
             raise tornado.web.HTTPError(404)
 
         # respond with 200 OK and JSON list of `person`s
-        payload = []
-        for p in employees:
-            payload.append({"pid": p.pid, "email": p.email})
-        self.write({"employees": payload})
+        self.write_response({"employees": [ serialize_employee(p) for p in employees ]}, cache_key)
+
+    async def get_employees_page(self, cid, after_pid, limit):
+        cache_key = ("company_employees", cid, after_pid, limit)
+        cached = self.get_cached_response(cache_key)
+        if cached:
+            return self.write_cached_response(cached)
+
+        try:
+            employees, next_after_pid = await self.run_service(self.service.get_employees_page, cid, after_pid, limit)
+        except UnknownInstanceError:
+            # exchange exception and catch in `BaseHandler`
+            raise tornado.web.HTTPError(404)
+
+        response = {
+            "employees": [ serialize_employee(p) for p in employees ],
+            "next": None
+        }
+        if next_after_pid is not None:
+            response["next"] = "{}?after_pid={}&limit={}".format(self.request.path, next_after_pid, limit)
+        self.write_response(response, cache_key)
+
+    async def stream_employees(self, cid, after_pid, limit=None):
+        remaining = limit
+        try:
+            employees, after_pid = await self.run_service(self.service.get_employees_page, cid, after_pid,
+                                                          min(STREAM_BATCH_SIZE, remaining or STREAM_BATCH_SIZE))
+        except UnknownInstanceError:
+            # exchange exception and catch in `BaseHandler`
+            raise tornado.web.HTTPError(404)
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        while True:
+            self.write(b"".join(dumps(serialize_employee(p)) + b"\n" for p in employees))
+            # sent with chunked transfer-encoding, so only one batch is buffered at a time
+            try:
+                await self.flush()
+            except tornado.iostream.StreamClosedError:
+                # the client went away, stop fetching pages nobody will read
+                return
+
+            if remaining is not None:
+                remaining -= len(employees)
+            if after_pid is None or remaining == 0:
+                break
+            employees, after_pid = await self.run_service(self.service.get_employees_page, cid, after_pid,
+                                                          min(STREAM_BATCH_SIZE, remaining or STREAM_BATCH_SIZE))
+
+
+class CompanyStatsHandler(BaseHandler):
+    """
+    Handle GET /company/{id}/stats
+
+    Statistics of a company's employees (headcount, number alive, ages and
+    favourite foods), materialized at import.
+    """
+    async def get(self, id):
+        cache_key = ("company_stats", int(id))
+        cached = self.get_cached_response(cache_key)
+        if cached:
+            return self.write_cached_response(cached)
+
+        try:
+            stats = await self.run_service(self.service.get_company_stats, int(id))
+        except UnknownInstanceError:
+            # exchange exception and catch in `BaseHandler`
+            raise tornado.web.HTTPError(404)
+
+        self.write_response(serialize_company_stats(stats), cache_key)
+
+
+class AllCompanyStatsHandler(BaseHandler):
+    """
+    Handle GET /company/stats: the statistics of every company, ordered by id
+    """
+    async def get(self):
+        cache_key = ("company_stats",)
+        cached = self.get_cached_response(cache_key)
+        if cached:
+            return self.write_cached_response(cached)
+
+        stats = await self.run_service(self.service.get_all_company_stats)
+        self.write_response({"companies": [ serialize_company_stats(s) for s in stats ]}, cache_key)
 
 
 class PersonCompareHandler(BaseHandler):
     """
     Handle GET /person/{person_id}/compare?other_id={other_id}
     """
-    def get(self, person_id):
+    async def get(self, person_id):
         other_id = self.get_argument("other_id", None)
         if not other_id:
             # exchange exception and catch in `BaseHandler`
             raise tornado.web.HTTPError(400)
 
         try:
-            this_person, other_person, common_friend_ids = self.service.get_person_comparison(int(person_id), int(other_id))
+            this_person, other_person, common_friend_ids = await self.run_service(
+                self.service.get_person_comparison, int(person_id), int(other_id))
         except UnknownInstanceError:
             # exchange exception and catch in `BaseHandler`
             raise tornado.web.HTTPError(404)
 
-        # TODO: choose a more elegant and concise serialization solution 
-        # rather than packing this by hand
-        response = {
-            "this": {
-                "id": this_person.pid,
-                "name": this_person.name,
-                "age": this_person.age,
-                "address": this_person.address,
-                "phone": this_person.phone
-            },
-            "other": {
-                "id": other_person.pid,
-                "name": other_person.name,
-                "age": other_person.age,
-                "address": other_person.address,
-                "phone": other_person.phone
-            },
-            "common_friend_ids": list(common_friend_ids)
-        }
-        self.write(response)
+        self.write_response(serialize_comparison(this_person, other_person, common_friend_ids))
+
+
+class BatchPersonCompareHandler(BaseHandler):
+    """
+    Handle GET /person/compare?pairs={person_id}:{other_id},...
+
+    Comparisons are listed in the order of `pairs`. A pair with an unknown
+    person is reported with a message instead of failing the whole batch.
+    """
+    async def get(self):
+        id_pairs = self.get_batch_argument("pairs", parse_id_pair)
+        comparisons = await self.run_service(self.service.get_person_comparisons, id_pairs)
+
+        payload = []
+        for (this_id, other_id), (this_person, other_person, common_friend_ids) in zip(id_pairs, comparisons):
+            if this_person is None or other_person is None:
+                payload.append({"this_id": this_id, "other_id": other_id, "message": "resource not found"})
+            else:
+                payload.append(serialize_comparison(this_person, other_person, common_friend_ids))
+        self.write_response({"comparisons": payload})
 
 
 class PersonHandler(BaseHandler):
     """
     Handle GET /person/{person_id}
     """
-    def get(self, id):
-        person = self.service.get_person_by_id(int(id))
+    async def get(self, id):
+        cache_key = ("person", int(id))
+        cached = self.get_cached_response(cache_key)
+        if cached:
+            return self.write_cached_response(cached)
+
+        person = await self.run_service(self.service.get_person_by_id, int(id))
         if not person:
             # exchange exception and catch in `BaseHandler`
             raise tornado.web.HTTPError(404)
 
-        # TODO: choose a more elegant and concise serialization solution 
-        # rather than packing this by hand
+        self.write_response(serialize_person(person), cache_key)
+
+
+class BatchPersonHandler(BaseHandler):
+    """
+    Handle GET /person?ids={person_id},...
+
+    People are listed in the order of `ids` (without repeats), and ids
+    of unknown people are listed under "missing".
+    """
+    async def get(self):
+        person_ids = list(OrderedDict.fromkeys(self.get_batch_argument("ids", int)))
+        people = await self.run_service(self.service.get_people_by_ids, person_ids)
+
+        payload = []
+        for pid in person_ids:
+            if pid in people:
+                response = serialize_person(people[pid])
+                response["id"] = pid
+                payload.append(response)
+        self.write_response({"people": payload, "missing": [ pid for pid in person_ids if pid not in people ]})
+
+
+class PersonSearchHandler(BaseHandler):
+    """
+    Handle GET /person/search[?age_min={n}][&age_max={n}][&eye_color={colour}][&alive={true|false}]
+                             [&company_id={id}][&food={food},...][&after_id={id}][&limit={n}]
+
+    Lists the people matching every given filter, ordered by id, a page of
+    `limit` (default 100) at a time; the response links to the next page.
+    `food` matches people who like all of the foods listed.
+    """
+    async def get(self):
+        alive = self.get_argument("alive", None)
+        if alive not in (None, "true", "false"):
+            raise tornado.web.HTTPError(400)
+        query = PeopleQuery(age_min=self.get_int_argument("age_min"), age_max=self.get_int_argument("age_max"),
+                            eye_color=self.get_argument("eye_color", None), alive=None if alive is None else alive == "true",
+                            company_id=self.get_int_argument("company_id"),
+                            foods=tuple(sorted(set(self.get_batch_argument("food", str)))) if self.get_argument("food", None) else ())
+        after_id = self.get_int_argument("after_id")
+        limit = self.get_bounded_int_argument("limit", DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+        cache_key = ("person_search", query, after_id, limit)
+        cached = self.get_cached_response(cache_key)
+        if cached:
+            return self.write_cached_response(cached)
+
+        person_ids, next_after_id = await self.run_service(self.people_index.search, query, after_id, limit)
+        people = await self.run_service(self.service.get_people_by_ids, person_ids)
+
         response = {
-            "username": person.email,
-            "age": person.age,
-            "fruits": [f.id for f in person.favourite_foods if f.category == "fruit"],
-            "vegetables": [f.id for f in person.favourite_foods if f.category == "vegetable"]
+            "people": [ serialize_search_result(people[pid]) for pid in person_ids ],
+            "next": None
         }
-        self.write(response)
+        if next_after_id is not None:
+            arguments = [ (name, value.decode()) for name, values in sorted(self.request.query_arguments.items())
+                          if name not in ("after_id", "limit") for value in values ]
+            response["next"] = "{}?{}".format(self.request.path,
+                                              urllib.parse.urlencode(arguments + [("after_id", next_after_id), ("limit", limit)]))
+        self.write_response(response, cache_key)
+
+
+class PersonMutualFriendsHandler(BaseHandler):
+    """
+    Handle GET /person/{person_id}/mutual?other_id={other_id}[&hops={n}][&limit={n}]
+
+    Lists the people within `hops` friendships (default 2) of both people,
+    closest first. "complete" is false if the search was cut short.
+    """
+    async def get(self, person_id):
+        other_id = self.get_int_argument("other_id")
+        if other_id is None:
+            raise tornado.web.HTTPError(400)
+        hops = self.get_bounded_int_argument("hops", 2, MAX_MUTUAL_HOPS)
+        limit = self.get_bounded_int_argument("limit", DEFAULT_GRAPH_RESULTS, MAX_GRAPH_RESULTS)
+
+        try:
+            mutual, complete = await self.run_service(self.graph.mutual_friends, int(person_id), other_id, hops)
+        except UnknownInstanceError:
+            # exchange exception and catch in `BaseHandler`
+            raise tornado.web.HTTPError(404)
+
+        self.write_response({
+            "mutual": [ {"id": pid, "this_hops": this_hops, "other_hops": other_hops} for pid, this_hops, other_hops in mutual[:limit] ],
+            "count": len(mutual),
+            "complete": complete
+        })
+
+
+class PersonPathHandler(BaseHandler):
+    """
+    Handle GET /person/{person_id}/path?other_id={other_id}[&max_hops={n}]
+
+    Returns a shortest chain of friendships between two people as a list of
+    person ids, or null if there is none of at most `max_hops` friendships.
+    """
+    async def get(self, person_id):
+        other_id = self.get_int_argument("other_id")
+        if other_id is None:
+            raise tornado.web.HTTPError(400)
+        max_hops = self.get_bounded_int_argument("max_hops", MAX_PATH_HOPS, MAX_PATH_HOPS)
+
+        try:
+            path, complete = await self.run_service(self.graph.shortest_path, int(person_id), other_id, max_hops)
+        except UnknownInstanceError:
+            # exchange exception and catch in `BaseHandler`
+            raise tornado.web.HTTPError(404)
+
+        self.write_response({"path": path, "hops": len(path) - 1 if path else None, "complete": complete})
+
+
+class CompanyTopConnectedHandler(BaseHandler):
+    """
+    Handle GET /company/{id}/top-connected[?k={n}]
+
+    Lists the `k` employees (default 10) with the most friends.
+    """
+    async def get(self, id):
+        k = self.get_bounded_int_argument("k", DEFAULT_GRAPH_RESULTS, MAX_GRAPH_RESULTS)
+
+        try:
+            ranked = await self.run_service(self.graph.top_connected, int(id), k)
+        except UnknownInstanceError:
+            # exchange exception and catch in `BaseHandler`
+            raise tornado.web.HTTPError(404)
+
+        self.write_response({"people": [ {"id": pid, "friends": degree} for pid, degree in ranked ]})
+
+
+class MetricsHandler(BaseHandler):
+    """
+    Handle GET /metrics: request metrics in the Prometheus text format
+    """
+    def get(self):
+        self.set_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.write(self.metrics.render())
+
+
+class ProfileHandler(BaseHandler):
+    """
+    Handle POST /admin/profile?route={route}[&requests={n}][&seconds={t}][&mode={mode}]
+
+    Profiles the service calls of the next `requests` requests to `route`
+    (a route pattern such as "/person/{id}/compare"), or of the requests
+    within `seconds` (default 10 without `requests`), whichever ends first,
+    then responds with the results: `pstats` output of the slowest calls
+    for mode "cprofile" (default), or collapsed stacks for flame graphs
+    for mode "sample". Only one profile is captured at a time.
+
+    Requires the admin token in an `Authorization: Bearer {token}` header.
+    """
+    async def post(self):
+        authorization = self.request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), "Bearer {}".format(self.admin_token).encode()):
+            raise tornado.web.HTTPError(403)
+
+        route = self.get_argument("route", None)
+        mode = self.get_argument("mode", "cprofile")
+        if route not in self.profiling.routes or mode not in PROFILE_MODES:
+            raise tornado.web.HTTPError(400)
+        max_requests = self.get_bounded_int_argument("requests", None, MAX_PROFILE_REQUESTS)
+        seconds = self.get_bounded_int_argument("seconds", DEFAULT_PROFILE_SECONDS if max_requests is None else MAX_PROFILE_SECONDS,
+                                                MAX_PROFILE_SECONDS)
+
+        complete = tornado.locks.Event()
+        try:
+            self.profiling.start(Profiler(route, mode, max_requests, complete.set))
+        except ProfilerBusyError:
+            raise tornado.web.HTTPError(409)
+
+        try:
+            await complete.wait(timeout=datetime.timedelta(seconds=seconds))
+        except tornado.util.TimeoutError:
+            pass
+        finally:
+            profiler = self.profiling.stop()
+
+        self.set_header("Content-Type", "text/plain; charset=UTF-8")
+        self.set_header("X-Profile-Requests", str(profiler.requests))
+        self.set_header("X-Profile-Calls", str(profiler.calls))
+        self.write(profiler.pstats_text() if mode == "cprofile" else profiler.collapsed_stacks())
+
+
+class CacheStatsHandler(BaseHandler):
+    """
+    Handle GET /cache/stats
+    """
+    def get(self):
+        self.write_response(self.cache.stats())
 
 
 class Endpoint(object):
     """
     Wrapper for Tornado route handlers.
+
+    Args:
+        api_service: service (business logic) used by the handlers
+        max_workers: size of the thread pool that service calls are run on,
+            i.e. the number of requests that can query the database concurrently
+        cache_size: number of person and company responses to cache, 0 to disable caching
+        debug_queries: report the SQL statements, rows and time of each request
+            in an `X-Query-Stats` response header
+        graph: `FriendGraph` answering the graph queries, which are only routed if given
+        people_index: `PeopleIndex` answering `/person/search`, which is only routed if given
+        metrics: `Metrics` recording every request, served on `/metrics` if given
+        admin_token: enables profiling requests on `/admin/profile` for clients
+            presenting this token. Disabled by default
     """
-    def __init__(self, api_service):
+    def __init__(self, api_service, max_workers=DEFAULT_MAX_WORKERS, cache_size=DEFAULT_CACHE_SIZE, debug_queries=False,
+                 graph=None, people_index=None, metrics=None, admin_token=None):
         self.api_service = api_service
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # the data is imported before serving, so cached responses stay valid until a restart
+        self.cache = None
+        if cache_size > 0:
+            self.cache = ResponseCache(cache_size)
 
         # create route handlers and inject the service (business logic) 
         # into them
-        self.application = tornado.web.Application([
-            (r"/company/([0-9]+)/employee", CompanyEmployeeHandler, {"service": self.api_service}),
-            (r"/person/([0-9]+)/compare", PersonCompareHandler, {"service": self.api_service}),
-            (r"/person/([0-9]+)", PersonHandler, {"service": self.api_service})
-        ])
+        handler_args = {"service": self.api_service, "executor": self.executor, "cache": self.cache,
+                        "debug_queries": debug_queries, "graph": graph, "people_index": people_index}
+        routes = [
+            (r"/company/([0-9]+)/employee", CompanyEmployeeHandler, handler_args),
+            (r"/company/([0-9]+)/stats", CompanyStatsHandler, handler_args),
+            (r"/company/stats", AllCompanyStatsHandler, handler_args),
+            (r"/person/([0-9]+)/compare", PersonCompareHandler, handler_args),
+            (r"/person/([0-9]+)", PersonHandler, handler_args),
+            (r"/person/compare", BatchPersonCompareHandler, handler_args),
+            (r"/person", BatchPersonHandler, handler_args)
+        ]
+        if graph is not None:
+            routes += [
+                (r"/person/([0-9]+)/mutual", PersonMutualFriendsHandler, handler_args),
+                (r"/person/([0-9]+)/path", PersonPathHandler, handler_args),
+                (r"/company/([0-9]+)/top-connected", CompanyTopConnectedHandler, handler_args)
+            ]
+        if people_index is not None:
+            routes.append((r"/person/search", PersonSearchHandler, handler_args))
+        if self.cache is not None:
+            routes.append((r"/cache/stats", CacheStatsHandler, handler_args))
+        if metrics is not None:
+            routes.append((r"/metrics", MetricsHandler, handler_args))
+
+        profiling = None
+        if admin_token:
+            profiling = RequestProfiling(route_label(pattern) for pattern, _, _ in routes)
+            routes.append((r"/admin/profile", ProfileHandler, dict(handler_args, admin_token=admin_token)))
+
+        # requests are recorded under the pattern of their route
+        routes = [ (pattern, handler, dict(args, metrics=metrics, route=route_label(pattern), profiling=profiling))
+                   for pattern, handler, args in routes ]
+        self.application = tornado.web.Application(routes)
 
     def get_application(self):
         """ Get Tornado application object (required by pytest-tornado) """
         return self.application
 
-    def run(self, port_num):
-        """ start the tornado server """
+    def run(self, port_num, processes=1, on_fork=None):
+        """
+        start the tornado server
+
+        Args:
+            port_num: port to listen on
+            processes: number of worker processes to pre-fork. The listening socket
+                is bound before forking and shared by all workers. 0 forks one
+                worker per CPU, 1 serves from this process without forking.
+            on_fork: called in each worker process after forking, e.g. to replace
+                database connections inherited from the parent
+        """
         print("listening on port {}...".format(port_num))
-        self.application.listen(port_num)
+        if processes == 1:
+            self.application.listen(port_num)
+        else:
+            # the executor's threads are only started on first use, so none
+            # exist yet in the parent when forking
+            sockets = tornado.netutil.bind_sockets(port_num)
+            tornado.process.fork_processes(processes)
+            if on_fork:
+                on_fork()
+            server = tornado.httpserver.HTTPServer(self.application)
+            server.add_sockets(sockets)
         tornado.ioloop.IOLoop.instance().start()
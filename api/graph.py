@@ -0,0 +1,203 @@
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import select
+
+from api.model import Company, Person, friendship
+from api.service import UnknownInstanceError
+from api.snapshot import Snapshot
+
+
+# most hops a shortest path may have
+MAX_PATH_HOPS = 6
+
+# most hops from each person for mutual friends
+MAX_MUTUAL_HOPS = 3
+
+# default number of people a single graph search may visit before giving up
+DEFAULT_MAX_VISITED = 200000
+
+
+class FriendGraph(object):
+    """
+    Friendship graph index for traversals and degree rankings.
+
+    People are addressed by their position `i` in `pids` (sorted ascending),
+    and the friends of person `i` are the positions
+    `adjacency[offsets[i]:offsets[i + 1]]`, sorted (CSR form, as in `Snapshot`).
+    Searches visit at most `max_visited` people, so that a query on a large,
+    dense graph takes bounded time; results report whether they are complete.
+
+    Attributes:
+        pids: person ids, sorted
+        offsets, adjacency: CSR friendship adjacency
+        ranked_positions_by_company_id: company id to positions of its employees,
+            most friends first (ties by id), e.g. a `Postings`
+    """
+    def __init__(self, pids, offsets, adjacency, ranked_positions_by_company_id, max_visited=DEFAULT_MAX_VISITED):
+        self.pids = pids
+        self.offsets = offsets
+        self.adjacency = adjacency
+        self.ranked_positions_by_company_id = ranked_positions_by_company_id
+        self.max_visited = max_visited
+
+    @staticmethod
+    def rank_employees(offsets, employee_positions_by_company_id):
+        """ Order the (sorted) positions of each company's employees by number of friends, most first """
+        return { cid: array('i', sorted(positions, key=lambda i: offsets[i] - offsets[i + 1]))
+                 for cid, positions in employee_positions_by_company_id.items() }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, max_visited=DEFAULT_MAX_VISITED):
+        """ Index the friendships of a `Snapshot`, sharing its arrays """
+        return cls(snapshot.pids, snapshot.friend_offsets, snapshot.friend_positions,
+                   cls.rank_employees(snapshot.friend_offsets, snapshot.employee_positions_by_company_id), max_visited)
+
+    @classmethod
+    def from_database(cls, db, max_visited=DEFAULT_MAX_VISITED):
+        """ Index the friendships imported into `db` """
+        person = Person.__table__
+        pids = array('q')
+
+        with db.engine.connect() as connection:
+            employee_positions_by_company_id = { cid: [] for (cid,) in connection.execute(select([Company.__table__.c.cid])) }
+            for pid, company_id in connection.execute(select([person.c.pid, person.c.company_id]).order_by(person.c.pid)):
+                if company_id in employee_positions_by_company_id:
+                    employee_positions_by_company_id[company_id].append(len(pids))
+                pids.append(pid)
+
+            position_by_pid = { pid: i for i, pid in enumerate(pids) }
+            offsets, adjacency = Snapshot._build_csr(len(pids), (
+                (position_by_pid[a], position_by_pid[b]) for a, b in connection.execute(
+                    select([friendship.c.person_id, friendship.c.friend_id]).order_by(friendship.c.person_id, friendship.c.friend_id))))
+
+        return cls(pids, offsets, adjacency, cls.rank_employees(offsets, employee_positions_by_company_id), max_visited)
+
+    def position_of(self, pid):
+        """ Return the position of person `pid`, raising `UnknownInstanceError` if unknown """
+        i = bisect_left(self.pids, pid)
+        if i < len(self.pids) and self.pids[i] == pid:
+            return i
+        raise UnknownInstanceError("unknown person id '{}'".format(pid))
+
+    def friends_of(self, i):
+        return self.adjacency[self.offsets[i]:self.offsets[i + 1]]
+
+    def degree_of(self, i):
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def hop_distances(self, i, max_hops):
+        """
+        Breadth-first search from position `i`.
+
+        Returns:
+            (map of position to hops for everyone within `max_hops` of `i` (excluding `i`),
+             whether the search completed within `max_visited`)
+        """
+        distances = {i: 0}
+        frontier = [i]
+        for hops in range(1, max_hops + 1):
+            next_frontier = []
+            for j in frontier:
+                for k in self.friends_of(j):
+                    if k not in distances:
+                        distances[k] = hops
+                        next_frontier.append(k)
+                if len(distances) > self.max_visited:
+                    del distances[i]
+                    return distances, False
+            frontier = next_frontier
+        del distances[i]
+        return distances, True
+
+    def mutual_friends(self, this_id, other_id, max_hops):
+        """
+        Find people within `max_hops` friendships of both people.
+
+        Returns:
+            (list of (person id, hops from this person, hops from other person) ordered by
+             the larger of the two distances, then by id, whether the search was complete)
+        """
+        this_i, other_i = self.position_of(this_id), self.position_of(other_id)
+        this_distances, this_complete = self.hop_distances(this_i, max_hops)
+        other_distances, other_complete = self.hop_distances(other_i, max_hops)
+
+        if len(other_distances) < len(this_distances):
+            common = [ i for i in other_distances if i in this_distances ]
+        else:
+            common = [ i for i in this_distances if i in other_distances ]
+        mutual = [ (self.pids[i], this_distances[i], other_distances[i]) for i in common if i != this_i and i != other_i ]
+        mutual.sort(key=lambda m: (max(m[1], m[2]), m[0]))
+        return mutual, this_complete and other_complete
+
+    def shortest_path(self, this_id, other_id, max_hops=MAX_PATH_HOPS):
+        """
+        Find a shortest chain of friendships between two people with a
+        bidirectional breadth-first search, expanding the smaller frontier
+        one level at a time.
+
+        Returns:
+            (list of person ids from this to other person, or None if there is no path
+             of at most `max_hops` friendships, whether the search was complete)
+        """
+        this_i, other_i = self.position_of(this_id), self.position_of(other_id)
+        if this_i == other_i:
+            return [this_id], True
+
+        # parent of each person reached from either side (None for the start)
+        forward, backward = {this_i: None}, {other_i: None}
+        forward_frontier, backward_frontier = [this_i], [other_i]
+        hops = 0
+
+        while forward_frontier and backward_frontier and hops < max_hops:
+            expand_forward = len(forward_frontier) <= len(backward_frontier)
+            parents, others = (forward, backward) if expand_forward else (backward, forward)
+            frontier = forward_frontier if expand_forward else backward_frontier
+
+            next_frontier = []
+            meeting = None
+            for j in frontier:
+                for k in self.friends_of(j):
+                    if k in parents:
+                        continue
+                    parents[k] = j
+                    if k in others:
+                        meeting = k
+                        break
+                    next_frontier.append(k)
+                if meeting is not None:
+                    # every meeting found while expanding a level makes a path of the same length
+                    return self._join_paths(forward, backward, meeting), True
+                if len(forward) + len(backward) > self.max_visited:
+                    return None, False
+            hops += 1
+
+            if expand_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+
+        return None, True
+
+    def _join_paths(self, forward, backward, meeting):
+        path = []
+        i = meeting
+        while i is not None:
+            path.append(self.pids[i])
+            i = forward[i]
+        path.reverse()
+        i = backward[meeting]
+        while i is not None:
+            path.append(self.pids[i])
+            i = backward[i]
+        return path
+
+    def top_connected(self, cid, k):
+        """
+        Return the `k` employees of a company with the most friends, as
+        (person id, number of friends) pairs
+        """
+        positions = self.ranked_positions_by_company_id.get(cid)
+        if positions is None:
+            raise UnknownInstanceError("unknown company id '{}'".format(cid))
+        return [ (self.pids[i], self.degree_of(i)) for i in positions[:k] ]
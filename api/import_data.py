@@ -1,7 +1,42 @@
+import codecs
+import csv
+import io
 import json
+import os
+import re
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
 
-from api.model import Company, Person, Food
+from sqlalchemy import and_, bindparam, case, func, select
+
+from api.model import Company, CompanyStats, Person, Food, FoodCategory, favourite_food_table, friendship, split_food_ids
 from api.database import write_scope, read_scope
+from api.manifest import SCHEMA_ENTRY, build_manifest, changed_entries, read_manifest, write_manifest, with_next_version
+
+
+# number of rows submitted per `executemany` in bulk import mode
+DEFAULT_BATCH_SIZE = 5000
+
+# years of age per bucket of the materialized company age distributions
+AGE_BUCKET_WIDTH = 10
+
+# characters read per chunk when streaming a JSON array
+JSON_READ_CHUNK_SIZE = 1 << 16
+
+# bytes of the people file parsed by each task of a parallel import
+DEFAULT_PARTITION_SIZE = 4 << 20
+
+# how far before its range a partition looks for the separator of its first record
+PARTITION_LOOKBACK = 4096
+
+# a candidate separator between two objects of a JSON array ("},{")
+RECORD_SEPARATOR = re.compile(rb"\}\s*,\s*\{")
+
+# order of the values in the person row tuples built by parallel import tasks
+PERSON_ROW_COLUMNS = ("pid", "name", "age", "address", "email", "phone", "eye_color", "alive", "company_id",
+                      "fruit_ids", "vegetable_ids")
 
 
 class ImportError(Exception):
@@ -16,6 +51,78 @@ class UnknownReferenceError(ImportError):
     pass
 
 
+class PartitionBoundaryError(Exception):
+    """ Partitions of a file didn't line up with its records, e.g. a "},{" inside a string was taken for a separator """
+    pass
+
+
+def iter_json_array(file_path_in, chunk_size=JSON_READ_CHUNK_SIZE):
+    """
+    Incrementally parse a file containing a top-level JSON array, yielding
+    one element at a time. Only the element currently being decoded (plus
+    at most one read chunk) is held in memory.
+    """
+    decoder = json.JSONDecoder()
+
+    try:
+        with open(file_path_in, 'r') as f:
+            buffer = ""
+            pos = 0
+            eof = False
+
+            def fill(pos):
+                # drop consumed text and append the next chunk
+                nonlocal buffer, eof
+                chunk = f.read(max(chunk_size, len(buffer) - pos))
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                return 0
+
+            def skip_whitespace(pos):
+                while True:
+                    while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                        pos += 1
+                    if pos < len(buffer) or eof:
+                        return pos
+                    pos = fill(pos)
+
+            pos = skip_whitespace(pos)
+            if buffer[pos:pos + 1] != "[":
+                raise ValueError("expected a JSON array")
+            pos = skip_whitespace(pos + 1)
+
+            if buffer[pos:pos + 1] == "]":
+                return
+
+            while True:
+                try:
+                    element, end = decoder.raw_decode(buffer, pos)
+                    # a number may have been cut short at the end of the buffer, in
+                    # which case it isn't followed by a separator yet
+                    truncated = not eof and (end == len(buffer) or buffer[end] not in " \t\r\n,]")
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    truncated = True
+
+                if truncated:
+                    pos = fill(pos)
+                    continue
+
+                yield element
+
+                pos = skip_whitespace(end)
+                separator = buffer[pos:pos + 1]
+                if separator == "]":
+                    return
+                if separator != ",":
+                    raise ValueError("expected ',' or ']' at offset {} of JSON array".format(pos))
+                pos = skip_whitespace(pos + 1)
+    except Exception as e:
+        print("failed to read json file because: " + str(e))
+        raise
+
+
 def read_json_file(file_path_in):
     try:
         with open(file_path_in, 'r') as f:
@@ -26,8 +133,12 @@ def read_json_file(file_path_in):
         raise
 
 
-def load_company_data(companies_json):
-    company_models_by_id = {}
+def build_company_rows(companies_json):
+    """
+    Validate company records and convert them into `company` table rows,
+    keyed by company id.
+    """
+    company_rows_by_id = {}
 
     for i, company in enumerate(companies_json):
         cid = int(company["index"])
@@ -37,81 +148,167 @@ def load_company_data(companies_json):
         #  that company data needs to be manually-offset to align the references.
         cid += 1
 
-        if cid in company_models_by_id:
+        if cid in company_rows_by_id:
             raise DuplicateInstanceIdError("duplicate company index ({}) seen at natural-index ({}), aborting load".format(cid, i))
 
-        #  create and cache new instance of `Company`
-        c = Company(cid=cid, name=company["company"])
-        company_models_by_id[cid] = c
-    
-    return company_models_by_id
+        company_rows_by_id[cid] = {"cid": cid, "name": company["company"]}
 
+    return company_rows_by_id
 
-def load_people_data(people_json, foods_json, company_models_by_id):
-    person_models_by_id = {}
-    friend_ids_for_person_id = {}
-    food_models_by_id = {}
 
-    for i, person in enumerate(people_json):
-        pid = int(person["index"])
-        if pid in person_models_by_id:
-            raise DuplicateInstanceIdError("duplicate person index ({}) seen at natural-index ({}), aborting load".format(pid, i))
+def build_person_row(person, i, foods_json, company_ids):
+    """
+    Validate a single person record.
 
-        p = Person(
-            pid=pid,
-            name=person["name"],
-            age=person["age"],
-            address=person["address"],
-            email=person["email"],
-            phone=person["phone"],
-            eye_color=person["eyeColor"],
-            alive=not person["has_died"])
+    Returns:
+        (`person` table row, referenced friend ids, favourite food ids)
+    """
+    pid = int(person["index"])
 
-        # add p as employee to c
-        company_id = int(person["company_id"])
+    company_id = int(person["company_id"])
+    if company_id not in company_ids:
+        raise UnknownReferenceError("person ({}) at natural-index ({}) references an unknown company id ({}), aborting load".format(pid, i, company_id))
 
-        if company_id not in company_models_by_id:
-            raise UnknownReferenceError("person ({}) at natural-index ({}) references an unknown company id ({}), aborting load".format(pid, i, company_id))
+    person_row = {
+        "pid": pid,
+        "name": person["name"],
+        "age": person["age"],
+        "address": person["address"],
+        "email": person["email"],
+        "phone": person["phone"],
+        "eye_color": person["eyeColor"],
+        "alive": not person["has_died"],
+        "company_id": company_id
+    }
+
+    friend_list = person["friends"]
+    friend_indicies = [ int(f["index"]) for f in friend_list if int(f["index"]) != pid ]
+
+    favourites = person["favouriteFood"]
+    for fav in favourites:
+        if fav not in foods_json:
+            raise UnknownReferenceError("unknown/uncategorised food '{}'".format(fav))
+
+    person_row["fruit_ids"], person_row["vegetable_ids"] = split_food_ids((fav, foods_json[fav]) for fav in favourites)
+
+    return person_row, friend_indicies, favourites
 
-        company = company_models_by_id[company_id]
-        company.employees.append(p)
-        person_models_by_id[pid] = p
+
+def build_people_rows(people_json, foods_json, company_ids, friend_ids_for_person_id=None, known_food_ids=None, start_index=0):
+    """
+    Validate person records and convert them into `person`, `food` and
+    `favourites` table rows.
+
+    Friend references are collected separately into `friend_ids_for_person_id`
+    (a map of person id to referenced friend ids) since friendships can only be
+    resolved once all people have been seen. Passing the same map and
+    `known_food_ids` set across calls allows people to be built in chunks;
+    only foods not already in `known_food_ids` are returned.
+    """
+    if friend_ids_for_person_id is None:
+        friend_ids_for_person_id = {}
+    if known_food_ids is None:
+        known_food_ids = set()
+
+    person_rows_by_id = {}
+    food_rows_by_id = {}
+    favourite_rows = []
+
+    for i, person in enumerate(people_json, start_index):
+        pid = int(person["index"])
+        if pid in friend_ids_for_person_id:
+            raise DuplicateInstanceIdError("duplicate person index ({}) seen at natural-index ({}), aborting load".format(pid, i))
+
+        person_row, friend_ids, favourites = build_person_row(person, i, foods_json, company_ids)
+        person_rows_by_id[pid] = person_row
 
         # cache friend index references so we can form friendships in a later pass
-        friend_list = person["friends"]
-        friend_indicies = [ int(f["index"]) for f in friend_list if int(f["index"]) != pid ]
-        friend_ids_for_person_id[pid] = friend_indicies
+        friend_ids_for_person_id[pid] = friend_ids
 
         # favourite foods
-        favourites = person["favouriteFood"]
         for fav in favourites:
-            food = None
-            if fav in food_models_by_id:
-                food = food_models_by_id[fav]
-            else:
-                category = foods_json.get(fav, None)
-                if category is None:
-                    raise UnknownReferenceError("unknown/uncategorised food '{}'".format(category))
-                food = Food(id=fav, category=category)
-            food_models_by_id[fav] = food
-            p.favourite_foods.append(food)
+            if fav not in known_food_ids:
+                known_food_ids.add(fav)
+                food_rows_by_id[fav] = {"id": fav, "category": int(FoodCategory.coerce(foods_json[fav]))}
+            favourite_rows.append({"person_id": pid, "food_id": fav})
 
-    return person_models_by_id, friend_ids_for_person_id
+    return person_rows_by_id, food_rows_by_id, favourite_rows, friend_ids_for_person_id
 
 
-def load_friendships(person_models_by_id, friends_for_person_id):
-    for our_id, person_model in person_models_by_id.items():
-        our_friends = set(friends_for_person_id[our_id])
+def resolve_friendships(friend_ids_for_person_id):
+    """
+    Resolve mutual friend references in a single pass.
+
+    Each person's references are converted to a set once, after which a
+    friendship exists wherever the friend's set also references the person.
+    Duplicate references collapse in the sets.
+
+    Returns:
+        list of (person_id, friend_id) pairs ordered by person then friend,
+        with each friendship present in both directions
+    """
+    known_ids = friend_ids_for_person_id.keys()
+
+    friend_sets = {}
+    for our_id, friend_ids in friend_ids_for_person_id.items():
+        our_friends = set(friend_ids)
+        if not our_friends <= known_ids:
+            friend_id = min(f for f in our_friends if f not in known_ids)
+            raise UnknownReferenceError("person ({}) references an unknown friend id ({}), aborting load".format(our_id, friend_id))
+        friend_sets[our_id] = our_friends
+
+    friendships = []
+    for our_id in sorted(friend_sets):
+        # only establish friendship if both persons reference each other as friends
+        mutual = [ friend_id for friend_id in friend_sets[our_id] if our_id in friend_sets[friend_id] ]
+        mutual.sort()
+        friendships.extend(zip(repeat(our_id), mutual))
 
-        #print("friends for p({}): {}".format(our_id, our_friends))
+    return friendships
 
-        for friend_id in our_friends:
-            their_friends = set(friends_for_person_id[friend_id])
 
-            # only establish friendship if both persons reference each other as friends
-            if our_id in their_friends and friend_id in our_friends:
-                friend_model = person_models_by_id[friend_id]
-                person_model.befriend(friend_model)
+def build_friendship_rows(friend_ids_for_person_id):
+    """
+    Return `friendship` table rows for every mutual friend reference.
+    Each friendship yields a row in both directions.
+    """
+    return ( {"person_id": a, "friend_id": b} for a, b in resolve_friendships(friend_ids_for_person_id) )
+
+
+def load_company_data(companies_json):
+    company_models_by_id = {}
+
+    #  create and cache new instances of `Company`
+    for cid, row in build_company_rows(companies_json).items():
+        company_models_by_id[cid] = Company(**row)
+
+    return company_models_by_id
+
+
+def load_people_data(people_json, foods_json, company_models_by_id):
+    person_rows_by_id, food_rows_by_id, favourite_rows, friend_ids_for_person_id = build_people_rows(
+        people_json, foods_json, company_models_by_id)
+
+    food_models_by_id = { fid: Food(**row) for fid, row in food_rows_by_id.items() }
+    person_models_by_id = {}
+
+    for pid, row in person_rows_by_id.items():
+        p = Person(**row)
+
+        # add p as employee to c
+        company_models_by_id[row["company_id"]].employees.append(p)
+        person_models_by_id[pid] = p
+
+    for row in favourite_rows:
+        person_models_by_id[row["person_id"]].favourite_foods.append(food_models_by_id[row["food_id"]])
+
+    return person_models_by_id, friend_ids_for_person_id
+
+
+def load_friendships(person_models_by_id, friends_for_person_id):
+    # each friendship is resolved in both directions, so append to one side only
+    for our_id, friend_id in resolve_friendships(friends_for_person_id):
+        person_models_by_id[our_id].friends.append(person_models_by_id[friend_id])
 
 
 def write_models_to_database(database, companies, people):
@@ -124,7 +321,183 @@ def write_models_to_database(database, companies, people):
             session.add(p)
 
 
-def import_local_data(db, companies_path, people_path, foods_path):
+def insert_rows(connection, table, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert rows into a table using Core `executemany` in batches of `batch_size`.
+    Returns the number of rows inserted.
+    """
+    count = 0
+    batch = []
+    statement = table.insert()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.execute(statement, batch)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        connection.execute(statement, batch)
+        count += len(batch)
+
+    return count
+
+
+def copy_rows(connection, table, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert rows into a PostgreSQL table with `COPY ... FROM STDIN`, streaming
+    `batch_size` rows of CSV at a time. Requires the psycopg2 driver.
+
+    Returns:
+        number of rows inserted
+    """
+    cursor = connection.connection.cursor()
+    count = 0
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        # strings are quoted, so that an unquoted empty value is NULL
+        columns = list(batch[0].keys())
+        # values are converted as by INSERT, e.g. lists of ids to JSON
+        processors = [ table.c[c].type.bind_processor(connection.dialect) for c in columns ]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for row in batch:
+            writer.writerow([ process(row[c]) if process else row[c] for c, process in zip(columns, processors) ])
+        buffer.seek(0)
+
+        cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(table.name, ", ".join(columns)), buffer)
+        count += len(batch)
+
+    return count
+
+
+def write_rows_to_database(database, rows_by_table, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Bulk insert rows in a single transaction.
+
+    Args:
+        database: db instance
+        rows_by_table: iterable of (table, rows) pairs in insert order. A table
+            may appear more than once, e.g. when rows are produced in chunks
+        batch_size: rows per `executemany` (or `COPY` batch)
+
+    Returns:
+        list of (table name, row count, seconds) for each table, in order of first insert
+    """
+    write = copy_rows if database.import_strategy == "copy" else insert_rows
+    timings = {}
+    with database.engine.begin() as connection:
+        for table, rows in rows_by_table:
+            start = time.perf_counter()
+            count = write(connection, table, rows, batch_size)
+            total_count, total_seconds = timings.get(table.name, (0, 0.0))
+            timings[table.name] = (total_count + count, total_seconds + time.perf_counter() - start)
+    return [ (name, count, seconds) for name, (count, seconds) in timings.items() ]
+
+
+def age_bucket(age):
+    """ Label of the age distribution bucket of `age`, e.g. "30-39" """
+    start = age - age % AGE_BUCKET_WIDTH
+    return "{}-{}".format(start, start + AGE_BUCKET_WIDTH - 1)
+
+
+def build_company_stats_rows(connection):
+    """
+    Aggregate the employees of every company with two grouped queries: one
+    over people by company and age, one over favourites by company and food.
+
+    Returns:
+        map of company id to `company_stats` row
+    """
+    person = Person.__table__
+    food = Food.__table__
+
+    rows_by_id = { cid: {"company_id": cid, "headcount": 0, "alive_count": 0, "age_min": None, "age_max": None, "age_sum": 0,
+                         "age_count": 0, "age_distribution": {}, "fruit_counts": {}, "vegetable_counts": {}}
+                   for (cid,) in connection.execute(select([Company.__table__.c.cid])) }
+
+    people_by_age = select([person.c.company_id, person.c.age, func.count(),
+                            func.count(case([(person.c.alive == True, 1)]))]) \
+        .where(person.c.company_id != None) \
+        .group_by(person.c.company_id, person.c.age)
+    for cid, age, count, alive_count in connection.execute(people_by_age):
+        row = rows_by_id[cid]
+        row["headcount"] += count
+        row["alive_count"] += alive_count
+        if age is not None:
+            row["age_min"] = age if row["age_min"] is None else min(row["age_min"], age)
+            row["age_max"] = age if row["age_max"] is None else max(row["age_max"], age)
+            row["age_sum"] += age * count
+            row["age_count"] += count
+            bucket = age_bucket(age)
+            row["age_distribution"][bucket] = row["age_distribution"].get(bucket, 0) + count
+
+    favourites_by_food = select([person.c.company_id, food.c.category, favourite_food_table.c.food_id, func.count()]) \
+        .select_from(favourite_food_table.join(person, person.c.pid == favourite_food_table.c.person_id)
+                                         .join(food, food.c.id == favourite_food_table.c.food_id)) \
+        .where(person.c.company_id != None) \
+        .group_by(person.c.company_id, food.c.category, favourite_food_table.c.food_id)
+    for cid, category, food_id, count in connection.execute(favourites_by_food):
+        if category == FoodCategory.FRUIT:
+            rows_by_id[cid]["fruit_counts"][food_id] = count
+        elif category == FoodCategory.VEGETABLE:
+            rows_by_id[cid]["vegetable_counts"][food_id] = count
+
+    return rows_by_id
+
+
+def refresh_company_stats(connection, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rebuild the materialized `company_stats` table from the imported data,
+    on `connection` (i.e. within the import's transaction, if any).
+
+    Returns:
+        number of companies
+    """
+    table = CompanyStats.__table__
+    rows = build_company_stats_rows(connection).values()
+    connection.execute(table.delete())
+    return insert_rows(connection, table, rows, batch_size)
+
+
+def materialize_company_stats(db, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rebuild the `company_stats` table once all data has been imported.
+
+    Returns:
+        (table name, row count, seconds) as listed by `write_rows_to_database`
+    """
+    start = time.perf_counter()
+    with db.engine.begin() as connection:
+        count = refresh_company_stats(connection, batch_size)
+    seconds = time.perf_counter() - start
+    print(" - {} company_stats rows materialized in {:.3f}s".format(count, seconds))
+    return CompanyStats.__tablename__, count, seconds
+
+
+def import_local_data(db, companies_path, people_path, foods_path, bulk=False, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    """
+    Read the JSON data files and import them into the database, then
+    materialize the company statistics.
+
+    Args:
+        db: db instance
+        companies_path, people_path, foods_path: paths of the JSON data files
+        bulk: if set, insert rows with batched Core `executemany` statements rather than ORM models
+        batch_size: rows per `executemany` in bulk mode
+        workers: processes parsing people in bulk mode, 1 to parse them in this process
+            or None for one per CPU (see `parallel_import_local_data`)
+    """
+    if bulk and workers != 1:
+        return parallel_import_local_data(db, companies_path, people_path, foods_path, workers, batch_size)
+    if bulk:
+        return bulk_import_local_data(db, companies_path, people_path, foods_path, batch_size)
 
     # load `company` models (but don't import yet)
     companies_json = read_json_file(companies_path)
@@ -144,7 +517,538 @@ def import_local_data(db, companies_path, people_path, foods_path):
     print(" - {} companies imported".format(len(companies_json)))
     print(" - {} people imported".format(len(people_json)))
 
+    materialize_company_stats(db)
+
     # with read_scope(db) as session:
     #     for p in session.query(Person).filter_by(pid=0):
     #         print("{} ({}): {}".format(p.name, p.pid, [f.name for f in p.friends]))
     #         print("foods: {}".format([f.id for f in p.favourite_foods]))
+
+
+def iter_people_row_chunks(people_records, foods_json, company_ids, friend_ids_for_person_id, chunk_size=DEFAULT_BATCH_SIZE):
+    """
+    Build table rows for people in chunks of `chunk_size` records, yielding
+    (person rows by id, new food rows by id, favourite rows) for each chunk
+    so that they can be written before the next chunk is read.
+    """
+    known_food_ids = set()
+    chunk = []
+    start_index = 0
+
+    for person in people_records:
+        chunk.append(person)
+        if len(chunk) >= chunk_size:
+            yield build_people_rows(chunk, foods_json, company_ids, friend_ids_for_person_id, known_food_ids, start_index)[:3]
+            start_index += len(chunk)
+            chunk = []
+
+    if chunk:
+        yield build_people_rows(chunk, foods_json, company_ids, friend_ids_for_person_id, known_food_ids, start_index)[:3]
+
+
+def iter_people_table_rows(people_records, foods_json, company_ids, friend_ids_for_person_id, chunk_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield (table, rows) pairs for each chunk of people built by `iter_people_row_chunks`.
+    """
+    for person_rows_by_id, food_rows_by_id, favourite_rows in iter_people_row_chunks(
+            people_records, foods_json, company_ids, friend_ids_for_person_id, chunk_size):
+        yield Food.__table__, food_rows_by_id.values()
+        yield Person.__table__, person_rows_by_id.values()
+        yield favourite_food_table, favourite_rows
+
+
+def bulk_import_local_data(db, companies_path, people_path, foods_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import the JSON data files as plain table rows, bypassing the ORM unit of work.
+
+    `people_path` is streamed and written in chunks of `batch_size` people, so
+    memory use is bounded by the chunk size plus the friend references that
+    are needed to resolve friendships once every person has been read.
+
+    Returns the per-table timings from `write_rows_to_database`, followed
+    by those of the company statistics materialized afterwards.
+    """
+    company_rows_by_id = build_company_rows(read_json_file(companies_path))
+    foods_json = read_json_file(foods_path)
+    friend_ids_for_person_id = {}
+
+    def rows_by_table():
+        yield Company.__table__, company_rows_by_id.values()
+
+        people_records = iter_json_array(people_path)
+        yield from iter_people_table_rows(people_records, foods_json, company_rows_by_id, friend_ids_for_person_id, batch_size)
+
+        # every person has now been seen
+        yield friendship, build_friendship_rows(friend_ids_for_person_id)
+
+    timings = write_rows_to_database(db, rows_by_table(), batch_size)
+
+    for table_name, count, seconds in timings:
+        print(" - {} {} rows imported in {:.3f}s".format(count, table_name, seconds))
+
+    timings.append(materialize_company_stats(db, batch_size))
+    return timings
+
+
+def read_json_array_partition(file_path_in, byte_start, byte_end, is_element=None, chunk_size=JSON_READ_CHUNK_SIZE):
+    """
+    Decode the objects of a top-level JSON array whose opening brace lies
+    within bytes [byte_start, byte_end) of the file.
+
+    The first object of a partition (other than the one at the start of the
+    file) is found by searching for a "},{" separator. Such separators also
+    occur between nested objects and inside strings, so candidates are
+    tried in turn until one decodes to an object accepted by `is_element`.
+    As that is a heuristic, the caller has to check that consecutive
+    partitions line up, i.e. that each one starts where the previous one
+    stopped.
+
+    Returns:
+        (byte offset of the first object or None if no object starts in the range,
+         byte offset where decoding stopped, objects, whether the end of the array was reached)
+    """
+    if byte_start == 0:
+        return _read_json_array_elements(file_path_in, 0, byte_end, None, chunk_size)
+
+    read_start = max(0, byte_start - PARTITION_LOOKBACK)
+    with open(file_path_in, 'rb') as f:
+        f.seek(read_start)
+        data = f.read(byte_end - read_start)
+
+    for match in RECORD_SEPARATOR.finditer(data):
+        first = read_start + match.end() - 1
+        if first < byte_start:
+            continue
+        try:
+            return _read_json_array_elements(file_path_in, first, byte_end, is_element, chunk_size)
+        except ValueError:
+            # not the start of an element
+            continue
+
+    return None, None, [], False
+
+
+def _read_json_array_elements(file_path_in, first, byte_end, is_element, chunk_size):
+    # decode array elements from byte offset `first` (0: the start of the array) until
+    # one starts at or after `byte_end`, see `read_json_array_partition`
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    with open(file_path_in, 'rb') as f:
+        f.seek(first)
+        buffer = ""
+        byte_pos = first
+        eof = False
+
+        def fill(pos):
+            nonlocal buffer, eof
+            chunk = f.read(max(chunk_size, len(buffer) - pos))
+            eof = not chunk
+            buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+            return 0
+
+        def skip_whitespace(pos):
+            # whitespace is ASCII, one byte per character
+            nonlocal byte_pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                    pos += 1
+                    byte_pos += 1
+                if pos < len(buffer) or eof:
+                    return pos
+                pos = fill(pos)
+
+        pos = fill(0)
+        if first == 0:
+            pos = skip_whitespace(pos)
+            if buffer[pos:pos + 1] != "[":
+                raise ValueError("expected a JSON array")
+            byte_pos += 1
+            pos = skip_whitespace(pos + 1)
+            first = byte_pos
+            if buffer[pos:pos + 1] == "]":
+                return first, byte_pos, [], True
+
+        elements = []
+        while byte_pos < byte_end:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                # a number may have been cut short at the end of the buffer
+                truncated = not eof and (end == len(buffer) or buffer[end] not in " \t\r\n,]")
+            except json.JSONDecodeError as e:
+                # only errors at the end of the buffer (or in a string running up to it) can be
+                # resolved by reading more, which also keeps a wrong first candidate from reading to EOF
+                if eof or (e.pos < len(buffer) - 6 and not e.msg.startswith("Unterminated string")):
+                    raise
+                truncated = True
+
+            if truncated:
+                pos = fill(pos)
+                continue
+
+            if not elements and is_element is not None and not is_element(element):
+                raise ValueError("unexpected element at byte offset {}".format(byte_pos))
+
+            elements.append(element)
+            byte_pos += len(buffer[pos:end].encode("utf-8"))
+
+            pos = skip_whitespace(end)
+            separator = buffer[pos:pos + 1]
+            if separator == "]":
+                return first, byte_pos, elements, True
+            if separator != ",":
+                raise ValueError("expected ',' or ']' at byte offset {} of JSON array".format(byte_pos))
+            byte_pos += 1
+            pos = skip_whitespace(pos + 1)
+
+        return first, byte_pos, elements, False
+
+
+def is_person_record(element):
+    """ Whether a decoded JSON value looks like a record of the people file (rather than e.g. one of its friend references) """
+    return isinstance(element, dict) and "company_id" in element and "friends" in element
+
+
+# rows built from one partition of the people file by a parallel import task
+PeoplePartition = namedtuple("PeoplePartition", ["first", "stop", "at_end", "person_rows", "food_rows", "favourite_rows", "friend_ids_for_person_id"])
+
+
+def build_people_partition(people_path, byte_start, byte_end, foods_json, company_ids):
+    """
+    Parse the people starting within bytes [byte_start, byte_end) of the
+    people file and build their rows. Runs in a worker process of
+    `parallel_import_local_data`, so rows are returned as plain tuples:
+    person rows in `PERSON_ROW_COLUMNS` order, (food id, category) and
+    (person id, food id) pairs.
+    """
+    try:
+        first, stop, people_json, at_end = read_json_array_partition(people_path, byte_start, byte_end, is_person_record)
+        person_rows_by_id, food_rows_by_id, favourite_rows, friend_ids_for_person_id = build_people_rows(people_json, foods_json, company_ids)
+    except ImportError as e:
+        # natural indices are relative to the partition
+        raise type(e)("{} (in the partition starting at byte offset {})".format(e, first))
+    except (KeyError, TypeError, ValueError) as e:
+        if byte_start == 0:
+            raise
+        # most likely decoding started inside a string; the serial import reports any actual error
+        raise PartitionBoundaryError("no records found from byte offset {} ({!r})".format(byte_start, e))
+
+    return PeoplePartition(
+        first, stop, at_end,
+        [ tuple(row[column] for column in PERSON_ROW_COLUMNS) for row in person_rows_by_id.values() ],
+        [ (row["id"], row["category"]) for row in food_rows_by_id.values() ],
+        [ (row["person_id"], row["food_id"]) for row in favourite_rows ],
+        friend_ids_for_person_id)
+
+
+def partition_byte_ranges(file_size, num_partitions):
+    """ Split `file_size` bytes into `num_partitions` contiguous (start, end) ranges """
+    bounds = [ file_size * k // num_partitions for k in range(num_partitions + 1) ]
+    return list(zip(bounds, bounds[1:]))
+
+
+def parallel_import_local_data(db, companies_path, people_path, foods_path, workers=None, batch_size=DEFAULT_BATCH_SIZE,
+                               partition_size=DEFAULT_PARTITION_SIZE):
+    """
+    Import the JSON data files like `bulk_import_local_data`, with the people
+    file parsed and converted to rows by a pool of `workers` processes (one
+    per CPU by default).
+
+    The people file is split into byte ranges of about `partition_size`
+    bytes, at least one per worker. Partitions are merged in file order into
+    the single writer while later ones are still being parsed; at most two
+    per worker are held in memory. Duplicate people across partitions are
+    detected while merging, and friendships are resolved once all people
+    have been merged.
+
+    If the partitions don't line up with the records (see
+    `read_json_array_partition`), the import is rolled back and redone
+    serially.
+
+    Returns the per-table timings from `write_rows_to_database`, followed
+    by those of the company statistics materialized afterwards.
+    """
+    workers = workers or os.cpu_count() or 1
+    company_rows_by_id = build_company_rows(read_json_file(companies_path))
+    foods_json = read_json_file(foods_path)
+    company_ids = set(company_rows_by_id)
+
+    file_size = os.path.getsize(people_path)
+    num_partitions = max(workers, -(-file_size // partition_size))
+    byte_ranges = partition_byte_ranges(file_size, num_partitions)
+
+    friend_ids_for_person_id = {}
+    start = time.perf_counter()
+    reported_step = 0
+
+    def report(parsed_bytes):
+        # roughly every 10% of the file
+        nonlocal reported_step
+        step = parsed_bytes * 10 // max(file_size, 1)
+        if step <= reported_step:
+            return
+        reported_step = step
+        elapsed = time.perf_counter() - start
+        print(" - {:.0%} of people parsed: {} people in {:.3f}s ({:.0f} people/s, {:.1f}MB/s)".format(
+            parsed_bytes / max(file_size, 1), len(friend_ids_for_person_id), elapsed,
+            len(friend_ids_for_person_id) / elapsed, parsed_bytes / elapsed / (1 << 20)))
+
+    def rows_by_table(executor):
+        yield Company.__table__, company_rows_by_id.values()
+
+        known_food_ids = set()
+        expected_first = None
+        at_end = False
+
+        pending = deque()
+        remaining = iter(byte_ranges)
+        for byte_start, byte_end in islice(remaining, 2 * workers):
+            pending.append((byte_end, executor.submit(build_people_partition, people_path, byte_start, byte_end, foods_json, company_ids)))
+
+        while pending:
+            byte_end, future = pending.popleft()
+            partition = future.result()
+            for byte_start, next_end in islice(remaining, 1):
+                pending.append((next_end, executor.submit(build_people_partition, people_path, byte_start, next_end, foods_json, company_ids)))
+
+            if partition.first is None:
+                # a record larger than the partition
+                continue
+            if expected_first is not None and partition.first != expected_first:
+                raise PartitionBoundaryError("partition starting at byte offset {} doesn't follow the previous one (stopped at {})".format(
+                    partition.first, expected_first))
+            expected_first = partition.stop
+            at_end = partition.at_end
+
+            for pid in partition.friend_ids_for_person_id:
+                if pid in friend_ids_for_person_id:
+                    raise DuplicateInstanceIdError("duplicate person index ({}) seen in the partition starting at byte offset {}, aborting load".format(
+                        pid, partition.first))
+            friend_ids_for_person_id.update(partition.friend_ids_for_person_id)
+
+            food_rows = []
+            for food_id, category in partition.food_rows:
+                if food_id not in known_food_ids:
+                    known_food_ids.add(food_id)
+                    food_rows.append({"id": food_id, "category": category})
+
+            yield Food.__table__, food_rows
+            yield Person.__table__, ( dict(zip(PERSON_ROW_COLUMNS, row)) for row in partition.person_rows )
+            yield favourite_food_table, ( {"person_id": pid, "food_id": food_id} for pid, food_id in partition.favourite_rows )
+            report(byte_end)
+
+        if not at_end:
+            raise PartitionBoundaryError("partitions stopped at byte offset {}, before the end of the array".format(expected_first))
+
+        # every person has now been seen
+        yield friendship, build_friendship_rows(friend_ids_for_person_id)
+
+    with ProcessPoolExecutor(workers) as executor:
+        try:
+            timings = write_rows_to_database(db, rows_by_table(executor), batch_size)
+        except PartitionBoundaryError as e:
+            timings = None
+            print(" - {}, importing people serially instead".format(e))
+
+    if timings is None:
+        return bulk_import_local_data(db, companies_path, people_path, foods_path, batch_size)
+
+    elapsed = time.perf_counter() - start
+    print(" - {} people imported by {} processes in {:.3f}s ({:.0f} people/s, {:.1f}MB/s)".format(
+        len(friend_ids_for_person_id), workers, elapsed, len(friend_ids_for_person_id) / elapsed, file_size / elapsed / (1 << 20)))
+    for table_name, count, seconds in timings:
+        print(" - {} {} rows imported in {:.3f}s".format(count, table_name, seconds))
+
+    timings.append(materialize_company_stats(db, batch_size))
+    return timings
+
+
+def select_rows_in(connection, table, column, keys, chunk_size=500):
+    """
+    Select rows of `table` whose `column` is one of `keys`, issuing one
+    `IN (...)` query per `chunk_size` keys to stay under bind parameter limits.
+    """
+    keys = list(keys)
+    for i in range(0, len(keys), chunk_size):
+        for row in connection.execute(table.select().where(column.in_(keys[i:i + chunk_size]))):
+            yield dict(row)
+
+
+def diff_rows(existing_rows_by_key, new_rows_by_key):
+    """
+    Compare two maps of primary key to table row.
+
+    Returns:
+        (rows to insert, rows to update, keys to delete)
+    """
+    inserts = []
+    updates = []
+    for key, row in new_rows_by_key.items():
+        existing = existing_rows_by_key.get(key)
+        if existing is None:
+            inserts.append(row)
+        elif existing != row:
+            updates.append(row)
+    deletes = [ key for key in existing_rows_by_key if key not in new_rows_by_key ]
+    return inserts, updates, deletes
+
+
+def update_rows(connection, table, key_column, rows):
+    if rows:
+        statement = table.update().where(key_column == bindparam("_key"))
+        connection.execute(statement, [ dict(row, _key=row[key_column.name]) for row in rows ])
+    return len(rows)
+
+
+def delete_rows_in(connection, table, column, keys, chunk_size=500):
+    """ Delete rows of `table` whose `column` is one of `keys`, returning the number of rows deleted """
+    deleted = 0
+    keys = list(keys)
+    for i in range(0, len(keys), chunk_size):
+        deleted += connection.execute(table.delete().where(column.in_(keys[i:i + chunk_size]))).rowcount
+    return deleted
+
+
+def apply_data_changes(db, companies_path, people_path, foods_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Update a previously imported database to match the JSON data files by
+    applying only the row differences, in a single transaction.
+
+    People are streamed and compared in chunks of `batch_size` against the
+    rows already stored for the same ids.
+
+    Returns:
+        map of table name to [inserted, updated, deleted] row counts
+    """
+    company_table = Company.__table__
+    person_table = Person.__table__
+    food_table = Food.__table__
+    stats_table = CompanyStats.__table__
+
+    counts = { table.name: [0, 0, 0] for table in (company_table, food_table, person_table, favourite_food_table, friendship, stats_table) }
+
+    def count(table, inserted=0, updated=0, deleted=0):
+        totals = counts[table.name]
+        totals[0] += inserted
+        totals[1] += updated
+        totals[2] += deleted
+
+    company_rows_by_id = build_company_rows(read_json_file(companies_path))
+    foods_json = read_json_file(foods_path)
+    friend_ids_for_person_id = {}
+    used_food_ids = set()
+
+    with db.engine.begin() as connection:
+        # companies are inserted/updated up front, and deleted once nobody can reference them
+        existing_companies = { row["cid"]: dict(row) for row in connection.execute(company_table.select()) }
+        inserts, updates, company_deletes = diff_rows(existing_companies, company_rows_by_id)
+        count(company_table,
+              insert_rows(connection, company_table, inserts, batch_size),
+              update_rows(connection, company_table, company_table.c.cid, updates))
+
+        existing_foods = { row["id"]: dict(row) for row in connection.execute(food_table.select()) }
+
+        for person_rows_by_id, food_rows_by_id, favourite_rows in iter_people_row_chunks(
+                iter_json_array(people_path), foods_json, company_rows_by_id, friend_ids_for_person_id, batch_size):
+
+            # foods first seen in this chunk
+            used_food_ids.update(food_rows_by_id)
+            existing = { fid: existing_foods[fid] for fid in food_rows_by_id if fid in existing_foods }
+            inserts, updates, _ = diff_rows(existing, food_rows_by_id)
+            count(food_table,
+                  insert_rows(connection, food_table, inserts, batch_size),
+                  update_rows(connection, food_table, food_table.c.id, updates))
+
+            existing = { row["pid"]: row for row in select_rows_in(connection, person_table, person_table.c.pid, person_rows_by_id) }
+            inserts, updates, _ = diff_rows(existing, person_rows_by_id)
+            count(person_table,
+                  insert_rows(connection, person_table, inserts, batch_size),
+                  update_rows(connection, person_table, person_table.c.pid, updates))
+
+            # a person's favourites are replaced as a whole when they differ
+            favourites_by_person_id = { pid: [] for pid in person_rows_by_id }
+            for row in favourite_rows:
+                favourites_by_person_id[row["person_id"]].append(row["food_id"])
+            existing = { pid: [] for pid in person_rows_by_id }
+            for row in select_rows_in(connection, favourite_food_table, favourite_food_table.c.person_id, person_rows_by_id):
+                existing[row["person_id"]].append(row["food_id"])
+            changed = [ pid for pid, food_ids in favourites_by_person_id.items() if sorted(food_ids) != sorted(existing[pid]) ]
+            if changed:
+                deleted = delete_rows_in(connection, favourite_food_table, favourite_food_table.c.person_id, changed)
+                inserted = insert_rows(connection, favourite_food_table,
+                    [ {"person_id": pid, "food_id": fid} for pid in changed for fid in favourites_by_person_id[pid] ], batch_size)
+                count(favourite_food_table, inserted, deleted=deleted)
+
+        # friendships are small (two ints) so they are compared as a whole
+        new_friendships = set(resolve_friendships(friend_ids_for_person_id))
+        existing_friendships = set(tuple(row) for row in connection.execute(
+            select([friendship.c.person_id, friendship.c.friend_id])))
+        removed = existing_friendships - new_friendships
+        if removed:
+            statement = friendship.delete().where(and_(friendship.c.person_id == bindparam("_person_id"),
+                                                       friendship.c.friend_id == bindparam("_friend_id")))
+            connection.execute(statement, [ {"_person_id": a, "_friend_id": b} for a, b in removed ])
+        count(friendship,
+              insert_rows(connection, friendship,
+                  ( {"person_id": a, "friend_id": b} for a, b in sorted(new_friendships - existing_friendships) ), batch_size),
+              deleted=len(removed))
+
+        # people no longer present in the data files
+        existing_person_ids = set(pid for (pid,) in connection.execute(select([person_table.c.pid])))
+        removed = existing_person_ids - friend_ids_for_person_id.keys()
+        count(favourite_food_table, deleted=delete_rows_in(connection, favourite_food_table, favourite_food_table.c.person_id, removed))
+        count(person_table, deleted=delete_rows_in(connection, person_table, person_table.c.pid, removed))
+
+        count(food_table, deleted=delete_rows_in(connection, food_table, food_table.c.id, set(existing_foods) - used_food_ids))
+
+        # company statistics are small, so they are rebuilt whatever changed (and
+        # cleared before companies are deleted, as they reference them)
+        count(stats_table, deleted=connection.execute(stats_table.delete()).rowcount)
+        count(company_table, deleted=delete_rows_in(connection, company_table, company_table.c.cid, company_deletes))
+        count(stats_table, insert_rows(connection, stats_table, build_company_stats_rows(connection).values(), batch_size))
+
+    return counts
+
+
+def sync_local_data(db, companies_path, people_path, foods_path, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    """
+    Bring a persistent database up to date with the JSON data files.
+
+    The data files are fingerprinted and compared with the manifest stored
+    by the previous import:
+     - unchanged files: the existing database is reused as-is
+     - no previous import, or a schema change: the database is rebuilt with a full bulk import
+     - otherwise: only the row differences are applied
+
+    The dataset version stored in the manifest is incremented whenever the
+    data changes. `workers` is passed on to `import_local_data` for full imports.
+
+    Returns:
+        one of "unchanged", "imported" or "updated"
+    """
+    paths_by_name = {"companies": companies_path, "people": people_path, "foods": foods_path}
+
+    previous = read_manifest(db)
+    current = build_manifest(paths_by_name, previous)
+    changed = changed_entries(previous, current)
+
+    if not changed:
+        if current != previous:
+            # touched but identical files; remember the new mtimes to skip re-hashing next time
+            write_manifest(db, current)
+        print(" - data files unchanged, reusing existing database")
+        return "unchanged"
+
+    if not previous or SCHEMA_ENTRY in changed:
+        db.reset()
+        import_local_data(db, companies_path, people_path, foods_path, bulk=True, batch_size=batch_size, workers=workers)
+        status = "imported"
+    else:
+        print(" - data files changed: {}".format(", ".join(changed)))
+        counts = apply_data_changes(db, companies_path, people_path, foods_path, batch_size)
+        for table_name, (inserted, updated, deleted) in counts.items():
+            print(" - {}: {} inserted, {} updated, {} deleted".format(table_name, inserted, updated, deleted))
+        status = "updated"
+
+    write_manifest(db, with_next_version(current))
+    return status
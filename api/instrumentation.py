@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+
+
+# statistics of the queries run by the current thread, if it is collecting them
+_local = threading.local()
+
+
+class QueryStats(object):
+    """ Number of SQL statements executed, rows fetched and seconds spent executing """
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, other):
+        self.statements += other.statements
+        self.rows += other.rows
+        self.seconds += other.seconds
+
+    def header_value(self):
+        """ Format for the `X-Query-Stats` response header """
+        return "statements={}; rows={}; time_ms={:.3f}".format(self.statements, self.rows, self.seconds * 1000)
+
+
+@contextmanager
+def collect_query_stats():
+    """
+    Collect `QueryStats` for the queries run by the current thread within
+    this scope, i.e. by one service call
+    """
+    stats = QueryStats()
+    previous = getattr(_local, "stats", None)
+    _local.stats = stats
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
+
+
+def run_with_query_stats(method, *args):
+    """ Call `method(*args)`, returning (result, `QueryStats`) """
+    with collect_query_stats() as stats:
+        result = method(*args)
+    return result, stats
+
+
+class CountingCursor(sqlite3.Cursor):
+    """ SQLite cursor counting the rows fetched into the collecting thread's `QueryStats` """
+    def _count(self, rows):
+        stats = getattr(_local, "stats", None)
+        if stats is not None:
+            stats.rows += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count((row,))
+        return row
+
+    def fetchmany(self, *args):
+        return self._count(super().fetchmany(*args))
+
+    def fetchall(self):
+        return self._count(super().fetchall())
+
+
+class CountingConnection(sqlite3.Connection):
+    """ SQLite connection creating `CountingCursor`s (pass as `factory` to `sqlite3.connect`) """
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def instrument_engine(engine):
+    """ Time and count the statements executed on `engine` for threads collecting `QueryStats` """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if getattr(_local, "stats", None) is not None:
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(_local, "stats", None)
+        if stats is not None and conn.info.get("query_start"):
+            stats.statements += 1
+            stats.seconds += time.perf_counter() - conn.info["query_start"].pop()
+
+    return engine
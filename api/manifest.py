@@ -0,0 +1,101 @@
+from collections import namedtuple
+import hashlib
+import os
+
+from api.model import ImportManifest, SCHEMA_VERSION
+
+
+# manifest entry recording the schema the database was built with
+SCHEMA_ENTRY = "schema"
+
+# manifest entry holding the dataset version number (as its digest), which
+# is incremented by every import that changes the data
+VERSION_ENTRY = "version"
+
+# bytes hashed per read when fingerprinting a data file
+HASH_CHUNK_SIZE = 1 << 20
+
+
+Fingerprint = namedtuple("Fingerprint", ["size", "mtime", "digest"])
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(paths_by_name, previous=None):
+    """
+    Fingerprint data files.
+
+    A file's content hash is only recomputed when its size or mtime differs
+    from the `previous` manifest.
+
+    Args:
+        paths_by_name: map of manifest entry name to data file path
+        previous: manifest as returned by `read_manifest`, if any
+
+    Returns:
+        map of entry name to `Fingerprint`, including the schema version and
+        the dataset version carried over from `previous`
+    """
+    previous = previous or {}
+    manifest = {
+        SCHEMA_ENTRY: Fingerprint(0, 0.0, str(SCHEMA_VERSION)),
+        VERSION_ENTRY: Fingerprint(0, 0.0, str(dataset_version(previous)))
+    }
+
+    for name, path in paths_by_name.items():
+        stat = os.stat(path)
+        known = previous.get(name)
+        if known and known.size == stat.st_size and known.mtime == stat.st_mtime:
+            digest = known.digest
+        else:
+            digest = hash_file(path)
+        manifest[name] = Fingerprint(stat.st_size, stat.st_mtime, digest)
+
+    return manifest
+
+
+def changed_entries(previous, current):
+    """ Return names of manifest entries whose content differs """
+    return sorted(name for name in set(previous) | set(current) if name != VERSION_ENTRY and (
+                  name not in previous or name not in current or previous[name].digest != current[name].digest))
+
+
+def dataset_version(manifest):
+    """ Return the dataset version recorded in a manifest, 0 if none """
+    entry = manifest.get(VERSION_ENTRY)
+    return int(entry.digest) if entry else 0
+
+
+def with_next_version(manifest):
+    """ Return a copy of `manifest` with its dataset version incremented """
+    manifest = dict(manifest)
+    manifest[VERSION_ENTRY] = Fingerprint(0, 0.0, str(dataset_version(manifest) + 1))
+    return manifest
+
+
+def read_manifest(db):
+    """ Return the manifest stored in the database (empty if nothing has been imported) """
+    with db.engine.connect() as connection:
+        rows = connection.execute(ImportManifest.__table__.select())
+        return { row.name: Fingerprint(row.size, row.mtime, row.digest) for row in rows }
+
+
+def read_dataset_version(db):
+    """ Return the version of the data imported into the database, 0 if unknown """
+    return dataset_version(read_manifest(db))
+
+
+def write_manifest(db, manifest):
+    table = ImportManifest.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.delete())
+        connection.execute(table.insert(), [
+            {"name": name, "size": f.size, "mtime": f.mtime, "digest": f.digest}
+            for name, f in manifest.items()
+        ])
@@ -0,0 +1,122 @@
+from bisect import bisect_left
+
+
+# upper bounds of the request and database time histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# upper bounds of the response size histogram buckets, in bytes
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+# prefix of every exported metric name
+METRIC_PREFIX = "paranuara_"
+
+# content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram(object):
+    """
+    Counts of observed values per bucket, as a Prometheus histogram.
+    `counts[b]` is the number of values in (bounds[b - 1], bounds[b]], and
+    the last count is of the values above every bound.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative_counts(self):
+        """ Yield ("le" label value, number of values up to the bound) for every bucket """
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), total
+
+
+class RouteMetrics(object):
+    """ Metrics of the requests of one route """
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        self.db_statements = 0
+        self.requests_by_status = {}
+
+
+class Metrics(object):
+    """
+    Request metrics of an `Endpoint`, by route.
+
+    Requests are recorded on the IOLoop thread once they have finished, so
+    no locking is needed. Each process keeps its own metrics, i.e. when
+    serving with several processes every scrape of `/metrics` reports the
+    process that answered it.
+    """
+    def __init__(self):
+        self.routes = {}
+
+    def observe(self, route, status, seconds, response_bytes, query_stats=None):
+        """
+        Record a finished request of `route`: its status code, latency in
+        seconds, response body size and `QueryStats` (if collected)
+        """
+        metrics = self.routes.get(route)
+        if metrics is None:
+            metrics = self.routes[route] = RouteMetrics()
+
+        metrics.latency.observe(seconds)
+        metrics.response_bytes.observe(response_bytes)
+        metrics.requests_by_status[status] = metrics.requests_by_status.get(status, 0) + 1
+        if query_stats is not None:
+            metrics.db_time.observe(query_stats.seconds)
+            metrics.db_statements += query_stats.statements
+
+    def render(self):
+        """ Return all metrics in the Prometheus text exposition format """
+        lines = []
+        routes = sorted(self.routes.items())
+
+        def histogram(name, help_text, attribute):
+            lines.append("# HELP {}{} {}".format(METRIC_PREFIX, name, help_text))
+            lines.append("# TYPE {}{} histogram".format(METRIC_PREFIX, name))
+            for route, metrics in routes:
+                h = getattr(metrics, attribute)
+                labels = 'route="{}"'.format(escape_label_value(route))
+                for le, count in h.cumulative_counts():
+                    lines.append('{}{}_bucket{{{},le="{}"}} {}'.format(METRIC_PREFIX, name, labels, le, count))
+                lines.append("{}{}_sum{{{}}} {!r}".format(METRIC_PREFIX, name, labels, h.sum))
+                lines.append("{}{}_count{{{}}} {}".format(METRIC_PREFIX, name, labels, h.count))
+
+        lines.append("# HELP {}requests_total Requests finished, by route and status code".format(METRIC_PREFIX))
+        lines.append("# TYPE {}requests_total counter".format(METRIC_PREFIX))
+        for route, metrics in routes:
+            for status, count in sorted(metrics.requests_by_status.items()):
+                lines.append('{}requests_total{{route="{}",status="{}"}} {}'.format(METRIC_PREFIX, escape_label_value(route), status, count))
+
+        histogram("request_duration_seconds", "Time from the start of a request to its response being finished", "latency")
+        histogram("response_size_bytes", "Size of response bodies", "response_bytes")
+        histogram("db_duration_seconds", "Time spent executing SQL statements per request", "db_time")
+
+        lines.append("# HELP {}db_statements_total SQL statements executed, by route".format(METRIC_PREFIX))
+        lines.append("# TYPE {}db_statements_total counter".format(METRIC_PREFIX))
+        for route, metrics in routes:
+            lines.append('{}db_statements_total{{route="{}"}} {}'.format(METRIC_PREFIX, escape_label_value(route), metrics.db_statements))
+
+        return "\n".join(lines) + "\n"
+
+
+def escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def route_label(pattern):
+    """ Label a route by its URL pattern, e.g. "/person/{id}" for r"/person/([0-9]+)" """
+    return pattern.replace("([0-9]+)", "{id}")
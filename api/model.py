@@ -1,18 +1,92 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Table, UniqueConstraint
+import enum
+import json
+
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Index, Integer, SmallInteger, String, Table, Text, UniqueConstraint, event, inspect
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 
 from api.database import Base, Database, read_scope, write_scope
 
 
+# bump whenever a table definition changes so that a persisted database is
+# rebuilt rather than incrementally updated
+SCHEMA_VERSION = 5
+
+
+class FoodCategory(enum.IntEnum):
+    OTHER = 0
+    FRUIT = 1
+    VEGETABLE = 2
+
+    @classmethod
+    def coerce(cls, value):
+        """ Return the category of a category name (as in foods.json) or number """
+        if isinstance(value, str):
+            return cls.__members__.get(value.upper(), cls.OTHER)
+        return cls(value)
+
+
+class FoodCategoryType(TypeDecorator):
+    """ Stores a `FoodCategory`, or its name, as a small integer """
+    impl = SmallInteger
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(FoodCategory.coerce(value))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else FoodCategory(value)
+
+
+class IdList(TypeDecorator):
+    """ Stores a list of ids as a JSON array """
+    impl = Text
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else json.dumps(list(value))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else json.loads(value)
+
+
+class CountMap(TypeDecorator):
+    """ Stores a map of name to count as a JSON object """
+    impl = Text
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else json.dumps(value, sort_keys=True)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else json.loads(value)
+
+
+def split_food_ids(food_categories):
+    """
+    Split (food id, category) pairs into (fruit ids, vegetable ids) in
+    one pass, keeping their order. Categories may be names or `FoodCategory`s.
+    """
+    fruit_ids = []
+    vegetable_ids = []
+    for food_id, category in food_categories:
+        category = FoodCategory.coerce(category)
+        if category == FoodCategory.FRUIT:
+            fruit_ids.append(food_id)
+        elif category == FoodCategory.VEGETABLE:
+            vegetable_ids.append(food_id)
+    return fruit_ids, vegetable_ids
+
+
 class Food(Base):
     __tablename__ = 'food'
     id = Column(String(32), primary_key=True)
-    category = Column(String(32))
+    category = Column(FoodCategoryType)
 
 
 favourite_food_table = Table('favourites', Base.metadata,
     Column('person_id', Integer, ForeignKey('person.pid')),
-    Column('food_id', String, ForeignKey('food.id'))
+    Column('food_id', String, ForeignKey('food.id')),
+    # covering indexes for looking up favourites by person and by food
+    Index('ix_favourites_person_food', 'person_id', 'food_id'),
+    Index('ix_favourites_food_person', 'food_id', 'person_id')
 )
 
 
@@ -26,9 +100,11 @@ class Company(Base):
 friendship = Table(
     'friendship',
     Base.metadata,
-    Column('person_id', Integer, ForeignKey('person.pid'), index=True),
+    Column('person_id', Integer, ForeignKey('person.pid')),
     Column('friend_id', Integer, ForeignKey('person.pid')),
-    UniqueConstraint('person_id', 'friend_id', name='unique_friendship')) # prohibit `Person` from befriending itself
+    UniqueConstraint('person_id', 'friend_id', name='unique_friendship'), # prohibit `Person` from befriending itself
+    # the unique constraint's index covers lookups by person, this one lookups by friend
+    Index('ix_friendship_friend_person', 'friend_id', 'person_id'))
 
 
 class Person(Base):
@@ -44,6 +120,12 @@ class Person(Base):
 
     company_id = Column(Integer, ForeignKey('company.cid'))
 
+    # favourite foods by category, denormalized from `favourite_foods` at import
+    # (and by the mapper events below for ORM writes) so that a person can be
+    # served from their row alone
+    fruit_ids = Column(IdList)
+    vegetable_ids = Column(IdList)
+
     # a self-referential many-to-many relationship
     friends = relationship('Person',
                            secondary=friendship,
@@ -53,7 +135,56 @@ class Person(Base):
     # many-to-many foods relationship
     favourite_foods = relationship("Food", secondary=favourite_food_table)
 
+    # covers employee lookups and pagination (company_id = ? AND pid > ? ORDER BY pid)
+    __table_args__ = (Index('ix_person_company_pid_email', 'company_id', 'pid', 'email'),)
+
     def befriend(self, friend):
         if friend not in self.friends:
             self.friends.append(friend)
             friend.friends.append(self)
+
+
+@event.listens_for(Person, "before_insert")
+def categorise_favourite_foods(mapper, connection, person):
+    """ Denormalize the favourite foods of people added through the ORM """
+    person.fruit_ids, person.vegetable_ids = split_food_ids((f.id, f.category) for f in person.favourite_foods)
+
+
+@event.listens_for(Person, "before_update")
+def recategorise_favourite_foods(mapper, connection, person):
+    """ Keep the denormalized favourite foods of people updated through the ORM in step """
+    if inspect(person).attrs.favourite_foods.history.has_changes():
+        categorise_favourite_foods(mapper, connection, person)
+
+
+class CompanyStats(Base):
+    """
+    Aggregates of a company's employees, materialized at import (see
+    `api.import_data.refresh_company_stats`) so that they are served
+    without reading every employee.
+    """
+    __tablename__ = 'company_stats'
+    company_id = Column(Integer, ForeignKey('company.cid'), primary_key=True)
+    headcount = Column(Integer)
+    alive_count = Column(Integer)
+    age_min = Column(Integer)
+    age_max = Column(Integer)
+    # sum and number of the employees' known ages (a person's age may be unset)
+    age_sum = Column(Integer)
+    age_count = Column(Integer)
+    # number of employees per age bucket, e.g. {"30-39": 4}
+    age_distribution = Column(CountMap)
+    # number of employees liking each fruit, and each vegetable
+    fruit_counts = Column(CountMap)
+    vegetable_counts = Column(CountMap)
+
+
+class ImportManifest(Base):
+    """
+    Fingerprint of a data file as of the last import into this database.
+    """
+    __tablename__ = 'import_manifest'
+    name = Column(String(32), primary_key=True)
+    size = Column(Integer)
+    mtime = Column(Float)
+    digest = Column(String(64))
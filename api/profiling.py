@@ -0,0 +1,168 @@
+from collections import Counter
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+
+
+# capture modes: deterministic profiling of every call, or periodic samples of the call stacks
+PROFILE_MODES = ("cprofile", "sample")
+
+# seconds between stack samples
+DEFAULT_SAMPLE_INTERVAL = 0.001
+
+# functions listed in pstats output
+PSTATS_LIMIT = 50
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+class Profiler(object):
+    """
+    Profile of the service calls made by requests to one route.
+
+    Service calls run on the executor's threads, so each call is profiled
+    on its own thread (the IOLoop thread interleaves concurrent requests):
+     - "cprofile": each call runs under `cProfile`, and the results are
+       merged into one `pstats.Stats`. Profiled calls run one at a time,
+       as a thread can only be profiled by one profiler at a time
+     - "sample": a sampler thread records the call stacks of the threads
+       running profiled calls every `sample_interval` seconds, which are
+       returned as collapsed stacks for flame graphs
+
+    Args:
+        route: label of the profiled route (see `api.metrics.route_label`)
+        mode: one of `PROFILE_MODES`
+        max_requests: number of requests to profile, None for no limit
+        on_complete: called once `max_requests` requests have finished
+    """
+    def __init__(self, route, mode="cprofile", max_requests=None, on_complete=None, sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError("unknown profile mode '{}'".format(mode))
+        self.route = route
+        self.mode = mode
+        self.max_requests = max_requests
+        self.on_complete = on_complete
+        self.sample_interval = sample_interval
+
+        self.requests = 0
+        self.calls = 0
+        self.stats = None
+        self.stack_counts = Counter()
+
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        self._sampled_threads = Counter()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def run(self, method, *args):
+        """ Call `method(*args)` on the current thread, profiling it """
+        if self.mode == "cprofile":
+            with self._profile_lock:
+                profile = cProfile.Profile()
+                try:
+                    return profile.runcall(method, *args)
+                finally:
+                    with self._lock:
+                        self.calls += 1
+                        if self.stats is None:
+                            self.stats = pstats.Stats(profile)
+                        else:
+                            self.stats.add(profile)
+
+        ident = threading.get_ident()
+        with self._lock:
+            self.calls += 1
+            self._sampled_threads[ident] += 1
+        try:
+            return method(*args)
+        finally:
+            with self._lock:
+                self._sampled_threads[ident] -= 1
+                if not self._sampled_threads[ident]:
+                    del self._sampled_threads[ident]
+
+    def request_finished(self):
+        """ Count a finished request of the route, completing the capture once `max_requests` have finished """
+        self.requests += 1
+        if self.max_requests is not None and self.requests == self.max_requests and self.on_complete:
+            self.on_complete()
+
+    def _sample(self):
+        while not self._stopped.wait(self.sample_interval):
+            with self._lock:
+                idents = list(self._sampled_threads)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stack_counts[collapse_stack(frame)] += 1
+
+    def pstats_text(self, sort="cumulative", limit=PSTATS_LIMIT):
+        """ Return the merged `cProfile` statistics as printed by `pstats` """
+        if self.stats is None:
+            return "no calls profiled\n"
+        output = io.StringIO()
+        self.stats.stream = output
+        self.stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def collapsed_stacks(self):
+        """ Return the sampled stacks as "outer;...;inner count" lines (the input format of flamegraph.pl) """
+        return "".join("{} {}\n".format(stack, count) for stack, count in self.stack_counts.most_common())
+
+
+def collapse_stack(frame):
+    """ Return the call stack ending in `frame` as "file:function;..." from the outermost call """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class RequestProfiling(object):
+    """
+    The profile being captured by an `Endpoint`, if any; one capture runs at a time
+
+    Args:
+        routes: labels of the routes that may be profiled
+    """
+    def __init__(self, routes=()):
+        self.routes = set(routes)
+        self.profiler = None
+
+    def start(self, profiler):
+        if self.profiler is not None:
+            raise ProfilerBusyError("a profile of route '{}' is already being captured".format(self.profiler.route))
+        self.profiler = profiler
+        profiler.start()
+
+    def stop(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.stop()
+        return profiler
+
+    def profiler_for(self, route):
+        """ Return the profiler of the capture in progress if it profiles `route`, else None """
+        profiler = self.profiler
+        if profiler is not None and profiler.route == route:
+            return profiler
+        return None
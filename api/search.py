@@ -0,0 +1,208 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import heapq
+
+from sqlalchemy import select
+
+from api.model import Person
+from api.service import DEFAULT_PAGE_SIZE
+from api.snapshot import NO_COMPANY, UNKNOWN_AGE, Postings
+
+
+# search over people's attributes. Unset (None) attributes match everyone;
+# a person matches `foods` if all of them are among their favourites
+PeopleQuery = namedtuple("PeopleQuery", ["age_min", "age_max", "eye_color", "alive", "company_id", "foods"])
+PeopleQuery.__new__.__defaults__ = (None, None, None, None, None, ())
+
+# one filter of a query: the index it reads, the keys of its postings, the
+# number of people it matches, and whether the person at a position matches it
+SearchFilter = namedtuple("SearchFilter", ["index", "keys", "estimate", "matches"])
+
+
+class PeopleIndex(object):
+    """
+    Attribute indexes for searching people.
+
+    People are addressed by their position `i` in `pids` (sorted ascending),
+    as in `Snapshot`. Each index is a `Postings` of an attribute value to
+    the positions of the people having it (sorted): `age` (known ages only,
+    so people of unknown age never match an age range), `eye_color` (by
+    code into `eye_colors`), `alive`, `company_id` and `food` (favourite
+    fruits and vegetables, by code into `food_ids`). The per-person
+    attribute arrays are kept to test candidates in constant time.
+
+    A search estimates the number of people each of its filters matches
+    from the lengths of their postings. It then scans the postings of the
+    most selective filter in position order, i.e. by id, and tests the
+    other filters on each candidate, most selective first, until a page of
+    matches has been found.
+
+    Attributes:
+        pids: person ids, sorted
+        ages, alive, eye_color_codes, company_ids: person attributes by position
+            (`ages` holds `UNKNOWN_AGE` where unknown)
+        age_known: 1 if the person's age is known, by position
+        eye_colors, food_ids: names of the eye colour and food codes
+        postings: map of index name to its `Postings`
+    """
+    def __init__(self, pids, ages, age_known, alive, eye_colors, eye_color_codes, company_ids, food_ids, postings):
+        self.pids = pids
+        self.ages = ages
+        self.age_known = age_known
+        self.alive = alive
+        self.eye_colors = eye_colors
+        self.eye_color_codes = eye_color_codes
+        self.company_ids = company_ids
+        self.food_ids = food_ids
+        self.postings = postings
+
+        self.eye_color_code = { eye_color: code for code, eye_color in enumerate(eye_colors) }
+        self.food_code = { food_id: code for code, food_id in enumerate(food_ids) }
+        self.age_keys = list(postings["age"])
+
+    @classmethod
+    def build(cls, pids, ages, age_known, alive, eye_colors, eye_color_codes, company_ids, food_ids, food_postings):
+        """ Index people's attributes, given the `Postings` of each food code """
+        postings = {
+            "age": cls.group_ages(ages, age_known),
+            "eye_color": Postings.group(eye_color_codes),
+            "alive": Postings.group(alive),
+            "company_id": Postings.group(company_ids),
+            "food": food_postings
+        }
+        return cls(pids, ages, age_known, alive, eye_colors, eye_color_codes, company_ids, food_ids, postings)
+
+    @staticmethod
+    def group_ages(ages, age_known):
+        """ `Postings` of each known age to the positions of the people having it """
+        positions_by_age = {}
+        for i, age in enumerate(ages):
+            if age_known[i]:
+                positions_by_age.setdefault(age, array('i')).append(i)
+        return Postings(*Postings.encode(positions_by_age))
+
+    @staticmethod
+    def group_foods(num_people, num_foods, food_lists):
+        """
+        `Postings` of each food code to the positions of the people liking
+        it, from CSR (offsets, codes) lists of favourite foods
+        """
+        positions_by_code = [ array('i') for _ in range(num_foods) ]
+        for offsets, codes in food_lists:
+            for i in range(num_people):
+                for code in codes[offsets[i]:offsets[i + 1]]:
+                    positions = positions_by_code[code]
+                    # a food listed twice by a person is indexed once
+                    if not positions or positions[-1] != i:
+                        positions.append(i)
+        return Postings(*Postings.encode(dict(enumerate(positions_by_code))))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """ Index the people of a `Snapshot`, sharing its arrays """
+        food_postings = cls.group_foods(len(snapshot.pids), len(snapshot.food_ids),
+                                        ((snapshot.fruit_offsets, snapshot.fruit_codes),
+                                         (snapshot.vegetable_offsets, snapshot.vegetable_codes)))
+        return cls.build(snapshot.pids, snapshot.ages, snapshot.age_known, snapshot.alive, snapshot.eye_colors, snapshot.eye_color_codes,
+                         snapshot.company_ids, snapshot.food_ids, food_postings)
+
+    @classmethod
+    def from_database(cls, db):
+        """ Index the people imported into `db` """
+        person = Person.__table__
+        pids = array('q')
+        ages = array('i')
+        age_known = bytearray()
+        alive = bytearray()
+        eye_colors, eye_color_codes, eye_color_code = [], array('H'), {}
+        company_ids = array('q')
+        food_ids, food_offsets, food_codes, food_code = [], array('q', [0]), array('H'), {}
+
+        with db.engine.connect() as connection:
+            for row in connection.execute(select([person.c.pid, person.c.age, person.c.alive, person.c.eye_color, person.c.company_id,
+                                                  person.c.fruit_ids, person.c.vegetable_ids]).order_by(person.c.pid)):
+                pids.append(row.pid)
+                ages.append(row.age if row.age is not None else UNKNOWN_AGE)
+                age_known.append(1 if row.age is not None else 0)
+                alive.append(1 if row.alive else 0)
+                if row.eye_color not in eye_color_code:
+                    eye_color_code[row.eye_color] = len(eye_colors)
+                    eye_colors.append(row.eye_color)
+                eye_color_codes.append(eye_color_code[row.eye_color])
+                company_ids.append(row.company_id if row.company_id is not None else NO_COMPANY)
+
+                for food_id in (row.fruit_ids or []) + (row.vegetable_ids or []):
+                    if food_id not in food_code:
+                        food_code[food_id] = len(food_ids)
+                        food_ids.append(food_id)
+                    food_codes.append(food_code[food_id])
+                food_offsets.append(len(food_codes))
+
+        food_postings = cls.group_foods(len(pids), len(food_ids), ((food_offsets, food_codes),))
+        return cls.build(pids, ages, age_known, alive, eye_colors, eye_color_codes, company_ids, food_ids, food_postings)
+
+    def plan(self, query):
+        """ Return the `SearchFilter`s of a `PeopleQuery`, most selective first """
+        filters = []
+
+        def add(index, keys, matches):
+            postings = self.postings[index]
+            keys = [ key for key in keys if key in postings ]
+            filters.append(SearchFilter(index, keys, sum(len(postings[key]) for key in keys), matches))
+
+        if query.age_min is not None or query.age_max is not None:
+            age_min = query.age_min if query.age_min is not None else float("-inf")
+            age_max = query.age_max if query.age_max is not None else float("inf")
+            keys = self.age_keys[bisect_left(self.age_keys, age_min):bisect_right(self.age_keys, age_max)]
+            add("age", keys, lambda i: self.age_known[i] and age_min <= self.ages[i] <= age_max)
+        if query.eye_color is not None:
+            eye_color = self.eye_color_code.get(query.eye_color)
+            add("eye_color", [eye_color] if eye_color is not None else [], lambda i: self.eye_color_codes[i] == eye_color)
+        if query.alive is not None:
+            alive = 1 if query.alive else 0
+            add("alive", [alive], lambda i: self.alive[i] == alive)
+        if query.company_id is not None:
+            add("company_id", [query.company_id] if query.company_id != NO_COMPANY else [],
+                lambda i: self.company_ids[i] == query.company_id)
+        for food in set(query.foods):
+            food = self.food_code.get(food)
+            add("food", [food] if food is not None else [], self._food_test(food))
+
+        filters.sort(key=lambda f: f.estimate)
+        return filters
+
+    def _food_test(self, code):
+        positions = self.postings["food"].get(code, ()) if code is not None else ()
+
+        def likes(i):
+            k = bisect_left(positions, i)
+            return k < len(positions) and positions[k] == i
+        return likes
+
+    def search(self, query, after_id=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Find people matching a `PeopleQuery`, ordered by id.
+
+        Returns:
+            (ids of up to `limit` matching people with ids above `after_id`,
+             the `after_id` of the next page, None if this is the last page)
+        """
+        start = bisect_right(self.pids, after_id) if after_id is not None else 0
+        filters = self.plan(query)
+
+        if filters:
+            postings = self.postings[filters[0].index]
+            candidates = heapq.merge(*[ postings[key][bisect_left(postings[key], start):] for key in filters[0].keys ])
+            tests = [ f.matches for f in filters[1:] ]
+        else:
+            candidates = range(start, len(self.pids))
+            tests = []
+
+        page = []
+        for i in candidates:
+            if all(matches(i) for matches in tests):
+                if len(page) == limit:
+                    return page, page[-1]
+                page.append(self.pids[i])
+        return page, None
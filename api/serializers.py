@@ -0,0 +1,92 @@
+import json
+
+# optional faster JSON encoders, the fastest one installed is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+#
+# Serializers turn the records returned by a service into the JSON-ready
+# values of each response, touching every attribute once. `dumps` then
+# encodes a response with the fastest available JSON library.
+#
+
+
+def serialize_employee(person):
+    """ Serialize a person as listed by GET /company/{id}/employee """
+    return {"pid": person.pid, "email": person.email}
+
+
+def serialize_person(person):
+    """ Serialize a person as returned by GET /person/{id} (foods are categorised at import) """
+    return {"username": person.email, "age": person.age,
+            "fruits": list(person.fruit_ids or ()), "vegetables": list(person.vegetable_ids or ())}
+
+
+def serialize_person_summary(person):
+    """ Serialize a person as compared by GET /person/{id}/compare """
+    return {"id": person.pid, "name": person.name, "age": person.age, "address": person.address, "phone": person.phone}
+
+
+def serialize_search_result(person):
+    """ Serialize a person as listed by GET /person/search """
+    return {"id": person.pid, "name": person.name, "age": person.age, "eye_color": person.eye_color,
+            "alive": bool(person.alive), "company_id": person.company_id}
+
+
+def serialize_company_stats(stats):
+    """ Serialize the statistics of a company as returned by GET /company/{id}/stats """
+    return {
+        "id": stats.company_id,
+        "headcount": stats.headcount,
+        "alive": stats.alive_count,
+        "age": {
+            "min": stats.age_min,
+            "max": stats.age_max,
+            "mean": round(stats.age_sum / stats.age_count, 2) if stats.age_count else None,
+            # buckets from the youngest
+            "distribution": dict(sorted(stats.age_distribution.items(), key=lambda item: int(item[0].split("-")[0])))
+        },
+        "fruits": dict(sorted(stats.fruit_counts.items())),
+        "vegetables": dict(sorted(stats.vegetable_counts.items()))
+    }
+
+
+def serialize_comparison(this_person, other_person, common_friend_ids):
+    """ Serialize the result of a person comparison """
+    return {
+        "this": serialize_person_summary(this_person),
+        "other": serialize_person_summary(other_person),
+        "common_friend_ids": list(common_friend_ids)
+    }
+
+
+# reused rather than configured per call
+_JSON_ENCODER = json.JSONEncoder()
+
+
+def _stdlib_dumps(value):
+    return _JSON_ENCODER.encode(value).replace("</", "<\\/").encode("utf-8")
+
+
+# dumps(value): encode a JSON-ready value as UTF-8 JSON bytes. Whichever library
+# encodes it, "</" is escaped (as by `tornado.escape.json_encode`) so that the
+# JSON can be embedded in HTML
+if orjson is not None:
+    JSON_LIBRARY = "orjson"
+    def dumps(value):
+        return orjson.dumps(value).replace(b"</", b"<\\/")
+elif ujson is not None:
+    JSON_LIBRARY = "ujson"
+    def dumps(value):
+        return ujson.dumps(value, ensure_ascii=False).replace("</", "<\\/").encode("utf-8")
+else:
+    JSON_LIBRARY = "json"
+    dumps = _stdlib_dumps
@@ -1,7 +1,14 @@
-from api.model import Company, Person
+from api.model import Company, CompanyStats, Person, friendship
 from api.database import read_scope
 
-from sqlalchemy.orm import joinedload # TODO: doesn't belong here - need to move this into `database`
+from sqlalchemy import and_, func
+
+
+# employees per page when paginating, unless a limit is given
+DEFAULT_PAGE_SIZE = 100
+
+# person columns returned by comparisons
+COMPARISON_COLUMNS = (Person.pid, Person.name, Person.age, Person.address, Person.phone)
 
 
 class ServiceError(Exception):
@@ -21,29 +28,118 @@ class Service(object):
 
     def get_employees_by_company_id(self, cid):
         """
-        Return list of persons employed by a company
+        Return list of persons employed by a company.
+
+        A single query: the company is outer joined to its employees, so
+        that a known company without employees still returns a row.
+        """
+        with read_scope(self.db) as session:
+            rows = session.query(Company.cid, Person.pid, Person.email) \
+                .outerjoin(Person, Person.company_id == Company.cid) \
+                .filter(Company.cid == cid) \
+                .all()
+        if not rows:
+            raise UnknownInstanceError("unknown company id '{}'".format(cid))
+        return [ row for row in rows if row.pid is not None ]
+
+
+    def get_employees_page(self, cid, after_pid=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Return a page of persons employed by a company, ordered by id.
+
+        Uses keyset pagination: the page holds up to `limit` employees with
+        an id greater than `after_pid`. As in `get_employees_by_company_id`
+        the company is outer joined to the page, so this is a single query.
+
+        Returns:
+            (employees, next_after_pid) where `next_after_pid` is None on the last page
+        """
+        condition = Person.company_id == Company.cid
+        if after_pid is not None:
+            condition = and_(condition, Person.pid > after_pid)
+
+        with read_scope(self.db) as session:
+            # fetch one extra row to find out whether there is another page
+            rows = session.query(Company.cid, Person.pid, Person.email) \
+                .outerjoin(Person, condition) \
+                .filter(Company.cid == cid) \
+                .order_by(Person.pid) \
+                .limit(limit + 1) \
+                .all()
+
+        if not rows:
+            raise UnknownInstanceError("unknown company id '{}'".format(cid))
+        employees = [ row for row in rows if row.pid is not None ]
+        if len(employees) > limit:
+            return employees[:limit], employees[limit - 1].pid
+        return employees, None
+
+
+    def get_company_stats(self, cid):
+        """
+        Return the statistics of a company's employees, materialized at
+        import, with a single primary key fetch
         """
-        employees = []
         with read_scope(self.db) as session:
-            company = session.query(Company).filter_by(cid=cid).first()
-            if company:
-                for p in session.query(Person.pid, Person.email).filter_by(company_id=company.cid):
-                    employees.append(p)
-        if not company:
+            stats = session.query(CompanyStats).get(cid)
+        if stats is None:
             raise UnknownInstanceError("unknown company id '{}'".format(cid))
-        return employees
+        return stats
+
+
+    def get_all_company_stats(self):
+        """
+        Return the materialized statistics of every company, ordered by company id
+        """
+        with read_scope(self.db) as session:
+            return session.query(CompanyStats).order_by(CompanyStats.company_id).all()
 
 
     def get_person_by_id(self, person_id):
         """
-        Return person with {person_id}
+        Return person with {person_id}. Their favourite fruits and vegetables
+        are stored on the person row, so this is a single primary key fetch.
         """
-        person = None
         with read_scope(self.db) as session:
-            # we execute a joined load with 'foods' so that favourite_foods is still available
-            # after the DB session is closed/returned to connection pool
-            person = session.query(Person).options(joinedload('favourite_foods')).filter_by(pid=person_id).first()
-        return person
+            return session.query(Person).get(person_id)
+
+
+    def get_people_by_ids(self, person_ids):
+        """
+        Return map of person id to person for the known ids in `person_ids`,
+        using a single query
+        """
+        with read_scope(self.db) as session:
+            people = session.query(Person).filter(Person.pid.in_(list(person_ids))).all()
+        return { p.pid: p for p in people }
+
+
+    def get_person_comparisons(self, id_pairs):
+        """
+        Compare many pairs of people at once.
+
+        All people involved are fetched with one query, and the living
+        brown-eyed friends of all of them with another, after which each
+        pair's friends in common are intersected in memory.
+
+        Returns:
+            list of (this_person, other_person, common_friend_ids) in the order of
+            `id_pairs`, where an unknown person is None
+        """
+        person_ids = list(set(pid for pair in id_pairs for pid in pair))
+
+        with read_scope(self.db) as session:
+            people = { p.pid: p for p in session.query(*COMPARISON_COLUMNS).filter(Person.pid.in_(person_ids)) }
+
+            friend_ids = { pid: set() for pid in person_ids }
+            query = session.query(friendship.c.person_id, friendship.c.friend_id) \
+                .join(Person, Person.pid == friendship.c.friend_id) \
+                .filter(friendship.c.person_id.in_(person_ids), Person.alive == True, Person.eye_color == "brown")
+            for person_id, friend_id in query:
+                friend_ids[person_id].add(friend_id)
+
+        return [ (people.get(this_id), people.get(other_id), sorted(friend_ids[this_id] & friend_ids[other_id]))
+                 for this_id, other_id in id_pairs ]
 
 
     def get_person_comparison(self, this_person_id, other_person_id):
@@ -51,43 +147,49 @@ class Service(object):
         Fetch person info and friends in common
         """
         with read_scope(self.db) as session:
-            # we execute a joined load with 'person' so that friends is still available
-            # after the DB session is closed/returned to connection pool
-            this_person = session.query(Person).options(joinedload('friends')).filter_by(pid=this_person_id).first()
-            other_person = session.query(Person).options(joinedload('friends')).filter_by(pid=other_person_id).first()
-
-        if not this_person:
-            raise UnknownInstanceError("unknown person id '{}'".format(this_person_id))
-        if not other_person:
-            raise UnknownInstanceError("unknown id of other person '{}'".format(other_person_id))
-
-        # TODO: The below python set manipulation is absurdly inefficient for large datasets.
-        # We can do better than this with this SQL query:
-        #
-        # SELECT
-        #     *
-        # FROM (
-        #     SELECT
-        #         friend_id,
-        #         count(*) AS friend_count
-        #     FROM
-        #         friendship
-        #     WHERE
-        #         person_id IN (1, 2)
-        #     GROUP BY
-        #         friend_id
-        #     ) AS friendships
-        # INNER JOIN
-        #     person
-        # ON
-        #     person.id = friendships.friend_id
-        # WHERE
-        #     friendships.friend_count = 2
-        #     AND person.alive = True
-        #
-        # (need to transpose the above into the appropriate method calls for SQLAlchemy)
-        this_friends = set([ f.pid for f in this_person.friends if f.alive == True and f.eye_color == "brown" ])
-        other_friends = set([ f.pid for f in other_person.friends if f.alive == True and f.eye_color == "brown" ])
-        common = this_friends.intersection(other_friends)
+            people = { p.pid: p for p in session.query(*COMPARISON_COLUMNS).filter(Person.pid.in_([this_person_id, other_person_id])) }
+            this_person = people.get(this_person_id)
+            other_person = people.get(other_person_id)
+
+            if not this_person:
+                raise UnknownInstanceError("unknown person id '{}'".format(this_person_id))
+            if not other_person:
+                raise UnknownInstanceError("unknown id of other person '{}'".format(other_person_id))
+
+            common = self._query_common_friend_ids(session, this_person_id, other_person_id)
 
         return this_person, other_person, common
+
+
+    def _query_common_friend_ids(self, session, this_person_id, other_person_id):
+        """
+        Return ids of living, brown-eyed friends shared by both people.
+
+        The intersection is computed by the database rather than by loading
+        each person's friends, i.e.
+
+        SELECT person.pid
+        FROM (
+            SELECT friend_id FROM friendship
+            WHERE person_id IN (:this, :other)
+            GROUP BY friend_id
+            HAVING count(person_id) = 2
+        ) AS common
+        JOIN person ON person.pid = common.friend_id
+        WHERE person.alive AND person.eye_color = 'brown'
+        ORDER BY person.pid
+        """
+        person_ids = {this_person_id, other_person_id}
+
+        common = session.query(friendship.c.friend_id.label('friend_id')) \
+            .filter(friendship.c.person_id.in_(list(person_ids))) \
+            .group_by(friendship.c.friend_id) \
+            .having(func.count(friendship.c.person_id) == len(person_ids)) \
+            .subquery()
+
+        query = session.query(Person.pid) \
+            .join(common, Person.pid == common.c.friend_id) \
+            .filter(Person.alive == True, Person.eye_color == "brown") \
+            .order_by(Person.pid)
+
+        return [pid for (pid,) in query]
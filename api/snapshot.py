@@ -0,0 +1,338 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, namedtuple
+from collections.abc import Mapping
+
+from sqlalchemy import select
+
+from api.manifest import read_dataset_version
+from api.model import Company, CompanyStats, Person, friendship
+from api.service import UnknownInstanceError, DEFAULT_PAGE_SIZE
+
+
+# `company_ids` entry for people without an employer
+NO_COMPANY = -1
+
+# `ages` entry for people whose age is unknown (see `Snapshot.age_known`)
+UNKNOWN_AGE = -1
+
+# read-only records handed to the handlers in place of ORM models
+EmployeeRecord = namedtuple("EmployeeRecord", ["pid", "email"])
+PersonRecord = namedtuple("PersonRecord", ["pid", "name", "age", "address", "email", "phone", "eye_color", "alive",
+                                           "company_id", "fruit_ids", "vegetable_ids"])
+CompanyStatsRecord = namedtuple("CompanyStatsRecord", ["company_id", "headcount", "alive_count", "age_min", "age_max", "age_sum",
+                                                       "age_count", "age_distribution", "fruit_counts", "vegetable_counts"])
+
+
+class Postings(Mapping):
+    """
+    Read-only map of key to its values `values[offsets[k]:offsets[k + 1]]`,
+    where `k` is the position of the key in `keys` (sorted ascending)
+    """
+    def __init__(self, keys, offsets, values):
+        self.keys_ = keys
+        self.offsets = offsets
+        self.values_ = values
+
+    def __len__(self):
+        return len(self.keys_)
+
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __getitem__(self, key):
+        k = bisect_left(self.keys_, key)
+        if k == len(self.keys_) or self.keys_[k] != key:
+            raise KeyError(key)
+        return self.values_[self.offsets[k]:self.offsets[k + 1]]
+
+    @staticmethod
+    def encode(values_by_key):
+        """ Return the (keys, offsets, values) arrays of postings holding `values_by_key` """
+        keys = array('q', sorted(values_by_key))
+        offsets = array('q', [0])
+        values = array('i')
+        for key in keys:
+            values.extend(values_by_key[key])
+            offsets.append(len(values))
+        return keys, offsets, values
+
+    @classmethod
+    def group(cls, values):
+        """ Postings of each distinct value in `values` to the positions holding it (sorted) """
+        counts = Counter(values)
+        keys = array('q', sorted(counts))
+        offsets = array('q', [0])
+        for key in keys:
+            offsets.append(offsets[-1] + counts[key])
+        # a stable sort keeps each value's positions in order
+        return cls(keys, offsets, array('i', sorted(range(len(values)), key=values.__getitem__)))
+
+
+class Snapshot(object):
+    """
+    Immutable in-memory copy of the imported dataset, laid out for reads.
+
+    People are addressed by their position `i` in `pids` (sorted ascending).
+    Per-person attributes are parallel arrays indexed by position, and the
+    relations are stored in compressed sparse row (CSR) form, i.e. the
+    friends of person `i` are the positions
+    `friend_positions[friend_offsets[i]:friend_offsets[i + 1]]`.
+
+    Attributes:
+        pids: person ids, sorted
+        names, addresses, emails, phones: person strings by position
+        ages: person ages by position, `UNKNOWN_AGE` where unknown
+        age_known: 1 if the person's age is known, by position
+        alive: 1 if alive, by position
+        eye_colors: eye colour names, `eye_color_codes` indexes into this list
+        eye_color_codes: eye colour of each person, by position
+        company_ids: employer of each person, by position
+        friend_offsets, friend_positions: CSR friendship adjacency (positions sorted)
+        fruit_offsets, fruit_codes: CSR favourite fruits, indexing into `food_ids`
+        vegetable_offsets, vegetable_codes: CSR favourite vegetables, indexing into `food_ids`
+        food_ids: food ids referenced by `fruit_codes` and `vegetable_codes`
+        employee_positions_by_company_id: company id to positions of its employees (sorted)
+        dataset_version: version of the imported data the snapshot was taken from
+        company_stats: company id to the `CompanyStatsRecord` materialized at import
+    """
+    def __init__(self, pids, names, ages, addresses, emails, phones, alive, eye_colors, eye_color_codes,
+                 company_ids, friend_offsets, friend_positions, fruit_offsets, fruit_codes,
+                 vegetable_offsets, vegetable_codes, food_ids, employee_positions_by_company_id, dataset_version=0,
+                 company_stats=None, age_known=None):
+        self.pids = pids
+        self.names = names
+        self.ages = ages
+        self.addresses = addresses
+        self.emails = emails
+        self.phones = phones
+        self.alive = alive
+        self.eye_colors = eye_colors
+        self.eye_color_codes = eye_color_codes
+        self.company_ids = company_ids
+        self.friend_offsets = friend_offsets
+        self.friend_positions = friend_positions
+        self.fruit_offsets = fruit_offsets
+        self.fruit_codes = fruit_codes
+        self.vegetable_offsets = vegetable_offsets
+        self.vegetable_codes = vegetable_codes
+        self.food_ids = food_ids
+        self.employee_positions_by_company_id = employee_positions_by_company_id
+        self.dataset_version = dataset_version
+        self.company_stats = company_stats if company_stats is not None else {}
+        # every age is known unless told otherwise
+        self.age_known = age_known if age_known is not None else bytes([1]) * len(pids)
+
+    @classmethod
+    def from_database(cls, db):
+        """ Load a snapshot of everything imported into `db` """
+        person = Person.__table__
+
+        pids = array('q')
+        names, addresses, emails, phones = [], [], [], []
+        ages = array('i')
+        age_known = bytearray()
+        alive = bytearray()
+        eye_colors = []
+        eye_color_codes = array('H')
+        company_ids = array('q')
+        fruits, vegetables = [], []
+        food_ids = []
+
+        with db.engine.connect() as connection:
+            eye_color_code = {}
+            food_code = {}
+            for row in connection.execute(select([person]).order_by(person.c.pid)):
+                pids.append(row.pid)
+                names.append(row.name)
+                ages.append(row.age if row.age is not None else UNKNOWN_AGE)
+                age_known.append(1 if row.age is not None else 0)
+                addresses.append(row.address)
+                emails.append(row.email)
+                phones.append(row.phone)
+                alive.append(1 if row.alive else 0)
+                if row.eye_color not in eye_color_code:
+                    eye_color_code[row.eye_color] = len(eye_colors)
+                    eye_colors.append(row.eye_color)
+                eye_color_codes.append(eye_color_code[row.eye_color])
+                company_ids.append(row.company_id if row.company_id is not None else NO_COMPANY)
+
+                for food_id in (row.fruit_ids or []) + (row.vegetable_ids or []):
+                    if food_id not in food_code:
+                        food_code[food_id] = len(food_ids)
+                        food_ids.append(food_id)
+                fruits.extend((len(pids) - 1, food_code[food_id]) for food_id in row.fruit_ids or [])
+                vegetables.extend((len(pids) - 1, food_code[food_id]) for food_id in row.vegetable_ids or [])
+
+            position_by_pid = { pid: i for i, pid in enumerate(pids) }
+
+            friend_offsets, friend_positions = cls._build_csr(len(pids), (
+                (position_by_pid[a], position_by_pid[b]) for a, b in connection.execute(
+                    select([friendship.c.person_id, friendship.c.friend_id]).order_by(friendship.c.person_id, friendship.c.friend_id))))
+
+            fruit_offsets, fruit_codes = cls._build_csr(len(pids), fruits, 'H')
+            vegetable_offsets, vegetable_codes = cls._build_csr(len(pids), vegetables, 'H')
+
+            employee_positions_by_company_id = { cid: array('i') for (cid,) in connection.execute(select([Company.__table__.c.cid])) }
+            for i, cid in enumerate(company_ids):
+                if cid in employee_positions_by_company_id:
+                    employee_positions_by_company_id[cid].append(i)
+
+            stats_table = CompanyStats.__table__
+            company_stats = { row.company_id: CompanyStatsRecord(*( row[c] for c in CompanyStatsRecord._fields ))
+                              for row in connection.execute(select([stats_table])) }
+
+        return cls(pids, names, ages, addresses, emails, phones, alive, eye_colors, eye_color_codes,
+                   company_ids, friend_offsets, friend_positions, fruit_offsets, fruit_codes,
+                   vegetable_offsets, vegetable_codes, food_ids, employee_positions_by_company_id, read_dataset_version(db),
+                   company_stats, age_known)
+
+    @staticmethod
+    def _build_csr(num_rows, pairs, typecode='i'):
+        """ Build CSR (offsets, values) arrays from (row, value) pairs sorted by row """
+        offsets = array('q', [0]) * (num_rows + 1)
+        values = array(typecode)
+        for row, value in pairs:
+            offsets[row + 1] += 1
+            values.append(value)
+        for row in range(num_rows):
+            offsets[row + 1] += offsets[row]
+        return offsets, values
+
+    def position_of(self, pid):
+        """ Return the position of person `pid`, or None if unknown """
+        i = bisect_left(self.pids, pid)
+        if i < len(self.pids) and self.pids[i] == pid:
+            return i
+        return None
+
+    def friend_positions_of(self, i):
+        return self.friend_positions[self.friend_offsets[i]:self.friend_offsets[i + 1]]
+
+    def fruit_ids_of(self, i):
+        return [ self.food_ids[code] for code in self.fruit_codes[self.fruit_offsets[i]:self.fruit_offsets[i + 1]] ]
+
+    def vegetable_ids_of(self, i):
+        return [ self.food_ids[code] for code in self.vegetable_codes[self.vegetable_offsets[i]:self.vegetable_offsets[i + 1]] ]
+
+    def age_of(self, i):
+        return self.ages[i] if self.age_known[i] else None
+
+    def person_record(self, i):
+        return PersonRecord(self.pids[i], self.names[i], self.age_of(i), self.addresses[i], self.emails[i], self.phones[i],
+                            self.eye_colors[self.eye_color_codes[i]], bool(self.alive[i]), self.company_ids[i],
+                            self.fruit_ids_of(i), self.vegetable_ids_of(i))
+
+
+class SnapshotService(object):
+    """
+    `Service` backend answering queries from an in-memory `Snapshot`
+    rather than the database. Returns read-only records with the same
+    attributes as the ORM models used by the handlers.
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    @classmethod
+    def from_database(cls, db):
+        return cls(Snapshot.from_database(db))
+
+    def get_employees_by_company_id(self, cid):
+        """
+        Return list of persons employed by a company
+        """
+        s = self.snapshot
+        positions = s.employee_positions_by_company_id.get(cid)
+        if positions is None:
+            raise UnknownInstanceError("unknown company id '{}'".format(cid))
+        return [ EmployeeRecord(s.pids[i], s.emails[i]) for i in positions ]
+
+    def get_employees_page(self, cid, after_pid=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Return a page of persons employed by a company, ordered by id.
+        See `Service.get_employees_page`.
+        """
+        s = self.snapshot
+        positions = s.employee_positions_by_company_id.get(cid)
+        if positions is None:
+            raise UnknownInstanceError("unknown company id '{}'".format(cid))
+
+        # positions are in id order, so skip those up to the position of `after_pid`
+        start = 0
+        if after_pid is not None:
+            start = bisect_left(positions, bisect_right(s.pids, after_pid))
+
+        page = [ EmployeeRecord(s.pids[i], s.emails[i]) for i in positions[start:start + limit] ]
+        if start + limit < len(positions):
+            return page, page[-1].pid
+        return page, None
+
+    def get_company_stats(self, cid):
+        """
+        Return the statistics of a company's employees, materialized at import
+        """
+        stats = self.snapshot.company_stats.get(cid)
+        if stats is None:
+            raise UnknownInstanceError("unknown company id '{}'".format(cid))
+        return stats
+
+    def get_all_company_stats(self):
+        """
+        Return the materialized statistics of every company, ordered by company id
+        """
+        return [ stats for _, stats in sorted(self.snapshot.company_stats.items()) ]
+
+    def get_person_by_id(self, person_id):
+        """
+        Return person with {person_id}
+        """
+        i = self.snapshot.position_of(person_id)
+        if i is None:
+            return None
+        return self.snapshot.person_record(i)
+
+    def get_people_by_ids(self, person_ids):
+        """
+        Return map of person id to person for the known ids in `person_ids`
+        """
+        positions = ( self.snapshot.position_of(pid) for pid in set(person_ids) )
+        return { self.snapshot.pids[i]: self.snapshot.person_record(i) for i in positions if i is not None }
+
+    def get_person_comparisons(self, id_pairs):
+        """
+        Compare many pairs of people at once. See `Service.get_person_comparisons`.
+        """
+        s = self.snapshot
+        results = []
+        for this_id, other_id in id_pairs:
+            this_i = s.position_of(this_id)
+            other_i = s.position_of(other_id)
+            if this_i is None or other_i is None:
+                results.append((None if this_i is None else s.person_record(this_i),
+                                None if other_i is None else s.person_record(other_i), []))
+            else:
+                results.append((s.person_record(this_i), s.person_record(other_i), self._common_friend_ids(this_i, other_i)))
+        return results
+
+    def _common_friend_ids(self, this_i, other_i):
+        """ Ids of living, brown-eyed friends of both people at positions `this_i` and `other_i` """
+        s = self.snapshot
+        brown = s.eye_colors.index("brown") if "brown" in s.eye_colors else -1
+        other_friends = set(s.friend_positions_of(other_i))
+        return [ s.pids[i] for i in s.friend_positions_of(this_i)
+                 if i in other_friends and s.alive[i] and s.eye_color_codes[i] == brown ]
+
+    def get_person_comparison(self, this_person_id, other_person_id):
+        """
+        Fetch person info and friends in common
+        """
+        s = self.snapshot
+        this_i = s.position_of(this_person_id)
+        other_i = s.position_of(other_person_id)
+
+        if this_i is None:
+            raise UnknownInstanceError("unknown person id '{}'".format(this_person_id))
+        if other_i is None:
+            raise UnknownInstanceError("unknown id of other person '{}'".format(other_person_id))
+
+        return s.person_record(this_i), s.person_record(other_i), self._common_friend_ids(this_i, other_i)
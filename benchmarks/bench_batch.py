@@ -0,0 +1,64 @@
+import argparse
+import random
+
+import tornado.ioloop
+
+from benchmarks.load_test import run_load
+
+#
+# Per-item cost of the batch routes (GET /person?ids=..., GET /person/compare?pairs=...)
+# against the equivalent single-item routes, at several batch sizes.
+#
+# Usage (from project root, with the server running without its response cache):
+#   python main.py --cache-size 0
+#   python -m benchmarks.bench_batch --url http://127.0.0.1:8888 --batch-sizes 1 10 50 100
+#
+
+
+def single_paths(rng, route, num_people):
+    """ Yield (route name, path) pairs, one item per request """
+    while True:
+        if route == "person":
+            yield route, "/person/{}".format(rng.randrange(num_people))
+        else:
+            yield route, "/person/{}/compare?other_id={}".format(rng.randrange(num_people), rng.randrange(num_people))
+
+
+def batch_paths(rng, route, num_people, batch_size):
+    """ Yield (route name, path) pairs, `batch_size` items per request """
+    while True:
+        if route == "person":
+            ids = ",".join(str(rng.randrange(num_people)) for _ in range(batch_size))
+            yield route, "/person?ids={}".format(ids)
+        else:
+            pairs = ",".join("{}:{}".format(rng.randrange(num_people), rng.randrange(num_people)) for _ in range(batch_size))
+            yield route, "/person/compare?pairs={}".format(pairs)
+
+
+def per_item_us(base_url, paths, num_requests, items_per_request, concurrency):
+    """ Return microseconds of wall time per item and the error count """
+    latencies, errors, elapsed = tornado.ioloop.IOLoop.current().run_sync(
+        lambda: run_load(base_url, paths, num_requests, concurrency))
+    return elapsed / (num_requests * items_per_request) * 1e6, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8888")
+    parser.add_argument("--items", type=int, default=5000, help="items fetched per route and batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--people", type=int, default=1000, help="person ids are drawn from [0, people)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>14} {:>14} {:>8}".format("route", "batch", "single (us)", "batch (us)", "speedup"))
+    for route in ("person", "compare"):
+        single_us, single_errors = per_item_us(
+            args.url, single_paths(random.Random(args.seed), route, args.people), args.items, 1, args.concurrency)
+        for batch_size in args.batch_sizes:
+            batch_us, batch_errors = per_item_us(
+                args.url, batch_paths(random.Random(args.seed), route, args.people, batch_size),
+                max(1, args.items // batch_size), batch_size, args.concurrency)
+            assert single_errors == batch_errors == 0
+            print("{:>8} {:>8} {:>14.1f} {:>14.1f} {:>7.1f}x".format(route, batch_size, single_us, batch_us, single_us / batch_us))
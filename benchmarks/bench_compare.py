@@ -0,0 +1,89 @@
+import argparse
+import random
+import time
+
+from sqlalchemy.orm import joinedload
+
+from api.database import Database, read_scope
+from api.model import Company, Person, friendship
+from api.service import Service
+
+#
+# Compare the original python set-intersection implementation of
+# `Service.get_person_comparison` against the aggregate SQL query on
+# a synthetically inflated friendship graph.
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_compare --people 20000 --hub-degree 5000
+#
+
+
+def seed_inflated_graph(db, num_people, hub_degree, num_hubs=2, seed=0):
+    """
+    Insert `num_people` people, where the first `num_hubs` people are
+    "hubs" befriending `hub_degree` random people each. Friendships are
+    mutual so both directions are written.
+    """
+    rng = random.Random(seed)
+    eye_colors = ["brown", "blue", "green"]
+
+    people = [{
+        "pid": pid,
+        "name": "person {}".format(pid),
+        "age": rng.randint(1, 100),
+        "address": "address {}".format(pid),
+        "email": "person{}@example.com".format(pid),
+        "phone": "+1 (000) 000-0000",
+        "eye_color": rng.choice(eye_colors),
+        "alive": rng.random() < 0.5,
+        "company_id": 1
+    } for pid in range(num_people)]
+
+    edges = set()
+    for hub in range(num_hubs):
+        for friend in rng.sample(range(num_hubs, num_people), hub_degree):
+            edges.add((hub, friend))
+            edges.add((friend, hub))
+
+    with db.engine.begin() as conn:
+        conn.execute(Company.__table__.insert(), [{"cid": 1, "name": "HUB"}])
+        conn.execute(Person.__table__.insert(), people)
+        conn.execute(friendship.insert(), [{"person_id": a, "friend_id": b} for a, b in edges])
+
+
+def old_person_comparison(db, this_person_id, other_person_id):
+    """ The joined-load + python set implementation this benchmark replaces """
+    with read_scope(db) as session:
+        this_person = session.query(Person).options(joinedload('friends')).filter_by(pid=this_person_id).first()
+        other_person = session.query(Person).options(joinedload('friends')).filter_by(pid=other_person_id).first()
+
+    this_friends = set([ f.pid for f in this_person.friends if f.alive == True and f.eye_color == "brown" ])
+    other_friends = set([ f.pid for f in other_person.friends if f.alive == True and f.eye_color == "brown" ])
+    return this_person, other_person, this_friends.intersection(other_friends)
+
+
+def time_calls(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--people", type=int, default=20000)
+    parser.add_argument("--hub-degree", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>8}".format("degree", "old (ms)", "new (ms)", "speedup"))
+    for degree in args.hub_degree:
+        db = Database("bench_compare.db")
+        seed_inflated_graph(db, args.people, degree)
+        service = Service(db)
+
+        old_secs, (_, _, old_common) = time_calls(lambda: old_person_comparison(db, 0, 1), args.repeat)
+        new_secs, (_, _, new_common) = time_calls(lambda: service.get_person_comparison(0, 1), args.repeat)
+
+        assert sorted(old_common) == list(new_common)
+        print("{:>10} {:>12.2f} {:>12.2f} {:>7.1f}x".format(degree, old_secs * 1000, new_secs * 1000, old_secs / new_secs))
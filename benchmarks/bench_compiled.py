@@ -0,0 +1,76 @@
+import argparse
+import gc
+import random
+import time
+
+from api.compiled import compile_dataset
+from api.database import Database
+from api.import_data import sync_local_data
+from benchmarks.dataset import generate_dataset
+from benchmarks.load_test import summarise
+from main import load_backend
+
+#
+# Start-up cost of the snapshot backends on generated data sets, i.e. of
+# `main.load_backend` once the data has been imported: loading a `Snapshot`
+# from the database and indexing it (`--backend snapshot`) against mapping
+# a compiled dataset file holding the snapshot and its indexes
+# (`--backend compiled`, `api.compiled`). Also the resident memory each
+# adds once loaded, and the latency of person lookups answered from each
+# (which page in the mapped file as they go).
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_compiled --people 10000 100000 --queries 10000
+#
+
+
+def rss_mb():
+    """ Resident set size of this process (Linux only) """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+
+
+def load(db, backend, compiled_path):
+    """ Return (service, seconds to start the backend, MB of resident memory it added) """
+    gc.collect()
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    service, _, _ = load_backend(db, backend, compiled_path)
+    seconds = time.perf_counter() - start
+    return service, seconds, rss_mb() - rss_before
+
+
+def time_lookups(service, pids):
+    latencies = []
+    for pid in pids:
+        start = time.perf_counter()
+        service.get_person_by_id(pid)
+        latencies.append(time.perf_counter() - start)
+    return summarise(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--people", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--data-dir", default="bench_data")
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>14} {:>12} {:>14} {:>14}".format(
+          "people", "backend", "start-up (ms)", "memory (MB)", "lookup p50 (us)", "lookup p99 (us)"))
+    for num_people in args.people:
+        paths = generate_dataset(args.data_dir, num_people=num_people)
+        db = Database("bench_compiled_{}.db".format(num_people), reset=False)
+        sync_local_data(db, *paths)
+        compiled_path = "bench_compiled_{}.dataset".format(num_people)
+        compile_dataset(db, compiled_path)
+
+        rng = random.Random(0)
+        pids = [ rng.randrange(num_people) for _ in range(args.queries) ]
+        for backend in ("snapshot", "compiled"):
+            service, seconds, memory = load(db, backend, compiled_path)
+            s = time_lookups(service, pids)
+            print("{:>10} {:>10} {:>14.1f} {:>12.1f} {:>14.1f} {:>14.1f}".format(
+                  num_people, backend, seconds * 1e3, memory, s["p50_ms"] * 1e3, s["p99_ms"] * 1e3))
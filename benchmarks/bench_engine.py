@@ -0,0 +1,76 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+from api.database import Database, ENGINE_PROFILES
+from api.import_data import import_local_data
+from api.service import Service
+
+#
+# Throughput of each SQLite engine profile (see `api.database.ENGINE_PROFILES`),
+# with and without a connection pool: bulk import time, then read-only
+# service calls (person, compare, employees mix) from concurrent threads.
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_engine --threads 1 4 8 --calls 5000
+#
+
+
+def service_calls(rng, service, num_people, num_companies):
+    """ Yield an endless mix of (method, args) service calls """
+    while True:
+        choice = rng.random()
+        if choice < 0.4:
+            yield service.get_person_by_id, (rng.randrange(num_people),)
+        elif choice < 0.7:
+            yield service.get_person_comparison, (rng.randrange(num_people), rng.randrange(num_people))
+        else:
+            yield service.get_employees_by_company_id, (rng.randrange(1, num_companies + 1),)
+
+
+def run_calls(service, num_calls, num_threads, seed=0):
+    """ Return calls per second of `num_calls` service calls on `num_threads` threads """
+    calls = service_calls(random.Random(seed), service, 1000, 100)
+    batch = [ next(calls) for _ in range(num_calls) ]
+
+    def call(method_and_args):
+        method, args = method_and_args
+        try:
+            method(*args)
+        except Exception:
+            pass # unknown ids are part of the mix
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        start = time.perf_counter()
+        list(executor.map(call, batch))
+        return num_calls / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", nargs="+", choices=sorted(ENGINE_PROFILES), default=sorted(ENGINE_PROFILES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profiles:
+        db = Database("bench_engine.db", profile=profile)
+        start = time.perf_counter()
+        import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+        import_secs = time.perf_counter() - start
+        db.engine.dispose()
+
+        for pooled in (False, True):
+            for num_threads in args.threads:
+                db = Database("bench_engine.db", reset=False, profile=profile,
+                              pool_size=num_threads if pooled else None)
+                db.reopen(read_only=True)
+                calls_per_sec = run_calls(Service(db), args.calls, num_threads)
+                db.engine.dispose()
+                results.append((profile, "yes" if pooled else "no", import_secs, num_threads, calls_per_sec))
+
+    print("{:>8} {:>7} {:>11} {:>8} {:>10}".format("profile", "pooled", "import (s)", "threads", "calls/s"))
+    for result in results:
+        print("{:>8} {:>7} {:>11.3f} {:>8} {:>10.0f}".format(*result))
@@ -0,0 +1,86 @@
+import argparse
+import random
+import time
+
+from api.import_data import resolve_friendships
+
+#
+# Scaling benchmark for friendship resolution during import. Compares the
+# original per-edge set rebuilding against the friend sets built once in
+# `api.import_data.resolve_friendships`.
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_friendships --people 10000 100000 1000000
+#
+# The old implementation is slow on large populations, so it is only run
+# up to 100k people unless asked for (e.g. `--old-max-people 1000000`).
+#
+
+
+def generate_friend_references(num_people, mean_degree, reciprocity, num_hubs=0, hub_degree=0, seed=0):
+    """
+    Build a `friend_ids_for_person_id` map as produced by the importer.
+    Each person references ~`mean_degree` random people (`hub_degree` for
+    the first `num_hubs` people), and each reference is returned by the
+    friend with probability `reciprocity`.
+    """
+    rng = random.Random(seed)
+    friend_ids_for_person_id = { pid: [] for pid in range(num_people) }
+
+    for pid in range(num_people):
+        degree = hub_degree if pid < num_hubs else rng.randint(0, 2 * mean_degree)
+        for _ in range(degree):
+            friend_id = rng.randrange(num_people)
+            if friend_id == pid:
+                continue
+            friend_ids_for_person_id[pid].append(friend_id)
+            if rng.random() < reciprocity:
+                friend_ids_for_person_id[friend_id].append(pid)
+
+    return friend_ids_for_person_id
+
+
+def old_resolve_friendships(friend_ids_for_person_id):
+    """ The per-edge set rebuilding this benchmark replaces """
+    friendships = []
+    for our_id, friend_ids in friend_ids_for_person_id.items():
+        our_friends = set(friend_ids)
+        for friend_id in our_friends:
+            their_friends = set(friend_ids_for_person_id[friend_id])
+            if our_id in their_friends:
+                friendships.append((our_id, friend_id))
+    return friendships
+
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--people", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--mean-degree", type=int, default=10)
+    parser.add_argument("--reciprocity", type=float, default=0.5)
+    parser.add_argument("--hubs", type=int, default=10, help="number of highly connected people")
+    parser.add_argument("--hub-degree", type=int, default=5000)
+    parser.add_argument("--old-max-people", type=int, default=100000,
+                        help="skip the old implementation above this population (default: %(default)s)")
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>12} {:>8}".format("people", "friendships", "old (s)", "new (s)", "speedup"))
+    for num_people in args.people:
+        friend_ids_for_person_id = generate_friend_references(
+            num_people, args.mean_degree, args.reciprocity, args.hubs, min(args.hub_degree, num_people - 1))
+
+        new_secs, new_friendships = time_call(resolve_friendships, friend_ids_for_person_id)
+
+        if num_people <= args.old_max_people:
+            old_secs, old_friendships = time_call(old_resolve_friendships, friend_ids_for_person_id)
+            assert sorted(old_friendships) == new_friendships
+            old_column, speedup_column = "{:.3f}".format(old_secs), "{:.1f}x".format(old_secs / new_secs)
+        else:
+            old_column, speedup_column = "-", "-"
+
+        print("{:>10} {:>12} {:>12} {:>12.3f} {:>8}".format(num_people, len(new_friendships), old_column, new_secs, speedup_column))
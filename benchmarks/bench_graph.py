@@ -0,0 +1,65 @@
+import argparse
+import random
+import time
+
+from api.database import Database
+from api.graph import FriendGraph, MAX_PATH_HOPS
+from api.import_data import import_local_data
+from benchmarks.dataset import generate_dataset
+from benchmarks.load_test import summarise
+
+#
+# Latency of the graph queries (`api.graph.FriendGraph`) on generated data
+# sets: shortest paths by bidirectional search against a one-sided
+# breadth-first search, mutual friends within 2 hops, and top-k employees.
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_graph --people 10000 100000 --queries 200
+#
+
+
+def one_sided_shortest_path_length(graph, this_id, other_id, max_hops):
+    """ The one-sided search the bidirectional search replaces """
+    target = graph.position_of(other_id)
+    distances, _ = graph.hop_distances(graph.position_of(this_id), max_hops)
+    return distances.get(target)
+
+
+def time_queries(query, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        query(*args)
+        latencies.append(time.perf_counter() - start)
+    return summarise(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--people", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--mean-degree", type=int, default=10)
+    parser.add_argument("--degree-distribution", default="powerlaw")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--data-dir", default="bench_data")
+    args = parser.parse_args()
+
+    print("{:>10} {:>22} {:>10} {:>10} {:>10}".format("people", "query", "p50 (ms)", "p99 (ms)", "max (ms)"))
+    for num_people in args.people:
+        paths = generate_dataset(args.data_dir, num_people=num_people, mean_degree=args.mean_degree,
+                                 degree_distribution=args.degree_distribution)
+        db = Database("bench_graph.db")
+        import_local_data(db, *paths, bulk=True)
+        graph = FriendGraph.from_database(db)
+
+        rng = random.Random(0)
+        pairs = [ (rng.randrange(num_people), rng.randrange(num_people)) for _ in range(args.queries) ]
+        queries = [
+            ("path (bidirectional)", graph.shortest_path, [ pair + (MAX_PATH_HOPS,) for pair in pairs ]),
+            ("path (one-sided)", lambda a, b, hops: one_sided_shortest_path_length(graph, a, b, hops),
+             [ pair + (MAX_PATH_HOPS,) for pair in pairs ]),
+            ("mutual (2 hops)", graph.mutual_friends, [ pair + (2,) for pair in pairs ]),
+            ("top-connected (k=10)", graph.top_connected, [ (rng.randint(1, 100), 10) for _ in pairs ]),
+        ]
+        for name, query, args_list in queries:
+            s = time_queries(query, args_list)
+            print("{:>10} {:>22} {:>10.3f} {:>10.3f} {:>10.3f}".format(num_people, name, s["p50_ms"], s["p99_ms"], s["max_ms"]))
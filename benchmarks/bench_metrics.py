@@ -0,0 +1,70 @@
+import argparse
+import random
+import time
+
+import tornado.ioloop
+
+from api.database import Database
+from api.endpoint import Endpoint
+from api.import_data import import_local_data
+from api.instrumentation import QueryStats
+from api.metrics import Metrics
+from api.service import Service
+from api.snapshot import SnapshotService
+from benchmarks.load_test import route_paths, run_load
+
+#
+# Overhead of the request metrics (`api.metrics`): the same service served
+# with and without metrics from this process, loaded in alternating rounds
+# so that both see the same conditions. Also reports the cost of recording
+# one request and of rendering /metrics.
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_metrics --backend snapshot --rounds 5 --requests 2000
+#
+
+
+def time_per_call(fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - start) / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["sql", "snapshot"], default="snapshot")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per round and variant")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    db = Database("bench_metrics.db", instrument=True)
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    service = SnapshotService.from_database(db) if args.backend == "snapshot" else Service(db)
+
+    metrics = Metrics()
+    ports = {"without metrics": 8890, "with metrics": 8891}
+    Endpoint(service, cache_size=0).get_application().listen(ports["without metrics"])
+    Endpoint(service, cache_size=0, metrics=metrics).get_application().listen(ports["with metrics"])
+
+    paths = route_paths(random.Random(0), 1000, 100)
+    elapsed = { variant: 0.0 for variant in ports }
+    for _ in range(args.rounds):
+        for variant, port in ports.items():
+            _, errors, seconds = tornado.ioloop.IOLoop.current().run_sync(
+                lambda: run_load("http://127.0.0.1:{}".format(port), paths, args.requests, args.concurrency))
+            elapsed[variant] += seconds
+
+    num_requests = args.rounds * args.requests
+    baseline = elapsed["without metrics"] / num_requests
+    print("{:>16} {:>10} {:>14} {:>10}".format("variant", "req/s", "us/request", "overhead"))
+    for variant, seconds in elapsed.items():
+        per_request = seconds / num_requests
+        print("{:>16} {:>10.0f} {:>14.1f} {:>9.1%}".format(variant, 1 / per_request, per_request * 1e6, per_request / baseline - 1))
+
+    stats = QueryStats()
+    observe = time_per_call(lambda: metrics.observe("/person/{id}", 200, 0.001, 120, stats), 100000)
+    render = time_per_call(metrics.render, 100)
+    print("\nrecording a request: {:.2f}us, rendering /metrics ({} routes): {:.1f}us".format(
+        observe * 1e6, len(metrics.routes), render * 1e6))
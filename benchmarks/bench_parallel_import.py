@@ -0,0 +1,47 @@
+import argparse
+import os
+import time
+
+from api.database import Database
+from api.import_data import bulk_import_local_data, parallel_import_local_data
+from benchmarks.dataset import add_dataset_arguments, dataset_arguments, generate_dataset
+
+#
+# Import wall time of the serial streaming bulk importer against the
+# parallel importer (`api.import_data.parallel_import_local_data`) at
+# several worker counts, on a generated data set (see `benchmarks.dataset`).
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_parallel_import --people 100000 --workers 1 2 4 8
+#
+
+
+def time_import(import_data, data_paths, *args):
+    db = Database("bench_parallel_import.db", profile="tuned")
+    start = time.perf_counter()
+    import_data(db, *data_paths, *args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_dataset_arguments(parser)
+    parser.add_argument("--data-dir", default="bench_data", help="where the generated data set is written")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="parallel import processes")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    data_paths = generate_dataset(args.data_dir, **dataset_arguments(args))
+    num_people = args.people
+    size_mb = os.path.getsize(data_paths[1]) / (1 << 20)
+
+    results = [("serial", time_import(bulk_import_local_data, data_paths, args.batch_size))]
+    for workers in args.workers:
+        seconds = time_import(parallel_import_local_data, data_paths, workers, args.batch_size)
+        results.append(("{} processes".format(workers), seconds))
+
+    print("\n{} people, {:.1f}MB, {} CPUs".format(num_people, size_mb, os.cpu_count()))
+    print("{:>14} {:>10} {:>14} {:>10} {:>8}".format("importer", "seconds", "people/s", "MB/s", "speedup"))
+    for name, seconds in results:
+        print("{:>14} {:>10.2f} {:>14.0f} {:>10.1f} {:>7.2f}x".format(
+            name, seconds, num_people / seconds, size_mb / seconds, results[0][1] / seconds))
@@ -0,0 +1,63 @@
+import argparse
+
+from api.database import Database
+from api.import_data import import_local_data
+from api.search import PeopleIndex, PeopleQuery
+from api.snapshot import Snapshot
+from benchmarks.bench_graph import time_queries
+from benchmarks.dataset import generate_dataset
+
+#
+# Latency of people searches (`api.search.PeopleIndex`) on a generated data
+# set (50 foods), against testing every person's attributes, for a first page of
+# results of queries from selective to broad.
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_search --people 100000 --repeat 20
+#
+
+QUERIES = [
+    ("company + alive", PeopleQuery(company_id=7, alive=True)),
+    ("eyes + alive + age", PeopleQuery(eye_color="brown", alive=True, age_min=30, age_max=40)),
+    ("food + age", PeopleQuery(foods=("food-30",), age_min=60)),
+    ("alive", PeopleQuery(alive=False)),
+]
+
+
+def scan(snapshot, query, limit):
+    """ The search without indexes: test every person in id order until a page is found """
+    page = []
+    for i in range(len(snapshot.pids)):
+        p = snapshot.person_record(i)
+        if (query.age_min is None or p.age >= query.age_min) and (query.age_max is None or p.age <= query.age_max) \
+                and (query.eye_color is None or p.eye_color == query.eye_color) \
+                and (query.alive is None or p.alive == query.alive) \
+                and (query.company_id is None or p.company_id == query.company_id) \
+                and all(food in p.fruit_ids + p.vegetable_ids for food in query.foods):
+            if len(page) == limit:
+                break
+            page.append(p.pid)
+    return page
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--people", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--data-dir", default="bench_data")
+    args = parser.parse_args()
+
+    paths = generate_dataset(args.data_dir, num_people=args.people, num_foods=50)
+    db = Database("bench_search.db")
+    import_local_data(db, *paths, bulk=True)
+    snapshot = Snapshot.from_database(db)
+    index = PeopleIndex.from_snapshot(snapshot)
+
+    print("{:>20} {:>10} {:>10} {:>14} {:>14}".format("query", "matches", "driver", "index p50 (ms)", "scan p50 (ms)"))
+    for name, query in QUERIES:
+        matches = len(index.search(query, limit=args.people)[0])
+        indexed = time_queries(index.search, [ (query, None, args.limit) ] * args.repeat)
+        scanned = time_queries(lambda q: scan(snapshot, q, args.limit), [ (query,) ] * max(1, args.repeat // 10))
+        print("{:>20} {:>10} {:>10} {:>14.3f} {:>14.3f}".format(
+              name, matches, index.plan(query)[0].index, indexed["p50_ms"], scanned["p50_ms"]))
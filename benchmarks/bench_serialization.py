@@ -0,0 +1,158 @@
+import argparse
+from collections import namedtuple
+import time
+
+from sqlalchemy import select
+import tornado.escape
+
+from api.database import Database
+from api.import_data import import_local_data
+from api.model import Food, favourite_food_table
+from api.serializers import JSON_LIBRARY, _stdlib_dumps, dumps, serialize_comparison, serialize_employee, serialize_person
+from api.snapshot import SnapshotService
+
+#
+# Serialization throughput of each endpoint's response: the original
+# hand-packed dicts encoded with `tornado.escape.json_encode`, against the
+# `api.serializers` serializers encoded with the stdlib encoder and with
+# the fastest JSON library installed (orjson/ujson, if any).
+#
+# The original person response split the person's favourite food records
+# by category in two passes. "person" compares it with splitting them in
+# one pass, "person precomputed" with reading the lists categorised at
+# import (`Person.fruit_ids`, `Person.vegetable_ids`).
+#
+# Usage (from project root):
+#   python -m benchmarks.bench_serialization --seconds 1
+#
+
+
+def old_employees(employees):
+    payload = []
+    for p in employees:
+        payload.append({"pid": p.pid, "email": p.email})
+    return {"employees": payload}
+
+
+# a person with their favourite food records, as the original serializers read them
+FoodRecord = namedtuple("FoodRecord", ["id", "category"])
+PersonWithFoods = namedtuple("PersonWithFoods", ["pid", "email", "age", "favourite_foods"])
+
+
+def with_favourite_foods(db, people):
+    """ `PersonWithFoods` of each person record, category names as originally stored """
+    foods = {}
+    with db.engine.connect() as connection:
+        for row in connection.execute(select([favourite_food_table.c.person_id, Food.id, Food.category])
+                                      .select_from(favourite_food_table.join(Food.__table__))):
+            foods.setdefault(row.person_id, []).append(FoodRecord(row.id, row.category.name.lower()))
+    return [ PersonWithFoods(p.pid, p.email, p.age, foods.get(p.pid, [])) for p in people ]
+
+
+def old_person(person):
+    return {
+        "username": person.email,
+        "age": person.age,
+        "fruits": [f.id for f in person.favourite_foods if f.category == "fruit"],
+        "vegetables": [f.id for f in person.favourite_foods if f.category == "vegetable"]
+    }
+
+
+def one_pass_person(person):
+    fruits = []
+    vegetables = []
+    for food in person.favourite_foods:
+        if food.category == "fruit":
+            fruits.append(food.id)
+        elif food.category == "vegetable":
+            vegetables.append(food.id)
+    return {"username": person.email, "age": person.age, "fruits": fruits, "vegetables": vegetables}
+
+
+def old_comparison(this_person, other_person, common_friend_ids):
+    return {
+        "this": {"id": this_person.pid, "name": this_person.name, "age": this_person.age,
+                 "address": this_person.address, "phone": this_person.phone},
+        "other": {"id": other_person.pid, "name": other_person.name, "age": other_person.age,
+                  "address": other_person.address, "phone": other_person.phone},
+        "common_friend_ids": list(common_friend_ids)
+    }
+
+
+def new_employees(employees):
+    return {"employees": [ serialize_employee(p) for p in employees ]}
+
+
+def new_batch_person(people):
+    payload = []
+    for pid, person in people.items():
+        response = serialize_person(person)
+        response["id"] = pid
+        payload.append(response)
+    return {"people": payload, "missing": []}
+
+
+def old_batch_person(people):
+    payload = []
+    for person in people:
+        response = old_person(person)
+        response["id"] = person.pid
+        payload.append(response)
+    return {"people": payload, "missing": []}
+
+
+def old_encode(value):
+    return tornado.escape.utf8(tornado.escape.json_encode(value))
+
+
+def responses_per_second(serialize, encode, args, seconds):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(100):
+            encode(serialize(*args))
+        count += 100
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent per endpoint and variant")
+    args = parser.parse_args()
+
+    db = Database("bench_serialization.db")
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    service = SnapshotService.from_database(db)
+
+    largest_company = max(service.snapshot.employee_positions_by_company_id,
+                          key=lambda cid: len(service.snapshot.employee_positions_by_company_id[cid]))
+    person = service.get_person_by_id(5)
+    people = service.get_people_by_ids(range(100))
+    person_with_foods, = with_favourite_foods(db, [person])
+    people_with_foods = with_favourite_foods(db, people.values())
+
+    # (endpoint, old serializer and its arguments, new serializer and its arguments)
+    employees = (service.get_employees_by_company_id(largest_company),)
+    comparison = service.get_person_comparison(6, 7)
+    endpoints = [
+        ("employees", old_employees, employees, new_employees, employees),
+        ("person", old_person, (person_with_foods,), one_pass_person, (person_with_foods,)),
+        ("person precomputed", old_person, (person_with_foods,), serialize_person, (person,)),
+        ("compare", old_comparison, comparison, serialize_comparison, comparison),
+        ("batch person", old_batch_person, (people_with_foods,), new_batch_person, (people,)),
+    ]
+
+    variants = [("old", None, old_encode), ("new json", "new", _stdlib_dumps)]
+    if JSON_LIBRARY != "json":
+        variants.append(("new " + JSON_LIBRARY, "new", dumps))
+
+    print("{:>18} {:>14} {:>14} {:>8}".format("endpoint", "variant", "responses/s", "speedup"))
+    for name, old_serialize, old_args, new_serialize, new_args in endpoints:
+        baseline = None
+        for variant, which, encode in variants:
+            serialize, serialize_args = (new_serialize, new_args) if which == "new" else (old_serialize, old_args)
+            rate = responses_per_second(serialize, encode, serialize_args, args.seconds)
+            baseline = baseline or rate
+            print("{:>18} {:>14} {:>14.0f} {:>7.1f}x".format(name, variant, rate, rate / baseline))
@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import random
+
+#
+# Deterministic generator of Paranuara data sets in the format of
+# data/companies.json, data/people.json and data/foods.json, at any
+# population size, friend degree distribution and food vocabulary.
+# The same arguments (and seed) always produce the same files.
+#
+# Usage (from project root):
+#   python -m benchmarks.dataset --people 100000 --degree-distribution powerlaw --output-dir bench_data
+#
+
+# the foods of data/foods.json come first in every vocabulary
+BASE_FOODS = [("apple", "fruit"), ("banana", "fruit"), ("beetroot", "vegetable"), ("carrot", "vegetable"),
+              ("celery", "vegetable"), ("cucumber", "vegetable"), ("orange", "fruit"), ("strawberry", "fruit")]
+
+DEGREE_DISTRIBUTIONS = ("uniform", "powerlaw", "fixed")
+
+SYLLABLES = ["ka", "zen", "tro", "lin", "quo", "mar", "vex", "sol", "dor", "pha", "ny", "bel", "gri", "tu", "os", "ram"]
+FIRST_NAMES = ["Carmella", "Decker", "Bonnie", "Mooney", "Rosemarie", "Grimes", "Walton", "Leila", "Jody", "Hayes",
+               "Kirsten", "Rosales", "Marsh", "Tabitha", "Bray", "Noemi"]
+LAST_NAMES = ["Lambert", "Mckenzie", "Bass", "Rivas", "Wolfe", "Dotson", "Hewitt", "Barr", "Ochoa", "Rich",
+              "Kidd", "Pace", "Holman", "Gill", "Snow", "Cobb"]
+STREETS = ["Sumner Place", "Stockton Street", "Bath Avenue", "Kenmore Court", "Seaview Avenue", "Irving Place"]
+WORDS = ["id", "quis", "ullamco", "consequat", "laborum", "sint", "velit", "veniam", "irure", "mollit", "sunt",
+         "amet", "fugiat", "ex", "dolore", "culpa"]
+
+
+def generate_friend_ids(rng, num_people, mean_degree, degree_distribution, reciprocity):
+    """
+    Return the friend ids referenced by each person. Each person references
+    a number of random people drawn from `degree_distribution` with mean
+    ~`mean_degree`, and each reference is returned by the friend with
+    probability `reciprocity` (only mutual references are friendships).
+    """
+    friend_ids_for_person_id = [ [] for _ in range(num_people) ]
+
+    for pid in range(num_people):
+        if degree_distribution == "fixed":
+            degree = mean_degree
+        elif degree_distribution == "powerlaw":
+            # Pareto with shape 2 has mean 2 * scale
+            degree = min(num_people - 1, int(mean_degree / 2.0 * rng.paretovariate(2.0)))
+        else:
+            degree = rng.randint(0, 2 * mean_degree)
+
+        for _ in range(degree):
+            friend_id = rng.randrange(num_people)
+            if friend_id == pid:
+                continue
+            friend_ids_for_person_id[pid].append(friend_id)
+            if rng.random() < reciprocity:
+                friend_ids_for_person_id[friend_id].append(pid)
+
+    return friend_ids_for_person_id
+
+
+def generate_foods(rng, num_foods):
+    """ Return the food vocabulary as (name, category) pairs, starting with the foods of data/foods.json """
+    foods = BASE_FOODS[:num_foods]
+    for i in range(len(foods), num_foods):
+        foods.append(("food-{}".format(i), rng.choice(["fruit", "vegetable"])))
+    return foods
+
+
+def company_name(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).upper()
+
+
+def generate_person(rng, pid, num_companies, friend_ids, food_names, favourites):
+    first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    company = rng.randint(1, num_companies)
+    return {
+        "_id": "{:024x}".format(rng.getrandbits(96)),
+        "index": pid,
+        "guid": "{:08x}-{:04x}-{:04x}-{:04x}-{:012x}".format(
+            rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(16), rng.getrandbits(16), rng.getrandbits(48)),
+        "has_died": rng.random() < 0.5,
+        "balance": "${:,.2f}".format(rng.uniform(1000, 4000)),
+        "picture": "http://placehold.it/32x32",
+        "age": rng.randint(10, 80),
+        "eyeColor": rng.choice(["blue", "brown"]),
+        "name": "{} {}".format(first_name, last_name),
+        "gender": rng.choice(["female", "male"]),
+        "company_id": company,
+        "email": "{}{}{}@company{}.com".format(first_name, last_name, pid, company).lower(),
+        "phone": "+1 ({}) {}-{}".format(rng.randint(800, 999), rng.randint(100, 999), rng.randint(1000, 9999)),
+        "address": "{} {}, Sperryville, American Samoa, {}".format(rng.randint(100, 999), rng.choice(STREETS), rng.randint(1000, 9999)),
+        "about": " ".join(rng.choice(WORDS) for _ in range(60)).capitalize() + ".\r\n",
+        "registered": "20{:02d}-{:02d}-{:02d}T12:29:07 -10:00".format(rng.randint(14, 17), rng.randint(1, 12), rng.randint(1, 28)),
+        "tags": [ rng.choice(WORDS) for _ in range(7) ],
+        "friends": [ {"index": friend_id} for friend_id in friend_ids ],
+        "greeting": "Hello, {} {}! You have {} unread messages.".format(first_name, last_name, rng.randint(1, 10)),
+        "favouriteFood": rng.sample(food_names, min(favourites, len(food_names)))
+    }
+
+
+def generate_dataset(output_dir, num_people=1000, num_companies=100, num_foods=8, mean_degree=10,
+                     degree_distribution="uniform", reciprocity=0.5, favourites=4, seed=0):
+    """
+    Write companies.json, people.json and foods.json to `output_dir`.
+    People are written one at a time, so only the friend references of all
+    people are held in memory.
+
+    Returns:
+        (companies path, people path, foods path)
+    """
+    if degree_distribution not in DEGREE_DISTRIBUTIONS:
+        raise ValueError("unknown degree distribution '{}'".format(degree_distribution))
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = tuple(os.path.join(output_dir, name) for name in ("companies.json", "people.json", "foods.json"))
+    companies_path, people_path, foods_path = paths
+    rng = random.Random(seed)
+
+    # company indices are zero-based, people reference them one-based
+    with open(companies_path, 'w') as f:
+        json.dump([ {"index": cid, "company": company_name(rng)} for cid in range(num_companies) ], f, indent=2)
+
+    foods = generate_foods(rng, num_foods)
+    with open(foods_path, 'w') as f:
+        json.dump(dict(foods), f, indent=2, sort_keys=True)
+
+    friend_ids_for_person_id = generate_friend_ids(rng, num_people, mean_degree, degree_distribution, reciprocity)
+    food_names = [ name for name, _ in foods ]
+
+    with open(people_path, 'w') as f:
+        f.write("[\n")
+        for pid in range(num_people):
+            person = generate_person(rng, pid, num_companies, friend_ids_for_person_id[pid], food_names, favourites)
+            if pid:
+                f.write(",\n")
+            f.write(json.dumps(person, indent=2))
+        f.write("\n]\n")
+
+    return paths
+
+
+def add_dataset_arguments(parser):
+    """ Add the `generate_dataset` options to an argument parser """
+    parser.add_argument("--people", type=int, default=1000)
+    parser.add_argument("--companies", type=int, default=100)
+    parser.add_argument("--foods", type=int, default=8, help="size of the food vocabulary")
+    parser.add_argument("--mean-degree", type=int, default=10, help="mean friend references per person")
+    parser.add_argument("--degree-distribution", choices=DEGREE_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--reciprocity", type=float, default=0.5,
+                        help="probability that a friend reference is returned, i.e. becomes a friendship")
+    parser.add_argument("--favourites", type=int, default=4, help="favourite foods per person")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def dataset_arguments(args):
+    """ Return the `generate_dataset` keyword arguments of parsed `add_dataset_arguments` options """
+    return {"num_people": args.people, "num_companies": args.companies, "num_foods": args.foods,
+            "mean_degree": args.mean_degree, "degree_distribution": args.degree_distribution,
+            "reciprocity": args.reciprocity, "favourites": args.favourites, "seed": args.seed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output-dir", default="bench_data")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    for path in generate_dataset(args.output_dir, **dataset_arguments(args)):
+        print("{} ({:.1f}MB)".format(path, os.path.getsize(path) / (1 << 20)))
@@ -0,0 +1,190 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import tornado.httpclient
+import tornado.ioloop
+
+from api.database import Database
+from api.endpoint import Endpoint
+from api.import_data import import_local_data
+from api.service import Service
+from api.snapshot import SnapshotService
+from benchmarks.dataset import add_dataset_arguments, dataset_arguments, generate_dataset
+from benchmarks.load_test import run_load, summarise
+
+#
+# Scalability benchmark: generates a data set (see `benchmarks.dataset`),
+# imports it, serves it with an `Endpoint` in a separate process and loads
+# each route in turn. Import time, peak RSS of the import and of the
+# server, and per-route latency percentiles and throughput are written as
+# JSON for regression tracking.
+#
+# Usage (from project root):
+#   python -m benchmarks.harness --people 100000 --backend snapshot --output bench_results.json
+#
+
+# format version of the results file
+RESULTS_VERSION = 1
+
+BATCH_SIZE = 20
+
+
+def route_path(route, rng, num_people, num_companies):
+    """ Return a random request path of `route` """
+    if route == "person":
+        return "/person/{}".format(rng.randrange(num_people))
+    if route == "compare":
+        return "/person/{}/compare?other_id={}".format(rng.randrange(num_people), rng.randrange(num_people))
+    if route == "employee":
+        return "/company/{}/employee".format(rng.randint(1, num_companies))
+    if route == "batch_person":
+        return "/person?ids=" + ",".join(str(rng.randrange(num_people)) for _ in range(BATCH_SIZE))
+    if route == "batch_compare":
+        return "/person/compare?pairs=" + ",".join(
+            "{}:{}".format(rng.randrange(num_people), rng.randrange(num_people)) for _ in range(BATCH_SIZE))
+    raise ValueError("unknown route '{}'".format(route))
+
+
+ROUTES = ("person", "compare", "employee", "batch_person", "batch_compare")
+
+
+def route_paths(route, rng, num_people, num_companies):
+    """ Yield (route name, path) pairs of `route` forever """
+    while True:
+        yield route, route_path(route, rng, num_people, num_companies)
+
+
+def peak_rss_mb():
+    """ Peak resident set size of this process """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def process_peak_rss_mb(pid):
+    """ Peak resident set size of another process, if the platform reports it """
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def run_import(db_path, data_paths, workers):
+    """ Import a data set from scratch; runs in a separate process so its peak RSS is its own """
+    db = Database(db_path, profile="default")
+    start = time.perf_counter()
+    timings = import_local_data(db, *data_paths, bulk=True, workers=workers)
+    return {
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": peak_rss_mb(),
+        "tables": { name: {"rows": count, "seconds": seconds} for name, count, seconds in timings }
+    }
+
+
+def serve(db_path, backend, port, max_workers):
+    """ Serve an imported database without caching; runs in the server process """
+    db = Database(db_path, reset=False, profile="default", pool_size=max_workers)
+    service = SnapshotService.from_database(db) if backend == "snapshot" else Service(db)
+    db.reopen(read_only=True)
+    Endpoint(service, max_workers=max_workers, cache_size=0).run(port_num=port)
+
+
+def wait_until_serving(base_url, timeout):
+    """ Return the seconds until the server answers, polling every 50ms """
+    client = tornado.httpclient.HTTPClient()
+    start = time.perf_counter()
+    try:
+        while True:
+            try:
+                client.fetch(base_url + "/company/1/employee", raise_error=False)
+                return time.perf_counter() - start
+            except (ConnectionError, OSError):
+                if time.perf_counter() - start > timeout:
+                    raise
+                time.sleep(0.05)
+    finally:
+        client.close()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_dataset_arguments(parser)
+    parser.add_argument("--data-dir", default="bench_data", help="where the generated data set is written")
+    parser.add_argument("--backend", choices=["sql", "snapshot"], default="sql")
+    parser.add_argument("--import-workers", type=int, default=1, help="parallel import processes, 0 for one per CPU")
+    parser.add_argument("--server-workers", type=int, default=8, help="threads serving service calls")
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=list(ROUTES))
+    parser.add_argument("--requests", type=int, default=2000, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8889)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    dataset = dataset_arguments(args)
+    start = time.perf_counter()
+    data_paths = generate_dataset(args.data_dir, **dataset)
+    generate_seconds = time.perf_counter() - start
+    dataset["bytes"] = { os.path.basename(path): os.path.getsize(path) for path in data_paths }
+
+    db_path = os.path.join(args.data_dir, "bench_harness.db")
+    with ProcessPoolExecutor(1) as pool:
+        import_results = pool.submit(run_import, db_path, data_paths, args.import_workers or None).result()
+    print("imported {} people in {:.2f}s, peak RSS {:.0f}MB".format(args.people, import_results["seconds"], import_results["peak_rss_mb"]))
+
+    server = multiprocessing.Process(target=serve, args=(db_path, args.backend, args.port, args.server_workers), daemon=True)
+    server.start()
+    base_url = "http://127.0.0.1:{}".format(args.port)
+    try:
+        startup_seconds = wait_until_serving(base_url, timeout=600)
+
+        rng = random.Random(args.seed)
+        endpoints = {}
+        for route in args.routes:
+            paths = route_paths(route, rng, args.people, args.companies)
+            latencies, errors, elapsed = tornado.ioloop.IOLoop.current().run_sync(
+                lambda: run_load(base_url, paths, args.requests, args.concurrency))
+            endpoints[route] = dict(summarise(latencies[route]), errors=errors, requests_per_second=args.requests / elapsed)
+            print("{:>14}: p50 {p50_ms:.2f}ms, p99 {p99_ms:.2f}ms, {requests_per_second:.0f} req/s, {errors} errors".format(
+                route, **endpoints[route]))
+
+        server_rss_mb = process_peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.join()
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": datetime.datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "platform": {"python": platform.python_version(), "system": platform.platform(), "cpus": os.cpu_count()},
+        "dataset": dict(dataset, generate_seconds=generate_seconds),
+        "import": dict(import_results, workers=args.import_workers),
+        "server": {"backend": args.backend, "workers": args.server_workers, "startup_seconds": startup_seconds,
+                   "peak_rss_mb": server_rss_mb},
+        "load": {"requests_per_route": args.requests, "concurrency": args.concurrency},
+        "endpoints": endpoints
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print("results written to {}".format(args.output))
@@ -0,0 +1,97 @@
+import argparse
+import random
+import time
+
+import tornado.gen
+import tornado.httpclient
+import tornado.ioloop
+
+#
+# Concurrent mixed-traffic load test against a running API server.
+# Reports per-route and overall latency percentiles and throughput.
+#
+# Usage (from project root, with the server running):
+#   python -m benchmarks.load_test --url http://127.0.0.1:8888 --concurrency 32 --requests 5000
+#
+
+
+def route_paths(rng, num_people, num_companies):
+    """ Yield (route name, path) pairs for an endless mix of requests """
+    while True:
+        choice = rng.random()
+        if choice < 0.4:
+            yield "person", "/person/{}".format(rng.randrange(num_people))
+        elif choice < 0.7:
+            yield "compare", "/person/{}/compare?other_id={}".format(rng.randrange(num_people), rng.randrange(num_people))
+        else:
+            yield "employee", "/company/{}/employee".format(rng.randrange(1, num_companies + 1))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarise(latencies):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0
+    }
+
+
+async def run_load(base_url, paths, num_requests, concurrency):
+    """
+    Issue `num_requests` requests from `concurrency` concurrent workers.
+
+    Returns:
+        (map of route name to list of latencies in seconds, error count, elapsed seconds)
+    """
+    client = tornado.httpclient.AsyncHTTPClient(max_clients=concurrency)
+    latencies = {}
+    errors = [0]
+    remaining = [num_requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            route, path = next(paths)
+            start = time.perf_counter()
+            response = await client.fetch(base_url + path, raise_error=False)
+            latencies.setdefault(route, []).append(time.perf_counter() - start)
+            if response.code >= 500 or response.code == 599:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    await tornado.gen.multi([ worker() for _ in range(concurrency) ])
+    return latencies, errors[0], time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8888")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--people", type=int, default=1000, help="person ids are drawn from [0, people)")
+    parser.add_argument("--companies", type=int, default=100, help="company ids are drawn from [1, companies]")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = route_paths(random.Random(args.seed), args.people, args.companies)
+    latencies, errors, elapsed = tornado.ioloop.IOLoop.current().run_sync(
+        lambda: run_load(args.url, paths, args.requests, args.concurrency))
+
+    print("{:>10} {:>8} {:>10} {:>10} {:>10} {:>10}".format("route", "count", "p50 (ms)", "p90 (ms)", "p99 (ms)", "max (ms)"))
+    all_latencies = []
+    for route in sorted(latencies):
+        all_latencies.extend(latencies[route])
+        s = summarise(latencies[route])
+        print("{:>10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(route, s["count"], s["p50_ms"], s["p90_ms"], s["p99_ms"], s["max_ms"]))
+    s = summarise(all_latencies)
+    print("{:>10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format("all", s["count"], s["p50_ms"], s["p90_ms"], s["p99_ms"], s["max_ms"]))
+    print("throughput: {:.1f} req/s, errors: {}".format(args.requests / elapsed, errors))
@@ -1,32 +1,106 @@
 import tornado.escape
 import tornado.ioloop
 import tornado.web
+import argparse
 import json
 import sys
 import os
 
-from api.database import Database
+from api.database import Database, ENGINE_PROFILES, IMPORT_STRATEGIES
 from api.service import Service, UnknownInstanceError
-from api.import_data import import_local_data
-from api.endpoint import Endpoint
+from api.snapshot import SnapshotService
+from api.compiled import compile_dataset, load_compiled_dataset
+from api.graph import FriendGraph
+from api.search import PeopleIndex
+from api.metrics import Metrics
+from api.import_data import sync_local_data
+from api.endpoint import Endpoint, DEFAULT_CACHE_SIZE, DEFAULT_MAX_WORKERS
+
+
+def load_backend(db, backend, compiled_file):
+    """
+    Return the service answering queries for `backend`, with the friendship
+    graph index for graph queries and people's attribute indexes for searches
+    """
+    if backend == "sql":
+        return Service(db), FriendGraph.from_database(db), PeopleIndex.from_database(db)
+    if backend == "compiled":
+        # the indexes are stored in the file too, so nothing is built here
+        if compile_dataset(db, compiled_file):
+            print("compiled dataset to {}".format(compiled_file))
+        snapshot, graph, people_index = load_compiled_dataset(compiled_file)
+        return SnapshotService(snapshot), graph, people_index
+    service = SnapshotService.from_database(db)
+    return service, FriendGraph.from_snapshot(service.snapshot), PeopleIndex.from_snapshot(service.snapshot)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paranuara API server")
+    parser.add_argument("--reimport", action="store_true",
+                        help="discard the existing database and import all data files from scratch")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="number of threads serving database queries (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="number of person/company responses to cache, 0 to disable (default: %(default)s)")
+    parser.add_argument("--backend", choices=["sql", "snapshot", "compiled"], default="sql",
+                        help="answer queries with SQL, from an in-memory snapshot loaded at start-up, or from "
+                             "a memory-mapped compiled dataset file (default: %(default)s)")
+    parser.add_argument("--compiled-file", default="hivery.dataset",
+                        help="compiled dataset file of --backend compiled, rewritten when the data files change "
+                             "(default: %(default)s)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of server processes to pre-fork, 0 for one per CPU (default: %(default)s)")
+    parser.add_argument("--database-url", default="sqlite:///hivery.db",
+                        help="SQLAlchemy URL of the database, e.g. sqlite:// (in-memory) or "
+                             "postgresql://user@host/paranuara (default: %(default)s)")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="database connections kept open (default: one per worker thread)")
+    parser.add_argument("--import-strategy", choices=IMPORT_STRATEGIES, default=None,
+                        help="how rows are bulk loaded (default: copy for PostgreSQL, executemany otherwise)")
+    parser.add_argument("--engine-profile", choices=sorted(ENGINE_PROFILES), default="default",
+                        help="SQLite settings applied to each SQLite connection (default: %(default)s)")
+    parser.add_argument("--import-workers", type=int, default=1,
+                        help="processes parsing the people file during a full import, 0 for one per CPU (default: %(default)s)")
+    parser.add_argument("--no-metrics", action="store_true",
+                        help="don't record request metrics or serve them on /metrics")
+    parser.add_argument("--admin-token", default=os.environ.get("PARANUARA_ADMIN_TOKEN"),
+                        help="enable POST /admin/profile for clients sending this token "
+                             "(default: $PARANUARA_ADMIN_TOKEN, disabled if unset)")
+    parser.add_argument("--debug-queries", action="store_true",
+                        help="report SQL statements, rows and time per request in an X-Query-Stats header")
+    args = parser.parse_args()
+
     try:
-        # initialize database schema (SQLAlchemy)
-        db = Database("hivery.db")
+        # initialize database schema (SQLAlchemy), keeping the previous import unless asked not to,
+        # with one pooled connection per serving thread
+        db = Database(url=args.database_url, reset=args.reimport, profile=args.engine_profile,
+                      pool_size=args.pool_size or args.workers, import_strategy=args.import_strategy,
+                      instrument=args.debug_queries or not args.no_metrics)
+        if db.memory_uri and args.processes != 1:
+            parser.error("an in-memory database can't be shared by forked processes, use --backend snapshot")
+        print("using database {}".format(db.description))
 
-        # pre-process raw data files and load into database
-        import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json")
+        # pre-process raw data files and load into database, reusing the existing
+        # database or applying only row differences where possible
+        sync_local_data(db, "data/companies.json", "data/people.json", "data/foods.json",
+                        workers=args.import_workers or None)
 
-        # pass database to service
-        service = Service(db)
+        # pass database to service, and index the friendship graph and people's attributes
+        service, graph, people_index = load_backend(db, args.backend, args.compiled_file)
 
         # construct the API endpoint
-        endpoint = Endpoint(service)
+        endpoint = Endpoint(service, max_workers=args.workers, cache_size=args.cache_size,
+                            debug_queries=args.debug_queries, graph=graph, people_index=people_index,
+                            metrics=None if args.no_metrics else Metrics(), admin_token=args.admin_token)
 
-        # start listening on the API endpoint
-        endpoint.run(port_num=8888)
+        # start listening on the API endpoint. Data has been imported exactly once by now,
+        # so requests are served from read-only connections; forked workers each open their own
+        if args.processes == 1:
+            db.reopen(read_only=True)
+        else:
+            db.engine.dispose()
+        endpoint.run(port_num=8888, processes=args.processes,
+                     on_fork=lambda: db.reopen(read_only=True))
 
     except ImportError as err:
         print("data import failed because:: " + str(err))
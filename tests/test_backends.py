@@ -0,0 +1,78 @@
+import pytest
+
+from api.database import Database, write_scope
+from api.import_data import import_local_data, sync_local_data
+from api.model import Company
+from api.service import Service
+
+from sqlalchemy.exc import DBAPIError
+
+import os
+
+
+# backends available everywhere, plus a database server if one is configured, e.g.
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/paranuara_test pytest
+BACKEND_URLS = ["sqlite:///test_backends.db", "sqlite://"]
+if os.environ.get("TEST_DATABASE_URL"):
+    BACKEND_URLS.append(os.environ["TEST_DATABASE_URL"])
+
+DATA_FILES = ("data/companies.json", "data/people.json", "data/foods.json")
+
+
+@pytest.fixture(scope="module")
+def reference_service():
+    db = Database("./test_backends_reference.db")
+    import_local_data(db, *DATA_FILES, bulk=True)
+    return Service(db)
+
+
+@pytest.fixture(params=BACKEND_URLS)
+def db(request):
+    return Database(url=request.param)
+
+
+def assert_same_answers(service, reference_service):
+    assert [p.pid for p in service.get_employees_by_company_id(5)] == [p.pid for p in reference_service.get_employees_by_company_id(5)]
+    assert service.get_employees_page(5, None, 4)[1] == reference_service.get_employees_page(5, None, 4)[1]
+
+    for pid in (0, 5, 999):
+        person = service.get_person_by_id(pid)
+        expected = reference_service.get_person_by_id(pid)
+        assert (person.email, person.alive) == (expected.email, expected.alive)
+        assert (person.fruit_ids, person.vegetable_ids) == (expected.fruit_ids, expected.vegetable_ids)
+
+    for pair in ((1, 2), (6, 7), (10, 20)):
+        assert service.get_person_comparison(*pair)[2] == reference_service.get_person_comparison(*pair)[2]
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_import(db, reference_service, bulk):
+    import_local_data(db, *DATA_FILES, bulk=bulk)
+    assert_same_answers(Service(db), reference_service)
+
+
+def test_sync_then_serve_read_only(db, reference_service):
+    assert sync_local_data(db, *DATA_FILES) == "imported"
+    assert sync_local_data(db, *DATA_FILES) == "unchanged"
+
+    db.reopen(read_only=True)
+    assert_same_answers(Service(db), reference_service)
+
+    with pytest.raises(DBAPIError):
+        with write_scope(db) as session:
+            session.add(Company(cid=1000, name="Stark"))
+
+
+def test_memory_databases_are_separate():
+    first = Database(url="sqlite://")
+    second = Database(url="sqlite://")
+    with write_scope(first) as session:
+        session.add(Company(cid=1, name="Stark"))
+
+    assert first.engine.execute("SELECT count(*) FROM company").scalar() == 1
+    assert second.engine.execute("SELECT count(*) FROM company").scalar() == 0
+
+
+def test_copy_strategy_requires_postgres():
+    with pytest.raises(ValueError):
+        Database(url="sqlite://", import_strategy="copy")
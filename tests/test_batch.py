@@ -0,0 +1,90 @@
+import pytest
+
+from api.database import Database
+from api.endpoint import Endpoint, MAX_BATCH_SIZE
+from api.import_data import import_local_data
+from api.service import Service
+from api.snapshot import SnapshotService
+
+import tornado.httpclient
+
+import json
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = Database("./test_batch.db")
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    return db
+
+
+@pytest.fixture(params=["sql", "snapshot"])
+def service(request, db):
+    if request.param == "snapshot":
+        return SnapshotService.from_database(db)
+    return Service(db)
+
+
+@pytest.fixture
+def app(service):
+    return Endpoint(api_service=service).get_application()
+
+
+def test_get_people_by_ids_matches_single_lookups(service):
+    people = service.get_people_by_ids([3, 1, 2, 100000])
+
+    assert sorted(people) == [1, 2, 3]
+    for pid, person in people.items():
+        single = service.get_person_by_id(pid)
+        assert person.email == single.email
+        assert (person.fruit_ids, person.vegetable_ids) == (single.fruit_ids, single.vegetable_ids)
+
+
+def test_get_person_comparisons_matches_single_comparisons(service):
+    id_pairs = [(1, 2), (10, 20), (1, 2), (100000, 1)]
+    comparisons = service.get_person_comparisons(id_pairs)
+
+    assert len(comparisons) == len(id_pairs)
+    for (this_id, other_id), (this_person, other_person, common_friend_ids) in zip(id_pairs[:3], comparisons):
+        single = service.get_person_comparison(this_id, other_id)
+        assert (this_person.pid, other_person.pid) == (this_id, other_id)
+        assert sorted(common_friend_ids) == sorted(single[2])
+
+    this_person, other_person, common_friend_ids = comparisons[3]
+    assert this_person is None and other_person.pid == 1 and common_friend_ids == []
+
+
+@pytest.mark.gen_test()
+def test_batch_person(http_server, http_client, base_url, service):
+    response = yield http_client.fetch(base_url + "/person?ids=3,1,3,100000")
+    assert response.code == 200
+
+    body_json = json.loads(response.body)
+    assert [p["id"] for p in body_json["people"]] == [3, 1]
+    assert body_json["missing"] == [100000]
+
+    single = yield http_client.fetch(base_url + "/person/3")
+    expected = json.loads(single.body)
+    expected["id"] = 3
+    assert body_json["people"][0] == expected
+
+
+@pytest.mark.gen_test()
+def test_batch_person_compare(http_server, http_client, base_url, service):
+    response = yield http_client.fetch(base_url + "/person/compare?pairs=1:2,100000:1")
+    assert response.code == 200
+
+    comparisons = json.loads(response.body)["comparisons"]
+    single = yield http_client.fetch(base_url + "/person/1/compare?other_id=2")
+    assert comparisons[0] == json.loads(single.body)
+    assert comparisons[1] == {"this_id": 100000, "other_id": 1, "message": "resource not found"}
+
+
+@pytest.mark.gen_test()
+def test_batch_bad_parameters(http_server, http_client, base_url, service):
+    too_many = ",".join(str(pid) for pid in range(MAX_BATCH_SIZE + 1))
+    for path in ("/person", "/person?ids=", "/person?ids=1,abc", "/person?ids=" + too_many,
+                 "/person/compare", "/person/compare?pairs=1", "/person/compare?pairs=1:2:3"):
+        with pytest.raises(tornado.httpclient.HTTPError) as e:
+            yield http_client.fetch(base_url + path)
+        assert e.value.code == 400
@@ -0,0 +1,100 @@
+import pytest
+
+from api.cache import ResponseCache
+from api.endpoint import Endpoint
+
+from tests.test_endpoint import ServiceMock
+
+import tornado.httpclient
+
+import json
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a").body == b"1"
+
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a").body == b"1"
+    assert cache.get("c").body == b"3"
+    assert cache.stats() == {"entries": 2, "max_entries": 2, "hits": 3, "misses": 1}
+
+
+def test_cache_etag_is_body_digest():
+    cache = ResponseCache(max_entries=2)
+    entry = cache.put("a", b"1")
+    assert entry.etag == '"356a192b7913b04c54574d18c28d46e6395428ab"'
+    assert cache.get("a") == entry
+
+
+class CountingServiceMock(ServiceMock):
+    """ Count calls that reach the service """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def get_person_by_id(self, person_id):
+        self.calls += 1
+        return super().get_person_by_id(person_id)
+
+
+@pytest.fixture
+def service():
+    return CountingServiceMock()
+
+
+@pytest.fixture
+def endpoint(service):
+    return Endpoint(api_service=service, cache_size=10)
+
+
+@pytest.fixture
+def app(endpoint):
+    return endpoint.get_application()
+
+
+@pytest.mark.gen_test()
+def test_person_served_from_cache(http_server, http_client, base_url, service, endpoint):
+    first = yield http_client.fetch(base_url + "/person/1")
+    second = yield http_client.fetch(base_url + "/person/1")
+
+    assert service.calls == 1
+    assert first.headers.get("X-Cache") == "MISS"
+    assert second.headers.get("X-Cache") == "HIT"
+    assert second.headers.get("content-type") == "application/json; charset=UTF-8"
+    assert first.body == second.body
+    assert first.headers.get("Etag") == second.headers.get("Etag")
+    assert json.loads(second.body)["username"] == "thor@gmail.com"
+
+
+@pytest.mark.gen_test()
+def test_person_not_modified(http_server, http_client, base_url, service):
+    first = yield http_client.fetch(base_url + "/person/1")
+
+    with pytest.raises(tornado.httpclient.HTTPError) as e:
+        yield http_client.fetch(base_url + "/person/1", headers={"If-None-Match": first.headers.get("Etag")})
+    assert e.value.code == 304
+    assert service.calls == 1
+
+
+@pytest.mark.gen_test()
+def test_missing_person_not_cached(http_server, http_client, base_url, service):
+    for _ in range(2):
+        with pytest.raises(tornado.httpclient.HTTPError) as e:
+            yield http_client.fetch(base_url + "/person/1001")
+        assert e.value.code == 404
+    assert service.calls == 2
+
+
+@pytest.mark.gen_test()
+def test_cache_stats(http_server, http_client, base_url):
+    yield http_client.fetch(base_url + "/company/0/employee")
+    yield http_client.fetch(base_url + "/company/0/employee")
+
+    response = yield http_client.fetch(base_url + "/cache/stats")
+    stats = json.loads(response.body)
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
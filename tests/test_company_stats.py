@@ -0,0 +1,117 @@
+import pytest
+
+from api.compiled import compile_dataset, load_compiled_snapshot
+from api.database import Database, write_scope
+from api.endpoint import Endpoint
+from api.import_data import age_bucket, materialize_company_stats, sync_local_data
+from api.model import Person
+from api.serializers import serialize_company_stats
+from api.service import Service, UnknownInstanceError
+from api.snapshot import Snapshot, SnapshotService
+
+import json
+
+import tornado.httpclient
+
+from tests.test_model import seed_database
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = Database("./test_company_stats.db")
+    sync_local_data(db, "data/companies.json", "data/people.json", "data/foods.json")
+    return db
+
+
+@pytest.fixture(scope="module")
+def people(db):
+    snapshot = Snapshot.from_database(db)
+    return [ snapshot.person_record(i) for i in range(len(snapshot.pids)) ]
+
+
+@pytest.fixture(scope="module", params=["sql", "snapshot", "compiled"])
+def service(request, db):
+    if request.param == "sql":
+        return Service(db)
+    if request.param == "snapshot":
+        return SnapshotService.from_database(db)
+    compile_dataset(db, "./test_company_stats.dataset")
+    return SnapshotService(load_compiled_snapshot("./test_company_stats.dataset"))
+
+
+def expected_stats(people, cid):
+    """ Statistics of a company computed from all of its employees """
+    employees = [ p for p in people if p.company_id == cid ]
+    ages = [ p.age for p in employees if p.age is not None ]
+    distribution, fruits, vegetables = {}, {}, {}
+    for age in ages:
+        distribution[age_bucket(age)] = distribution.get(age_bucket(age), 0) + 1
+    for p in employees:
+        for food in p.fruit_ids:
+            fruits[food] = fruits.get(food, 0) + 1
+        for food in p.vegetable_ids:
+            vegetables[food] = vegetables.get(food, 0) + 1
+    return (len(employees), sum(1 for p in employees if p.alive), min(ages, default=None), max(ages, default=None),
+            sum(ages), len(ages), distribution, fruits, vegetables)
+
+
+def stats_fields(stats):
+    return (stats.headcount, stats.alive_count, stats.age_min, stats.age_max, stats.age_sum, stats.age_count, stats.age_distribution,
+            stats.fruit_counts, stats.vegetable_counts)
+
+
+def test_age_bucket():
+    assert [ age_bucket(age) for age in (0, 9, 10, 35) ] == ["0-9", "0-9", "10-19", "30-39"]
+
+
+def test_stats_match_employees(service, people):
+    for cid in (1, 5, 58, 100):
+        assert stats_fields(service.get_company_stats(cid)) == expected_stats(people, cid)
+
+    with pytest.raises(UnknownInstanceError):
+        service.get_company_stats(101)
+
+
+def test_all_stats(service, people):
+    all_stats = service.get_all_company_stats()
+    assert [ s.company_id for s in all_stats ] == list(range(1, 101))
+    assert sum(s.headcount for s in all_stats) == sum(1 for p in people if p.company_id is not None)
+
+
+def test_unknown_ages_not_averaged():
+    db = Database("./test_company_stats_ages.db")
+    seed_database(db)
+    with write_scope(db) as session:
+        session.add(Person(pid=5, name="Groot", age=None, email="groot@gmail.com", alive=True, company_id=1))
+    materialize_company_stats(db)
+
+    stats = Service(db).get_company_stats(1)
+    assert (stats.headcount, stats.age_sum, stats.age_count) == (4, 155, 3)
+    assert serialize_company_stats(stats)["age"] == {"min": 40, "max": 75, "mean": 51.67,
+                                                     "distribution": {"40-49": 2, "70-79": 1}}
+
+
+@pytest.fixture
+def app(db):
+    return Endpoint(api_service=Service(db)).get_application()
+
+
+@pytest.mark.gen_test()
+def test_stats_routes(http_server, http_client, base_url, people):
+    response = yield http_client.fetch(base_url + "/company/5/stats")
+    body = json.loads(response.body)
+    headcount, alive, age_min, age_max, age_sum, age_count, distribution, fruits, vegetables = expected_stats(people, 5)
+    assert body == {
+        "id": 5, "headcount": headcount, "alive": alive,
+        "age": {"min": age_min, "max": age_max, "mean": round(age_sum / age_count, 2), "distribution": distribution},
+        "fruits": fruits, "vegetables": vegetables
+    }
+    assert list(body["age"]["distribution"]) == sorted(distribution, key=lambda bucket: int(bucket.split("-")[0]))
+
+    response = yield http_client.fetch(base_url + "/company/stats")
+    companies = json.loads(response.body)["companies"]
+    assert len(companies) == 100 and companies[4] == body
+
+    with pytest.raises(tornado.httpclient.HTTPError) as e:
+        yield http_client.fetch(base_url + "/company/101/stats")
+    assert e.value.code == 404
@@ -0,0 +1,147 @@
+import pytest
+
+from api.compiled import (CompiledDatasetError, StringTable, compile_dataset, load_compiled_dataset, load_compiled_snapshot,
+                          read_compiled_metadata, write_compiled_snapshot)
+from api.database import Database, write_scope
+from api.endpoint import Endpoint
+from api.graph import FriendGraph
+from api.import_data import sync_local_data
+from api.model import Person
+from api.search import PeopleIndex, PeopleQuery
+from api.service import Service, UnknownInstanceError
+from api.snapshot import Snapshot, SnapshotService
+
+from tests.test_model import seed_database
+
+import json
+
+
+COMPILED_PATH = "./test_compiled.dataset"
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = Database("./test_compiled.db")
+    sync_local_data(db, "data/companies.json", "data/people.json", "data/foods.json")
+    return db
+
+
+@pytest.fixture(scope="module")
+def services(db):
+    compile_dataset(db, COMPILED_PATH)
+    return Service(db), SnapshotService(load_compiled_snapshot(COMPILED_PATH))
+
+
+def person_fields(p):
+    return (p.pid, p.name, p.age, p.address, p.email, p.phone, p.eye_color, p.alive, p.company_id,
+            p.fruit_ids, p.vegetable_ids)
+
+
+def test_string_table():
+    offsets, data, nulls = StringTable.encode(["brown", "", None, "Zoë"])
+    table = StringTable(memoryview(offsets), memoryview(bytes(data)), memoryview(bytes(nulls)))
+    assert list(table) == ["brown", "", None, "Zoë"]
+    assert table.index("Zoë") == 3 and "blue" not in table
+    with pytest.raises(IndexError):
+        table[-1]
+
+
+def test_snapshot_matches_compiled_file(db, services):
+    snapshot = Snapshot.from_database(db)
+    compiled = services[1].snapshot
+    for name in ("pids", "ages", "age_known", "alive", "company_ids", "friend_offsets", "friend_positions", "fruit_codes"):
+        assert list(getattr(compiled, name)) == list(getattr(snapshot, name))
+    for name in ("names", "emails", "eye_colors", "food_ids"):
+        assert list(getattr(compiled, name)) == getattr(snapshot, name)
+    assert { cid: list(p) for cid, p in compiled.employee_positions_by_company_id.items() } == \
+           { cid: list(p) for cid, p in snapshot.employee_positions_by_company_id.items() }
+    assert compiled.dataset_version == snapshot.dataset_version
+
+
+def test_indexes_match_compiled_file(db, services):
+    snapshot = Snapshot.from_database(db)
+    _, graph, people_index = load_compiled_dataset(COMPILED_PATH)
+
+    ranked = FriendGraph.from_snapshot(snapshot).ranked_positions_by_company_id
+    assert { cid: list(p) for cid, p in graph.ranked_positions_by_company_id.items() } == \
+           { cid: list(p) for cid, p in ranked.items() }
+    assert graph.top_connected(5, 3) == FriendGraph.from_database(db).top_connected(5, 3)
+
+    expected = PeopleIndex.from_snapshot(snapshot)
+    for name, postings in expected.postings.items():
+        assert { key: list(p) for key, p in people_index.postings[name].items() } == \
+               { key: list(p) for key, p in postings.items() }
+    for query in (PeopleQuery(eye_color="brown", alive=True), PeopleQuery(foods=("banana", "celery"), age_min=30)):
+        assert people_index.search(query, limit=1000) == PeopleIndex.from_database(db).search(query, limit=1000)
+
+
+def test_person_matches_database(services):
+    service, compiled = services
+    for pid in (0, 5, 999):
+        assert person_fields(compiled.get_person_by_id(pid)) == person_fields(service.get_person_by_id(pid))
+    assert compiled.get_person_by_id(1000) is None
+
+    for cid in (1, 5, 100):
+        assert [ (p.pid, p.email) for p in compiled.get_employees_by_company_id(cid) ] == \
+               [ (p.pid, p.email) for p in service.get_employees_by_company_id(cid) ]
+    with pytest.raises(UnknownInstanceError):
+        compiled.get_employees_by_company_id(101)
+
+    this_person, other_person, common = compiled.get_person_comparison(6, 7)
+    assert (this_person.pid, other_person.pid, list(common)) == (6, 7, [13, 16])
+
+
+def test_null_fields_round_trip(tmpdir):
+    db = Database("./test_compiled_nulls.db")
+    seed_database(db)
+    with write_scope(db) as session:
+        session.add(Person(pid=5, name=None, age=None, address=None, email=None, phone=None, eye_color=None,
+                           alive=True, company_id=1))
+    path = str(tmpdir.join("nulls.dataset"))
+    compile_dataset(db, path)
+    snapshot, _, people_index = load_compiled_dataset(path)
+
+    service, compiled = Service(db), SnapshotService(snapshot)
+    for pid in range(1, 6):
+        assert person_fields(compiled.get_person_by_id(pid)) == person_fields(service.get_person_by_id(pid))
+    assert person_fields(compiled.get_person_by_id(5))[1:7] == (None,) * 6
+    assert list(snapshot.age_known) == [1, 1, 1, 1, 0]
+    assert 5 not in people_index.search(PeopleQuery(age_min=0))[0]
+
+
+def test_compile_only_when_data_changed(db, services):
+    assert read_compiled_metadata(COMPILED_PATH)["digests"]
+    assert not compile_dataset(db, COMPILED_PATH)
+
+    write_compiled_snapshot(Snapshot.from_database(db), COMPILED_PATH, {"people": "stale"})
+    assert compile_dataset(db, COMPILED_PATH)
+
+
+def test_not_a_compiled_file(tmpdir):
+    path = str(tmpdir.join("bad.bin"))
+    with open(path, "wb") as f:
+        f.write(b"[]" * 20)
+    with pytest.raises(CompiledDatasetError):
+        load_compiled_snapshot(path)
+
+
+@pytest.fixture
+def app(services):
+    snapshot, graph, people_index = load_compiled_dataset(COMPILED_PATH)
+    return Endpoint(api_service=SnapshotService(snapshot), graph=graph, people_index=people_index).get_application()
+
+
+@pytest.mark.gen_test()
+def test_endpoint_served_from_compiled_file(http_server, http_client, base_url):
+    response = yield http_client.fetch(base_url + "/person/5")
+    assert json.loads(response.body) == {"username": "gracekelly@earthmark.com", "age": 24, "fruits": ["strawberry"],
+                                         "vegetables": ["cucumber", "beetroot", "carrot"]}
+
+    response = yield http_client.fetch(base_url + "/company/1/employee")
+    assert len(json.loads(response.body)) > 0
+
+    response = yield http_client.fetch(base_url + "/company/1/top-connected?k=3")
+    assert len(json.loads(response.body)) > 0
+
+    response = yield http_client.fetch(base_url + "/person/search?eye_color=brown&food=banana&limit=5")
+    assert len(json.loads(response.body)["people"]) == 5
@@ -0,0 +1,80 @@
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from api.model import Company, Person
+from api.database import Database, read_scope, write_scope
+
+from sqlalchemy.exc import OperationalError
+
+from tests.test_model import seed_database
+
+
+def test_reopen_read_only():
+    db = Database("./test_database.db")
+    seed_database(db)
+
+    db.reopen(read_only=True)
+
+    with read_scope(db) as session:
+        assert session.query(Person).count() == 4
+
+    with pytest.raises(OperationalError):
+        with write_scope(db) as session:
+            session.add(Company(cid=2, name="Stark"))
+
+    # and back again
+    db.reopen()
+    with write_scope(db) as session:
+        session.add(Company(cid=2, name="Stark"))
+    with read_scope(db) as session:
+        assert session.query(Company).count() == 3
+
+
+def pragma(db, name):
+    with db.engine.connect() as connection:
+        return connection.execute("PRAGMA {}".format(name)).scalar()
+
+
+def test_default_profile():
+    db = Database("./test_database.db")
+    assert pragma(db, "journal_mode") == "delete"
+    assert pragma(db, "query_only") == 0
+
+
+def test_tuned_profile():
+    db = Database("./test_database.db", profile="tuned")
+    assert pragma(db, "journal_mode") == "wal"
+    assert pragma(db, "synchronous") == 1 # NORMAL
+    assert pragma(db, "mmap_size") == 256 << 20
+    assert pragma(db, "cache_size") == -64 << 10
+
+
+def test_pooled_read_only_across_threads():
+    db = Database("./test_database.db", profile="tuned", pool_size=2)
+    seed_database(db)
+    db.reopen(read_only=True)
+
+    def count_people():
+        with read_scope(db) as session:
+            return session.query(Person).count()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(lambda _: count_people(), range(20))) == [4] * 20
+    assert db.engine.pool.checkedin() <= 2
+    assert pragma(db, "query_only") == 1
+
+    with pytest.raises(OperationalError):
+        with write_scope(db) as session:
+            session.add(Company(cid=2, name="Stark"))
+
+
+def test_reset_removes_write_ahead_log():
+    db = Database("./test_database.db", profile="wal")
+    seed_database(db)
+    db.engine.dispose()
+    open("./test_database.db-wal", "w").close()
+
+    Database("./test_database.db", profile="wal")
+    assert not os.path.exists("./test_database.db-wal")
@@ -0,0 +1,29 @@
+import filecmp
+
+import pytest
+
+from api.database import Database
+from api.import_data import import_local_data, read_json_file
+from benchmarks.dataset import DEGREE_DISTRIBUTIONS, generate_dataset
+
+
+def test_generated_dataset_is_deterministic(tmpdir):
+    first = generate_dataset(str(tmpdir.join("first")), num_people=50, seed=3)
+    second = generate_dataset(str(tmpdir.join("second")), num_people=50, seed=3)
+    other = generate_dataset(str(tmpdir.join("other")), num_people=50, seed=4)
+
+    for path, same_path, other_path in zip(first, second, other):
+        assert filecmp.cmp(path, same_path, shallow=False)
+    assert not filecmp.cmp(first[1], other[1], shallow=False)
+
+
+@pytest.mark.parametrize("degree_distribution", DEGREE_DISTRIBUTIONS)
+def test_generated_dataset_imports(tmpdir, degree_distribution):
+    paths = generate_dataset(str(tmpdir), num_people=200, num_companies=7, num_foods=20, mean_degree=5,
+                             degree_distribution=degree_distribution, reciprocity=0.8)
+    assert len(read_json_file(paths[0])) == 7
+    assert len(read_json_file(paths[2])) == 20
+
+    timings = { name: count for name, count, seconds in import_local_data(Database("./test_dataset.db"), *paths, bulk=True) }
+    assert timings["person"] == 200
+    assert timings["friendship"] > 0
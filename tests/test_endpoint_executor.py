@@ -0,0 +1,35 @@
+import pytest
+
+from api.model import Person
+from api.endpoint import Endpoint
+
+import time
+
+
+class SlowServiceMock(object):
+    """
+    Mock a `Service` whose queries block for a while
+    """
+    DELAY = 0.2
+
+    def get_person_by_id(self, person_id):
+        time.sleep(self.DELAY)
+        return Person(pid=person_id, name="Thor", age=650, address="SYD", email="thor@gmail.com", phone="+61459849686", eye_color="brown", alive=True)
+
+
+@pytest.fixture
+def app():
+    endpoint = Endpoint(api_service=SlowServiceMock(), max_workers=4)
+    return endpoint.get_application()
+
+
+@pytest.mark.gen_test(timeout=10)
+def test_slow_service_calls_do_not_block_io_loop(http_server, http_client, base_url):
+    start = time.time()
+    responses = yield [ http_client.fetch(base_url + "/person/{}".format(i)) for i in range(4) ]
+    elapsed = time.time() - start
+
+    assert [r.code for r in responses] == [200] * 4
+
+    # served concurrently on the executor rather than one after another
+    assert elapsed < 3 * SlowServiceMock.DELAY
@@ -0,0 +1,132 @@
+import pytest
+
+from api.database import Database
+from api.endpoint import Endpoint
+from api.graph import FriendGraph
+from api.import_data import import_local_data
+from api.service import Service, UnknownInstanceError
+from api.snapshot import SnapshotService
+from benchmarks.dataset import generate_dataset
+
+import tornado.httpclient
+
+from collections import deque
+import json
+
+
+@pytest.fixture(scope="module")
+def db(tmpdir_factory):
+    # the bundled data has few friendships, so most people aren't connected
+    paths = generate_dataset(str(tmpdir_factory.mktemp("graph")), num_people=500, num_companies=10, mean_degree=3, reciprocity=0.9)
+    db = Database("./test_graph.db")
+    import_local_data(db, *paths, bulk=True)
+    return db
+
+
+@pytest.fixture(scope="module", params=["database", "snapshot"])
+def graph(request, db):
+    if request.param == "snapshot":
+        return FriendGraph.from_snapshot(SnapshotService.from_database(db).snapshot)
+    return FriendGraph.from_database(db)
+
+
+@pytest.fixture
+def app(db, graph):
+    return Endpoint(api_service=Service(db), graph=graph).get_application()
+
+
+def hop_distances(graph, pid):
+    """ Plain breadth-first search over person ids """
+    distances = {pid: 0}
+    queue = deque([pid])
+    while queue:
+        i = graph.position_of(queue.popleft())
+        for j in graph.friends_of(i):
+            friend_id = graph.pids[j]
+            if friend_id not in distances:
+                distances[friend_id] = distances[graph.pids[i]] + 1
+                queue.append(friend_id)
+    return distances
+
+
+def test_shortest_paths_are_shortest(graph):
+    for this_id in (0, 5, 17, 444):
+        distances = hop_distances(graph, this_id)
+        for other_id in range(0, 500, 7):
+            path, complete = graph.shortest_path(this_id, other_id, max_hops=20)
+
+            assert complete
+            if other_id not in distances:
+                assert path is None
+                continue
+            assert path[0] == this_id and path[-1] == other_id
+            assert len(path) - 1 == distances[other_id]
+            for a, b in zip(path, path[1:]):
+                assert graph.position_of(b) in graph.friends_of(graph.position_of(a))
+
+
+def test_shortest_path_bounds(graph):
+    distances = hop_distances(graph, 5)
+    far_id = max(distances, key=distances.get)
+    assert graph.shortest_path(5, far_id, max_hops=distances[far_id] - 1) == (None, True)
+
+    graph.max_visited, max_visited = 10, graph.max_visited
+    try:
+        assert graph.shortest_path(5, far_id, max_hops=20) == (None, False)
+    finally:
+        graph.max_visited = max_visited
+
+
+def test_mutual_friends_within_hops(graph, db):
+    mutual, complete = graph.mutual_friends(1, 2, 1)
+    assert complete
+    assert sorted(pid for pid, _, _ in mutual) == sorted(
+        set(hop_distances_within(graph, 1, 1)) & set(hop_distances_within(graph, 2, 1)) - {1, 2})
+
+    mutual, _ = graph.mutual_friends(1, 2, 2)
+    this_distances, other_distances = hop_distances(graph, 1), hop_distances(graph, 2)
+    for pid, this_hops, other_hops in mutual:
+        assert (this_hops, other_hops) == (this_distances[pid], other_distances[pid])
+        assert max(this_hops, other_hops) <= 2
+
+
+def hop_distances_within(graph, pid, max_hops):
+    return [ friend_id for friend_id, hops in hop_distances(graph, pid).items() if 0 < hops <= max_hops ]
+
+
+def test_top_connected(db, graph):
+    employees = [ p.pid for p in Service(db).get_employees_by_company_id(5) ]
+    degrees = { pid: graph.degree_of(graph.position_of(pid)) for pid in employees }
+    expected = sorted(employees, key=lambda pid: (-degrees[pid], pid))
+
+    assert graph.top_connected(5, 3) == [ (pid, degrees[pid]) for pid in expected[:3] ]
+    assert len(graph.top_connected(5, 1000)) == len(employees)
+    with pytest.raises(UnknownInstanceError):
+        graph.top_connected(1000, 3)
+    with pytest.raises(UnknownInstanceError):
+        graph.shortest_path(0, 100000)
+
+
+@pytest.mark.gen_test()
+def test_graph_routes(http_server, http_client, base_url, graph):
+    response = yield http_client.fetch(base_url + "/person/0/path?other_id=1")
+    path, complete = graph.shortest_path(0, 1)
+    assert json.loads(response.body) == {"path": path, "hops": len(path) - 1, "complete": complete}
+
+    response = yield http_client.fetch(base_url + "/person/1/mutual?other_id=2&hops=2&limit=3")
+    body_json = json.loads(response.body)
+    assert len(body_json["mutual"]) == min(3, body_json["count"])
+    assert body_json["complete"]
+
+    response = yield http_client.fetch(base_url + "/company/5/top-connected?k=2")
+    assert json.loads(response.body)["people"] == [ {"id": pid, "friends": degree} for pid, degree in graph.top_connected(5, 2) ]
+
+
+@pytest.mark.gen_test()
+def test_graph_routes_bad_parameters(http_server, http_client, base_url, graph):
+    for path, code in (("/person/0/path", 400), ("/person/0/path?other_id=1&max_hops=100", 400),
+                       ("/person/0/mutual?other_id=1&hops=0", 400), ("/company/5/top-connected?k=abc", 400),
+                       ("/person/0/path?other_id=100000", 404), ("/company/1000/top-connected", 404)):
+        with pytest.raises(tornado.httpclient.HTTPError) as e:
+            yield http_client.fetch(base_url + path)
+        assert e.value.code == code
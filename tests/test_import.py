@@ -1,7 +1,16 @@
+import json
+import os
+import shutil
+
 import pytest
 
 from api.import_data import ImportError, DuplicateInstanceIdError, UnknownReferenceError
-from api.import_data import read_json_file, load_company_data, load_people_data
+from api.import_data import read_json_file, iter_json_array, load_company_data, load_people_data, import_local_data
+from api.import_data import resolve_friendships, sync_local_data
+from api.import_data import is_person_record, parallel_import_local_data, partition_byte_ranges, read_json_array_partition
+from api.database import Database, read_scope
+from api.manifest import read_dataset_version
+from api.model import Company, CompanyStats, Person, Food, favourite_food_table, friendship
 
 @pytest.fixture
 def companies_with_duplicate_ids():
@@ -51,6 +60,167 @@ def test_raises_on_duplicate_people_indices(people_with_duplicate_people_ids_0):
             company_models_by_id)
 
 
+def read_table(db, table):
+    with read_scope(db) as session:
+        return sorted(tuple(row) for row in session.execute(table.select()))
+
+
+def test_bulk_import_matches_orm_import():
+    args = ("tests/import_companies_good_0.json", "tests/import_people_good_0.json", "tests/import_foods_good_0.json")
+
+    orm_db = Database("./test_import_orm.db")
+    import_local_data(orm_db, *args)
+
+    bulk_db = Database("./test_import_bulk.db")
+    timings = import_local_data(bulk_db, *args, bulk=True, batch_size=2)
+
+    for table in (Company.__table__, Person.__table__, Food.__table__, favourite_food_table, friendship, CompanyStats.__table__):
+        assert read_table(bulk_db, table) == read_table(orm_db, table)
+
+    assert [t[0] for t in timings] == ["company", "food", "person", "favourites", "friendship", "company_stats"]
+    assert read_table(bulk_db, friendship) == [(0, 1), (0, 2), (1, 0), (2, 0)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 13, 65536])
+def test_streamed_json_array_matches_full_read(chunk_size):
+    for path in ("tests/import_people_good_0.json", "tests/import_companies_good_0.json"):
+        assert list(iter_json_array(path, chunk_size)) == read_json_file(path)
+
+
+def test_streamed_bulk_import_raises_on_duplicate_people_across_chunks():
+    db = Database("./test_import_bulk.db")
+
+    with pytest.raises(DuplicateInstanceIdError):
+        import_local_data(db,
+            "tests/import_companies_good_0.json",
+            "tests/import_people_bad_1.json",
+            "tests/import_foods_good_0.json",
+            bulk=True, batch_size=1)
+
+
+def test_resolve_friendships_keeps_only_mutual_references():
+    friend_ids_for_person_id = {
+        -1: [0],
+        0: [-1, 1, 1, 2],
+        1: [0, 0],
+        2: [1]
+    }
+    assert resolve_friendships(friend_ids_for_person_id) == [(-1, 0), (0, -1), (0, 1), (1, 0)]
+
+
+def test_resolve_friendships_raises_on_unknown_friend():
+    with pytest.raises(UnknownReferenceError):
+        resolve_friendships({0: [1], 1: [7]})
+
+
+@pytest.fixture
+def data_files(tmpdir):
+    paths = []
+    for name in ("import_companies_good_0.json", "import_people_good_0.json", "import_foods_good_0.json"):
+        path = str(tmpdir.join(name))
+        shutil.copy("tests/" + name, path)
+        paths.append(path)
+    return paths
+
+
+def assert_same_tables(db, other_db):
+    for table in (Company.__table__, Person.__table__, Food.__table__, favourite_food_table, friendship, CompanyStats.__table__):
+        assert read_table(db, table) == read_table(other_db, table)
 
 
+def test_sync_reuses_database_when_data_unchanged(data_files):
+    assert sync_local_data(Database("./test_import_sync.db"), *data_files) == "imported"
 
+    db = Database("./test_import_sync.db", reset=False)
+    assert sync_local_data(db, *data_files) == "unchanged"
+    assert read_dataset_version(db) == 1
+
+    expected_db = Database("./test_import_bulk.db")
+    import_local_data(expected_db, *data_files, bulk=True)
+    assert_same_tables(db, expected_db)
+
+
+def test_sync_applies_row_differences(data_files):
+    sync_local_data(Database("./test_import_sync.db"), *data_files)
+
+    companies_path, people_path, foods_path = data_files
+    with open(people_path) as f:
+        people = json.load(f)
+
+    people[0]["age"] += 1                                 # update
+    people[1]["favouriteFood"] = ["apple"]                # replace favourites
+    people[1]["friends"] = [{"index": 2}]                 # drop friendship with 0
+    people[2]["friends"].append({"index": 1})             # befriend 1
+    new_person = dict(people[2], index=3, company_id=4, friends=[{"index": 0}], favouriteFood=["carrot"])
+    people.append(new_person)                             # insert
+    people[0]["friends"].append({"index": 3})
+
+    with open(people_path, 'w') as f:
+        json.dump(people, f)
+
+    db = Database("./test_import_sync.db", reset=False)
+    assert sync_local_data(db, *data_files) == "updated"
+    assert read_dataset_version(db) == 2
+
+    expected_db = Database("./test_import_bulk.db")
+    import_local_data(expected_db, *data_files, bulk=True)
+    assert_same_tables(db, expected_db)
+    assert read_table(db, friendship) == [(0, 2), (0, 3), (1, 2), (2, 0), (2, 1), (3, 0)]
+
+    # removing a person removes their favourites and friendships too
+    people[0]["friends"].pop()
+    with open(people_path, 'w') as f:
+        json.dump(people[:3], f)
+
+    assert sync_local_data(db, *data_files) == "updated"
+    expected_db = Database("./test_import_bulk.db")
+    import_local_data(expected_db, *data_files, bulk=True)
+    assert_same_tables(db, expected_db)
+
+
+@pytest.mark.parametrize("num_partitions", [1, 2, 3, 7, 50])
+def test_json_array_partitions_line_up(num_partitions):
+    path = "data/people.json"
+    elements = []
+    stop = None
+    for byte_start, byte_end in partition_byte_ranges(os.path.getsize(path), num_partitions):
+        first, next_stop, partition_elements, at_end = read_json_array_partition(path, byte_start, byte_end, is_person_record)
+        if first is None:
+            continue
+        assert stop is None or first == stop
+        stop = next_stop
+        elements.extend(partition_elements)
+
+    assert at_end
+    assert elements == read_json_file(path)
+
+
+@pytest.mark.parametrize("partition_size", [300, 1000, 1 << 20])
+def test_parallel_import_matches_bulk_import(data_files, partition_size):
+    companies_path, people_path, foods_path = data_files
+    with open(people_path) as f:
+        people = json.load(f)
+
+    # separators inside strings and nested objects aren't taken for record boundaries
+    people[1]["address"] = '"}, {"company_id": 1, "friends": []}, {'
+    people[2]["tags"] = [{"company_id": 2}, {"friends": []}]
+    with open(people_path, 'w') as f:
+        json.dump(people, f, indent=2)
+
+    bulk_db = Database("./test_import_bulk.db")
+    import_local_data(bulk_db, *data_files, bulk=True)
+
+    parallel_db = Database("./test_import_parallel.db")
+    timings = parallel_import_local_data(parallel_db, *data_files, workers=2, partition_size=partition_size)
+
+    assert_same_tables(parallel_db, bulk_db)
+    assert [t[0] for t in timings] == ["company", "food", "person", "favourites", "friendship", "company_stats"]
+
+
+def test_parallel_import_raises_on_duplicate_people_across_partitions():
+    with pytest.raises(DuplicateInstanceIdError):
+        parallel_import_local_data(Database("./test_import_parallel.db"),
+            "tests/import_companies_good_0.json",
+            "tests/import_people_bad_1.json",
+            "tests/import_foods_good_0.json",
+            workers=2, partition_size=500)
@@ -0,0 +1,78 @@
+import pytest
+
+from api.model import Company
+from api.database import Database, write_scope
+from api.endpoint import Endpoint
+from api.instrumentation import collect_query_stats
+from api.service import Service
+
+from tests.test_model import seed_database
+
+
+@pytest.fixture(scope="module")
+def service():
+    db = Database("./test_instrumentation.db", instrument=True)
+    seed_database(db)
+    with write_scope(db) as session:
+        session.add(Company(cid=2, name="Stark"))
+    return Service(db)
+
+
+@pytest.fixture
+def app(service):
+    return Endpoint(api_service=service, cache_size=0, debug_queries=True).get_application()
+
+
+def test_employees_single_query(service):
+    with collect_query_stats() as stats:
+        employees = service.get_employees_by_company_id(1)
+    assert sorted(p.pid for p in employees) == [2, 3, 4]
+    assert (stats.statements, stats.rows) == (1, 3)
+
+    with collect_query_stats() as stats:
+        assert service.get_employees_by_company_id(2) == []
+    assert (stats.statements, stats.rows) == (1, 1)
+
+
+def test_employees_page_single_query(service):
+    with collect_query_stats() as stats:
+        employees, next_after_pid = service.get_employees_page(1, None, 2)
+    assert [p.pid for p in employees] == [2, 3]
+    assert next_after_pid == 3
+    assert (stats.statements, stats.rows) == (1, 3)
+
+    with collect_query_stats() as stats:
+        assert service.get_employees_page(1, 4, 2) == ([], None)
+    assert stats.statements == 1
+
+
+def test_comparison_queries(service):
+    with collect_query_stats() as stats:
+        _, _, common = service.get_person_comparison(1, 4)
+    assert common == [2, 3]
+    # one row per person, one per common friend
+    assert (stats.statements, stats.rows) == (2, 4)
+
+
+def test_nothing_collected_outside_scope(service):
+    with collect_query_stats() as stats:
+        pass
+    service.get_person_by_id(1)
+    assert (stats.statements, stats.rows) == (0, 0)
+
+
+def test_uninstrumented_database_not_counted():
+    db = Database("./test_instrumentation_off.db")
+    seed_database(db)
+    with collect_query_stats() as stats:
+        Service(db).get_employees_by_company_id(1)
+    assert (stats.statements, stats.rows) == (0, 0)
+
+
+@pytest.mark.gen_test()
+def test_query_stats_header(http_server, http_client, base_url):
+    response = yield http_client.fetch(base_url + "/company/1/employee")
+    assert response.headers.get("X-Query-Stats").startswith("statements=1; rows=3; time_ms=")
+
+    response = yield http_client.fetch(base_url + "/person/1/compare?other_id=4")
+    assert response.headers.get("X-Query-Stats").startswith("statements=2; rows=4; time_ms=")
@@ -0,0 +1,91 @@
+import pytest
+
+from api.database import Database
+from api.endpoint import Endpoint
+from api.import_data import import_local_data
+from api.instrumentation import QueryStats
+from api.metrics import Histogram, Metrics, PROMETHEUS_CONTENT_TYPE, route_label
+from api.service import Service
+
+import tornado.httpclient
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = Database("./test_metrics.db", instrument=True)
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    return db
+
+
+@pytest.fixture
+def metrics():
+    return Metrics()
+
+
+@pytest.fixture
+def app(db, metrics):
+    return Endpoint(api_service=Service(db), cache_size=0, metrics=metrics).get_application()
+
+
+def parse_samples(text):
+    """ Map of sample name with labels to value, of Prometheus text format """
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        h.observe(value)
+
+    assert list(h.cumulative_counts()) == [("1", 2), ("5", 3), ("+Inf", 4)]
+    assert (h.count, h.sum) == (4, 14.5)
+
+
+def test_render():
+    metrics = Metrics()
+    stats = QueryStats()
+    stats.statements, stats.seconds = 2, 0.002
+    metrics.observe("/person/{id}", 200, 0.003, 100, stats)
+    metrics.observe("/person/{id}", 404, 0.0001, 10)
+
+    samples = parse_samples(metrics.render())
+    assert samples['paranuara_requests_total{route="/person/{id}",status="200"}'] == 1
+    assert samples['paranuara_requests_total{route="/person/{id}",status="404"}'] == 1
+    assert samples['paranuara_request_duration_seconds_bucket{route="/person/{id}",le="0.0005"}'] == 1
+    assert samples['paranuara_request_duration_seconds_bucket{route="/person/{id}",le="+Inf"}'] == 2
+    assert samples['paranuara_response_size_bytes_sum{route="/person/{id}"}'] == 110
+    assert samples['paranuara_db_duration_seconds_count{route="/person/{id}"}'] == 1
+    assert samples['paranuara_db_statements_total{route="/person/{id}"}'] == 2
+
+
+def test_route_label():
+    assert route_label(r"/company/([0-9]+)/employee") == "/company/{id}/employee"
+
+
+@pytest.mark.gen_test()
+def test_metrics_route(http_server, http_client, base_url, metrics):
+    person_bytes = 0
+    for path in ("/person/5", "/person/6"):
+        response = yield http_client.fetch(base_url + path)
+        person_bytes += len(response.body)
+    with pytest.raises(tornado.httpclient.HTTPError) as e:
+        yield http_client.fetch(base_url + "/person/100000")
+    person_bytes += len(e.value.response.body)
+    employee_response = yield http_client.fetch(base_url + "/company/5/employee")
+
+    response = yield http_client.fetch(base_url + "/metrics")
+    assert response.headers["Content-Type"] == PROMETHEUS_CONTENT_TYPE
+
+    samples = parse_samples(response.body.decode())
+    assert samples['paranuara_requests_total{route="/person/{id}",status="200"}'] == 2
+    assert samples['paranuara_requests_total{route="/person/{id}",status="404"}'] == 1
+    assert samples['paranuara_requests_total{route="/company/{id}/employee",status="200"}'] == 1
+    assert samples['paranuara_request_duration_seconds_count{route="/person/{id}"}'] == 3
+    assert samples['paranuara_db_statements_total{route="/person/{id}"}'] == 3
+    assert samples['paranuara_response_size_bytes_sum{route="/person/{id}"}'] == person_bytes
+    assert samples['paranuara_response_size_bytes_sum{route="/company/{id}/employee"}'] == len(employee_response.body)
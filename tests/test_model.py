@@ -1,6 +1,6 @@
 import pytest
 
-from api.model import Company, Person, Food
+from api.model import Company, Person, Food, FoodCategory, split_food_ids
 from api.database import Database, read_scope, write_scope
 from sqlalchemy.orm import joinedload # TODO: doesn't belong here - need to move this into `database`
 
@@ -69,3 +69,32 @@ def test_model_integrity(good_model_db):
     assert shanes_friends == bens_friends
     assert matts_favs == { "orange" , "capsicum"}
     assert kristians_favs == { "orange" }
+
+
+def test_favourite_foods_categorised_on_insert(good_model_db):
+    with read_scope(good_model_db) as session:
+        people = { p.pid: p for p in session.query(Person) }
+        foods = { f.id: f.category for f in session.query(Food) }
+
+    assert (people[2].fruit_ids, people[2].vegetable_ids) == (["orange"], ["capsicum"])
+    assert (people[3].fruit_ids, people[3].vegetable_ids) == (["orange"], [])
+    assert (people[1].fruit_ids, people[1].vegetable_ids) == ([], [])
+    assert foods == {"orange": FoodCategory.FRUIT, "capsicum": FoodCategory.VEGETABLE}
+
+
+def test_favourite_foods_categorised_on_update(good_model_db):
+    with write_scope(good_model_db) as session:
+        thor = session.query(Person).get(1)
+        thor.favourite_foods.append(session.query(Food).get("capsicum"))
+        ironman = session.query(Person).get(2)
+        ironman.favourite_foods.remove(session.query(Food).get("orange"))
+
+    with read_scope(good_model_db) as session:
+        people = { p.pid: p for p in session.query(Person) }
+    assert (people[1].fruit_ids, people[1].vegetable_ids) == ([], ["capsicum"])
+    assert (people[2].fruit_ids, people[2].vegetable_ids) == ([], ["capsicum"])
+
+
+def test_split_food_ids():
+    assert split_food_ids([("apple", "fruit"), ("celery", FoodCategory.VEGETABLE), ("chocolate", "snack"),
+                           ("banana", 1)]) == (["apple", "banana"], ["celery"])
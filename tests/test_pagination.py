@@ -0,0 +1,133 @@
+import pytest
+
+import api.endpoint
+from api.database import Database
+from api.endpoint import Endpoint
+from api.import_data import import_local_data
+from api.service import Service
+from api.snapshot import SnapshotService
+
+import tornado.gen
+import tornado.httpclient
+import tornado.tcpclient
+
+import json
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = Database("./test_pagination.db")
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    return db
+
+
+@pytest.fixture(params=["sql", "snapshot"])
+def service(request, db):
+    if request.param == "snapshot":
+        return SnapshotService.from_database(db)
+    return Service(db)
+
+
+@pytest.fixture
+def app(service):
+    return Endpoint(api_service=service).get_application()
+
+
+def test_pages_cover_all_employees(service):
+    expected = sorted(p.pid for p in service.get_employees_by_company_id(5))
+
+    pids = []
+    after_pid = None
+    while True:
+        page, after_pid = service.get_employees_page(5, after_pid, 5)
+        assert len(page) <= 5
+        pids.extend(p.pid for p in page)
+        if after_pid is None:
+            break
+
+    assert pids == expected
+
+
+@pytest.mark.gen_test()
+def test_company_employees_paginated(http_server, http_client, base_url, service):
+    expected = sorted(p.pid for p in service.get_employees_by_company_id(5))
+
+    pids = []
+    url = "/company/5/employee?limit=4"
+    while url:
+        response = yield http_client.fetch(base_url + url)
+        body_json = json.loads(response.body)
+        pids.extend(e["pid"] for e in body_json["employees"])
+        url = body_json["next"]
+
+    assert pids == expected
+
+
+@pytest.mark.gen_test()
+def test_company_employees_streamed(http_server, http_client, base_url, service):
+    expected = sorted(p.pid for p in service.get_employees_by_company_id(5))
+
+    response = yield http_client.fetch(base_url + "/company/5/employee?format=ndjson&after_pid={}".format(expected[2]))
+    assert response.headers.get("content-type") == "application/x-ndjson"
+
+    rows = [ json.loads(line) for line in response.body.decode().splitlines() ]
+    assert [r["pid"] for r in rows] == expected[3:]
+
+
+@pytest.mark.gen_test()
+def test_company_employees_stream_limited(http_server, http_client, base_url, service, monkeypatch):
+    # limits spanning several batches
+    monkeypatch.setattr(api.endpoint, "STREAM_BATCH_SIZE", 2)
+    expected = sorted(p.pid for p in service.get_employees_by_company_id(5))
+
+    response = yield http_client.fetch(base_url + "/company/5/employee?format=ndjson&limit=3&after_pid={}".format(expected[1]))
+    assert [ json.loads(line)["pid"] for line in response.body.decode().splitlines() ] == expected[2:5]
+
+    response = yield http_client.fetch(base_url + "/company/5/employee?format=ndjson&limit=1000")
+    assert [ json.loads(line)["pid"] for line in response.body.decode().splitlines() ] == expected
+
+
+@pytest.mark.gen_test()
+def test_company_employees_bad_page_parameters(http_server, http_client, base_url, service):
+    for query in ("limit=0", "limit=100000", "after_pid=abc"):
+        with pytest.raises(tornado.httpclient.HTTPError) as e:
+            yield http_client.fetch(base_url + "/company/5/employee?" + query)
+        assert e.value.code == 400
+
+
+@pytest.mark.gen_test()
+def test_company_employees_stream_unknown_company(http_server, http_client, base_url, service):
+    with pytest.raises(tornado.httpclient.HTTPError) as e:
+        yield http_client.fetch(base_url + "/company/101/employee?format=ndjson")
+    assert e.value.code == 404
+
+
+class EndlessPagesService(object):
+    """ A company whose employees never run out, counting the pages fetched """
+    def __init__(self, service):
+        self.service = service
+        self.pages = 0
+
+    def get_employees_page(self, cid, after_pid, limit):
+        self.pages += 1
+        employees, _ = self.service.get_employees_page(cid, None, limit)
+        return employees, employees[-1].pid
+
+
+@pytest.mark.gen_test(timeout=10)
+def test_company_employees_stream_stops_when_client_disconnects(http_server, http_port, service, caplog):
+    endless = EndlessPagesService(service)
+    endpoint = Endpoint(api_service=endless)
+    http_server.request_callback = endpoint.get_application()
+
+    stream = yield tornado.tcpclient.TCPClient().connect("127.0.0.1", http_port)
+    yield stream.write(b"GET /company/5/employee?format=ndjson HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    yield stream.read_until(b"\r\n\r\n")
+    stream.close()
+
+    # the handler stops paging once a flush finds the connection closed, without an error
+    pages = -1
+    while pages != endless.pages:
+        pages = endless.pages
+        yield tornado.gen.sleep(0.2)
+    assert not [ r for r in caplog.records if r.levelname == "ERROR" ]
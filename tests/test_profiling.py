@@ -0,0 +1,122 @@
+import pytest
+
+from api.database import Database
+from api.endpoint import Endpoint
+from api.import_data import import_local_data
+from api.profiling import Profiler, ProfilerBusyError, RequestProfiling, collapse_stack
+from api.service import Service
+
+import sys
+
+import tornado.gen
+import tornado.httpclient
+
+
+TOKEN = "secret"
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = Database("./test_profiling.db")
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    return db
+
+
+@pytest.fixture
+def app(db):
+    return Endpoint(api_service=Service(db), cache_size=0, admin_token=TOKEN).get_application()
+
+
+def profile_request(base_url, query, token=TOKEN):
+    return tornado.httpclient.HTTPRequest(base_url + "/admin/profile?" + query, method="POST", body="",
+                                          headers={"Authorization": "Bearer {}".format(token)})
+
+
+def test_profiler_counts_requests():
+    completed = []
+    profiler = Profiler("/person/{id}", max_requests=2, on_complete=lambda: completed.append(True))
+    profiler.start()
+    assert profiler.run(sum, [1, 2]) == 3
+    profiler.request_finished()
+    assert not completed
+    profiler.request_finished()
+    profiler.stop()
+
+    assert completed == [True]
+    assert profiler.calls == 1
+    assert "sum" in profiler.pstats_text()
+
+
+def test_only_one_capture_at_a_time():
+    profiling = RequestProfiling(["/person/{id}"])
+    profiler = Profiler("/person/{id}")
+    profiling.start(profiler)
+    with pytest.raises(ProfilerBusyError):
+        profiling.start(Profiler("/person/{id}"))
+
+    assert profiling.profiler_for("/person/{id}") is profiler
+    assert profiling.profiler_for("/company/{id}/employee") is None
+    assert profiling.stop() is profiler
+    assert profiling.profiler_for("/person/{id}") is None
+
+
+def test_collapse_stack():
+    stack = collapse_stack(sys._getframe())
+    assert stack.endswith("test_profiling.py:test_collapse_stack")
+
+
+def test_disabled_without_token(db):
+    app = Endpoint(api_service=Service(db), cache_size=0).get_application()
+    assert all(rule.matcher.regex.pattern != "/admin/profile$" for rule in app.default_router.rules[0].target.rules)
+
+
+@pytest.mark.gen_test()
+def test_requires_token(http_server, http_client, base_url):
+    for token in (None, "wrong"):
+        request = profile_request(base_url, "route=/person/{id}&requests=1", token)
+        if token is None:
+            del request.headers["Authorization"]
+        with pytest.raises(tornado.httpclient.HTTPError) as e:
+            yield http_client.fetch(request)
+        assert e.value.code == 403
+
+
+@pytest.mark.gen_test()
+def test_unknown_route_or_mode(http_server, http_client, base_url):
+    for query in ("route=/nowhere&requests=1", "route=/person/{id}&requests=1&mode=trace"):
+        with pytest.raises(tornado.httpclient.HTTPError) as e:
+            yield http_client.fetch(profile_request(base_url, query))
+        assert e.value.code == 400
+
+
+@pytest.mark.gen_test(timeout=30)
+def test_cprofile_capture(http_server, http_client, base_url):
+    capture = http_client.fetch(profile_request(base_url, "route=/person/{id}/compare&requests=3"))
+    yield tornado.gen.sleep(0.1)
+
+    # a second capture is refused while the first runs
+    with pytest.raises(tornado.httpclient.HTTPError) as e:
+        yield http_client.fetch(profile_request(base_url, "route=/person/{id}&requests=1"))
+    assert e.value.code == 409
+
+    yield [ http_client.fetch(base_url + "/person/{}/compare?other_id={}".format(i, i + 1)) for i in range(1, 4) ]
+    yield http_client.fetch(base_url + "/person/1")
+
+    response = yield capture
+    assert response.headers["X-Profile-Requests"] == "3"
+    assert response.headers["X-Profile-Calls"] == "3"
+    assert "get_person_comparison" in response.body.decode()
+
+
+@pytest.mark.gen_test(timeout=30)
+def test_sample_capture(http_server, http_client, base_url):
+    capture = http_client.fetch(profile_request(base_url, "route=/company/{id}/employee&seconds=1&mode=sample"))
+    yield tornado.gen.sleep(0.1)
+    for _ in range(20):
+        yield http_client.fetch(base_url + "/company/1/employee")
+
+    response = yield capture
+    assert response.headers["X-Profile-Requests"] == "20"
+    for line in response.body.decode().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
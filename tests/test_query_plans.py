@@ -0,0 +1,79 @@
+import pytest
+import re
+
+from api.database import Base, Database
+from api.import_data import materialize_company_stats
+from api.service import Service
+
+from sqlalchemy import event
+
+from tests.test_model import seed_database
+
+
+@pytest.fixture(scope="module")
+def service():
+    db = Database("./test_query_plans.db")
+    seed_database(db)
+    materialize_company_stats(db)
+    return Service(db)
+
+
+def captured_statements(engine, fn, *args):
+    """ Call `fn(*args)`, returning the (statement, parameters) it executed on `engine` """
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        fn(*args)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return statements
+
+
+def query_plan(engine, statement, parameters):
+    """ Return the details of each `EXPLAIN QUERY PLAN` step of a statement """
+    with engine.connect() as connection:
+        cursor = connection.connection.cursor()
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [ row[-1] for row in cursor.fetchall() ]
+
+
+def table_scans(engine, statement, parameters):
+    """
+    Return the `EXPLAIN QUERY PLAN` steps of a statement that scan a table
+    (or an alias of one, e.g. `favourites_1`) without using an index.
+    Scans of materialized subqueries are fine.
+    """
+    details = query_plan(engine, statement, parameters)
+    return [ d for d in details if d.startswith("SCAN ") and "USING" not in d and
+             re.sub(r"_\d+$", "", d.split()[1]) in Base.metadata.tables ]
+
+
+@pytest.mark.parametrize("method, args", [
+    ("get_employees_by_company_id", (1,)),
+    ("get_employees_page", (1, None, 2)),
+    ("get_employees_page", (1, 2, 2)),
+    ("get_company_stats", (1,)),
+    ("get_person_by_id", (2,)),
+    ("get_people_by_ids", ([1, 2, 3],)),
+    ("get_person_comparison", (1, 4)),
+    ("get_person_comparisons", ([(1, 4), (2, 3)],)),
+])
+def test_service_queries_use_indexes(service, method, args):
+    statements = captured_statements(service.db.engine, getattr(service, method), *args)
+    assert statements
+
+    for statement, parameters in statements:
+        assert table_scans(service.db.engine, statement, parameters) == [], statement
+
+
+def test_all_company_stats_is_a_single_ordered_scan(service):
+    # every row is read, so the scan is expected; it must follow the primary
+    # key rather than sort, and must not touch the employees
+    statements = captured_statements(service.db.engine, service.get_all_company_stats)
+    assert len(statements) == 1
+
+    statement, parameters = statements[0]
+    assert query_plan(service.db.engine, statement, parameters) == ["SCAN company_stats"]
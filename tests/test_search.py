@@ -0,0 +1,146 @@
+import pytest
+
+from api.database import Database, write_scope
+from api.endpoint import Endpoint
+from api.import_data import import_local_data
+from api.model import Person
+from api.search import PeopleIndex, PeopleQuery
+from api.service import Service
+from api.snapshot import Snapshot
+
+from tests.test_model import seed_database
+
+from array import array
+import json
+
+import tornado.httpclient
+
+
+QUERIES = [
+    PeopleQuery(),
+    PeopleQuery(age_min=30, age_max=40),
+    PeopleQuery(age_max=25, alive=True),
+    PeopleQuery(eye_color="brown", alive=True, age_min=30, age_max=40),
+    PeopleQuery(company_id=5, alive=False),
+    PeopleQuery(foods=("banana",)),
+    PeopleQuery(foods=("banana", "celery"), eye_color="blue"),
+    PeopleQuery(eye_color="brown", foods=("banana",)),
+    PeopleQuery(eye_color="violet"),
+    PeopleQuery(company_id=1000),
+    PeopleQuery(foods=("durian",)),
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = Database("./test_search.db")
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    return db
+
+
+@pytest.fixture(scope="module")
+def people(db):
+    snapshot = Snapshot.from_database(db)
+    return [ snapshot.person_record(i) for i in range(len(snapshot.pids)) ]
+
+
+@pytest.fixture(scope="module", params=["snapshot", "database"])
+def index(request, db):
+    if request.param == "snapshot":
+        return PeopleIndex.from_snapshot(Snapshot.from_database(db))
+    return PeopleIndex.from_database(db)
+
+
+def matching_ids(people, query):
+    """ Ids of the people matching `query`, by testing everyone """
+    return [ p.pid for p in people
+             if (query.age_min is None or p.age is not None and p.age >= query.age_min)
+             and (query.age_max is None or p.age is not None and p.age <= query.age_max)
+             and (query.eye_color is None or p.eye_color == query.eye_color)
+             and (query.alive is None or p.alive == query.alive)
+             and (query.company_id is None or p.company_id == query.company_id)
+             and all(food in p.fruit_ids + p.vegetable_ids for food in query.foods) ]
+
+
+def test_search_matches_scan(index, people):
+    for query in QUERIES:
+        assert index.search(query, limit=len(people)) == (matching_ids(people, query), None)
+
+
+def test_pages(index, people):
+    query = PeopleQuery(alive=True, age_min=30)
+    found, after_id = [], None
+    while True:
+        page, after_id = index.search(query, after_id, limit=7)
+        assert len(page) <= 7
+        found += page
+        if after_id is None:
+            break
+        assert after_id == page[-1]
+    assert found == matching_ids(people, query)
+
+
+def test_most_selective_filter_first(index):
+    filters = index.plan(PeopleQuery(alive=True, company_id=5, age_min=20))
+    assert [ f.index for f in filters ] == ["company_id", "alive", "age"]
+    assert filters[0].estimate == len(index.postings["company_id"][5])
+    assert filters == sorted(filters, key=lambda f: f.estimate)
+
+
+@pytest.mark.parametrize("source", ["snapshot", "database"])
+def test_unknown_age(source):
+    db = Database("./test_search_ages.db")
+    seed_database(db)
+    with write_scope(db) as session:
+        session.add(Person(pid=5, name="Groot", age=None, email="groot@gmail.com", alive=True, company_id=1))
+    snapshot = Snapshot.from_database(db)
+    people = [ snapshot.person_record(i) for i in range(len(snapshot.pids)) ]
+    index = PeopleIndex.from_snapshot(snapshot) if source == "snapshot" else PeopleIndex.from_database(db)
+
+    assert list(index.postings["age"]) == sorted(set(p.age for p in people if p.age is not None))
+    for query in (PeopleQuery(), PeopleQuery(alive=True), PeopleQuery(age_min=0),
+                  PeopleQuery(age_max=1000, company_id=1), PeopleQuery(age_min=0, alive=True)):
+        assert index.search(query) == (matching_ids(people, query), None)
+    assert 5 in index.search(PeopleQuery(alive=True))[0]
+    assert 5 not in index.search(PeopleQuery(age_min=0, alive=True))[0]
+
+
+def test_group_foods():
+    # person 1 likes food 0 twice, and food 2 as a vegetable
+    fruits = (array('q', [0, 1, 3, 3]), array('H', [1, 0, 0]))
+    vegetables = (array('q', [0, 0, 1, 1]), array('H', [2]))
+    postings = PeopleIndex.group_foods(3, 3, (fruits, vegetables))
+    assert { code: list(p) for code, p in postings.items() } == {0: [1], 1: [0], 2: [1]}
+
+
+@pytest.fixture
+def app(db):
+    return Endpoint(api_service=Service(db), people_index=PeopleIndex.from_database(db)).get_application()
+
+
+@pytest.mark.gen_test()
+def test_search_route(http_server, http_client, base_url, people):
+    response = yield http_client.fetch(base_url + "/person/search?eye_color=brown&alive=true&age_min=30&age_max=40&limit=5")
+    body = json.loads(response.body)
+    expected = matching_ids(people, PeopleQuery(eye_color="brown", alive=True, age_min=30, age_max=40))
+    assert [ p["id"] for p in body["people"] ] == expected[:5]
+    assert all(p["eye_color"] == "brown" and p["alive"] and 30 <= p["age"] <= 40 for p in body["people"])
+
+    found = [ p["id"] for p in body["people"] ]
+    while body["next"]:
+        response = yield http_client.fetch(base_url + body["next"])
+        body = json.loads(response.body)
+        found += [ p["id"] for p in body["people"] ]
+    assert found == expected
+
+    response = yield http_client.fetch(base_url + "/person/search?food=banana,strawberry&company_id=3")
+    assert [ p["id"] for p in json.loads(response.body)["people"] ] == \
+           matching_ids(people, PeopleQuery(foods=("banana", "strawberry"), company_id=3))
+
+
+@pytest.mark.gen_test()
+def test_search_bad_parameters(http_server, http_client, base_url):
+    for query in ("alive=yes", "age_min=thirty", "limit=0", "limit=100000"):
+        with pytest.raises(tornado.httpclient.HTTPError) as e:
+            yield http_client.fetch(base_url + "/person/search?" + query)
+        assert e.value.code == 400
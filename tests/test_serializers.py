@@ -0,0 +1,46 @@
+import json
+
+from api.serializers import _stdlib_dumps, dumps, serialize_comparison, serialize_employee, serialize_person
+from api.model import Person
+from api.snapshot import PersonRecord
+
+
+THOR = PersonRecord(1, "Thor", 65, "SYD", "thor@gmail.com", "+61459849686", "brown", True, 0, ["orange", "apple"], ["capsicum"])
+HULK = PersonRecord(4, "Hulk", 40, "BNE", "hulk@gmail.com", "+61480123456", "brown", True, 1, [], [])
+
+
+def test_serialize_person():
+    assert serialize_person(THOR) == {
+        "username": "thor@gmail.com",
+        "age": 65,
+        "fruits": ["orange", "apple"],
+        "vegetables": ["capsicum"]
+    }
+
+
+def test_serialize_person_without_foods():
+    # e.g. a person that hasn't been inserted yet
+    person = Person(pid=1, email="thor@gmail.com", age=65)
+    assert serialize_person(person) == {"username": "thor@gmail.com", "age": 65, "fruits": [], "vegetables": []}
+
+
+def test_serialize_comparison():
+    assert serialize_comparison(THOR, HULK, (2, 3)) == {
+        "this": {"id": 1, "name": "Thor", "age": 65, "address": "SYD", "phone": "+61459849686"},
+        "other": {"id": 4, "name": "Hulk", "age": 40, "address": "BNE", "phone": "+61480123456"},
+        "common_friend_ids": [2, 3]
+    }
+
+
+def test_dumps_round_trips():
+    response = {"employees": [ serialize_employee(p) for p in (THOR, HULK) ], "next": None, "name": "Zoë </script>"}
+    for encode in (dumps, _stdlib_dumps):
+        body = encode(response)
+        assert isinstance(body, bytes)
+        assert json.loads(body.decode("utf-8")) == response
+
+
+def test_dumps_escapes_closing_tags():
+    for encode in (dumps, _stdlib_dumps):
+        body = encode({"name": "</script>"})
+        assert b"</" not in body and b"<\\/script>" in body
@@ -0,0 +1,50 @@
+import pytest
+
+from api.model import Person
+from api.database import Database, write_scope
+from api.service import Service, UnknownInstanceError
+
+from tests.test_model import seed_database
+
+
+@pytest.fixture
+def service():
+    db = Database("./test_service.db")
+    seed_database(db)
+
+    # a friend of both Thor and Hulk who doesn't qualify as a common friend
+    with write_scope(db) as session:
+        thor = session.query(Person).filter_by(pid=1).first()
+        hulk = session.query(Person).filter_by(pid=4).first()
+        loki = Person(pid=5, name="Loki", age=1000, address="SYD", email="loki@gmail.com", phone="+61400000000", eye_color="green", alive=True)
+        loki.company_id = 0
+        thor.befriend(loki)
+        hulk.befriend(loki)
+
+    return Service(db)
+
+
+def test_common_friends(service):
+    this_person, other_person, common = service.get_person_comparison(2, 3)
+
+    assert this_person.pid == 2
+    assert other_person.pid == 3
+    assert list(common) == [1, 4]
+
+
+def test_common_friends_excludes_non_brown_eyed(service):
+    # Loki is a friend of both but doesn't have brown eyes
+    _, _, common = service.get_person_comparison(1, 4)
+    assert list(common) == [2, 3]
+
+
+def test_common_friends_with_self(service):
+    _, _, common = service.get_person_comparison(2, 2)
+    assert list(common) == [1, 3, 4]
+
+
+def test_comparison_raises_on_unknown_person(service):
+    with pytest.raises(UnknownInstanceError):
+        service.get_person_comparison(1, 1001)
+    with pytest.raises(UnknownInstanceError):
+        service.get_person_comparison(1001, 1)
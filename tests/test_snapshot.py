@@ -0,0 +1,98 @@
+import pytest
+
+from api.database import Database, write_scope
+from api.endpoint import Endpoint
+from api.service import Service, UnknownInstanceError
+from api.snapshot import Postings, SnapshotService
+from api.import_data import import_local_data
+from api.model import Person
+from api.serializers import serialize_person
+
+from tests.test_model import seed_database
+
+import json
+
+
+@pytest.fixture(scope="module")
+def services():
+    db = Database("./test_snapshot.db")
+    import_local_data(db, "data/companies.json", "data/people.json", "data/foods.json", bulk=True)
+    return Service(db), SnapshotService.from_database(db)
+
+
+def test_postings():
+    postings = Postings(*Postings.encode({5: [3, 1], 2: [], 9: [7]}))
+    assert list(postings) == [2, 5, 9]
+    assert list(postings[5]) == [3, 1] and list(postings[2]) == []
+    assert postings.get(4) is None and 9 in postings
+
+
+def test_postings_group():
+    postings = Postings.group(bytearray([1, 0, 1, 1, 0]))
+    assert list(postings) == [0, 1]
+    assert list(postings[0]) == [1, 4] and list(postings[1]) == [0, 2, 3]
+
+
+def person_fields(p):
+    return (p.pid, p.name, p.age, p.address, p.email, p.phone, p.eye_color, p.alive, p.company_id,
+            p.fruit_ids, p.vegetable_ids)
+
+
+def test_employees_match_database(services):
+    service, snapshot = services
+    for cid in (1, 5, 100):
+        assert [ (p.pid, p.email) for p in snapshot.get_employees_by_company_id(cid) ] == \
+               [ (p.pid, p.email) for p in service.get_employees_by_company_id(cid) ]
+
+    with pytest.raises(UnknownInstanceError):
+        snapshot.get_employees_by_company_id(101)
+
+
+def test_person_matches_database(services):
+    service, snapshot = services
+    for pid in (0, 5, 999):
+        assert person_fields(snapshot.get_person_by_id(pid)) == person_fields(service.get_person_by_id(pid))
+
+    assert snapshot.get_person_by_id(1000) is None
+
+
+def test_unknown_age_matches_database():
+    db = Database("./test_snapshot_ages.db")
+    seed_database(db)
+    with write_scope(db) as session:
+        session.add(Person(pid=5, name="Groot", age=None, email="groot@gmail.com", alive=True, company_id=1))
+    service, snapshot = Service(db), SnapshotService.from_database(db)
+
+    for pid in range(1, 6):
+        assert person_fields(snapshot.get_person_by_id(pid)) == person_fields(service.get_person_by_id(pid))
+        assert serialize_person(snapshot.get_person_by_id(pid)) == serialize_person(service.get_person_by_id(pid))
+    assert snapshot.get_person_by_id(5).age is None
+    assert snapshot.get_person_comparison(5, 2)[0].age is None
+
+
+def test_comparison_matches_database(services):
+    service, snapshot = services
+    for this_id, other_id in ((6, 7), (0, 1), (15, 15), (2, 999)):
+        this_person, other_person, common = snapshot.get_person_comparison(this_id, other_id)
+        expected = service.get_person_comparison(this_id, other_id)
+        assert (this_person.pid, other_person.pid, list(common)) == (expected[0].pid, expected[1].pid, list(expected[2]))
+
+    with pytest.raises(UnknownInstanceError):
+        snapshot.get_person_comparison(6, 1000)
+
+
+@pytest.fixture
+def app(services):
+    return Endpoint(api_service=services[1]).get_application()
+
+
+@pytest.mark.gen_test()
+def test_endpoint_served_from_snapshot(http_server, http_client, base_url):
+    response = yield http_client.fetch(base_url + "/person/6/compare?other_id=7")
+    body_json = json.loads(response.body)
+    assert body_json["this"]["name"] == "Cote Booth"
+    assert body_json["common_friend_ids"] == [13, 16]
+
+    response = yield http_client.fetch(base_url + "/person/5")
+    body_json = json.loads(response.body)
+    assert body_json == {"username": "gracekelly@earthmark.com", "age": 24, "fruits": ["strawberry"], "vegetables": ["cucumber", "beetroot", "carrot"]}